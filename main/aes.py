@@ -19,7 +19,8 @@
 
 import base64
 
-from Crypto.Cipher import AES
+import backend
+import profiling
 
 
 def gen_aes_key(size):
@@ -92,10 +93,12 @@ def aes_encrypt(blocksize, iv, key, plaintext):
         raise AttributeError("The encryption key must be at "
                              "least 256 bits long.")
 
-    plaintext = pad(blocksize, plaintext)
-    cipher = AES.new(key, AES.MODE_CBC, iv)
-    ciphertext = base64.b64encode(
-        iv + cipher.encrypt(plaintext))
+    with profiling.stage('pad'):
+        plaintext = pad(blocksize, plaintext)
+    with profiling.stage('encrypt'):
+        ciphertext = backend.get_backend().aes_cbc_encrypt(key, iv, plaintext)
+    with profiling.stage('base64'):
+        ciphertext = base64.b64encode(iv + ciphertext)
 
     return ciphertext
 
@@ -116,15 +119,64 @@ def aes_decrypt(blocksize, key, ciphertext):
     :return: A string, the plaintext after decryption and removing the padding.
     """
 
-    ciphertext = base64.b64decode(ciphertext)
+    with profiling.stage('base64'):
+        ciphertext = base64.b64decode(ciphertext)
     iv = ciphertext[:blocksize]
-    cipher = AES.new(key, AES.MODE_CBC, iv)
-    paddedplaintext = cipher.decrypt(ciphertext[blocksize:])
-    plaintext = unpad(paddedplaintext)
+    with profiling.stage('decrypt'):
+        paddedplaintext = backend.get_backend().aes_cbc_decrypt(
+            key, iv, ciphertext[blocksize:])
+    with profiling.stage('unpad'):
+        plaintext = unpad(paddedplaintext)
 
     return plaintext
 
 
+def aes_ctr_encrypt(key, nonce, block, plaintext):
+    """Encrypt the plaintext with AES in CTR mode.
+
+    This function encrypt the plaintext using AES algorithm in CTR mode, the
+    counter block being the nonce followed by a 64 bits block index. Since
+    the keystream only depends on the block index, any block aligned part of
+    a payload can be encrypted or decrypted independently.
+
+    :parameter:
+     key : string
+        The symmetric key used to perform AES encryption.
+     nonce : string
+        The 64 bits nonce of the counter block.
+     block : int
+        The index of the first block of `plaintext` in the payload.
+     plaintext : string
+        Plaintext to encrypt.
+
+    :return: A string, the raw ciphertext.
+    """
+    if len(key) < 32:
+        raise AttributeError("The encryption key must be at "
+                             "least 256 bits long.")
+
+    return backend.get_backend().aes_ctr(key, nonce, block, plaintext)
+
+
+def aes_ctr_decrypt(key, nonce, block, ciphertext):
+    """Decrypt the ciphertext with AES in CTR mode.
+
+    :parameter:
+     key : string
+        The symmetric key used to perform AES decryption.
+     nonce : string
+        The 64 bits nonce of the counter block.
+     block : int
+        The index of the first block of `ciphertext` in the payload.
+     ciphertext : string
+        Raw ciphertext to decrypt.
+
+    :return: A string, the plaintext.
+    """
+
+    return aes_ctr_encrypt(key, nonce, block, ciphertext)
+
+
 def pad(blocksize, data):
     """Adds PKCS#7 padding.
 
@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2016 Hakan Kuesne && Mathieu Devaud
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" This module provides the cryptographic backends.
+
+The aes and rsa modules perform their operations with the selected
+backend. Both backends use the same parameters (AES-CBC and AES-CTR with a
+64 bits nonce followed by a 64 bits counter, RSA-OAEP with SHA1, RSA-PSS
+with SHA256 and a 32 bytes salt), so a container locked with one of them is
+unlocked with the other.
+
+The elliptic curve operations use Ed25519 for the signatures and X25519 for
+the key agreements.
+"""
+
+
+import hashlib
+import struct
+
+# DER prefix of the SubjectPublicKeyInfo of a raw X25519 public key
+X25519_SPKI_PREFIX = b'\x30\x2a\x30\x05\x06\x03\x2b\x65\x6e\x03\x21\x00'
+
+
+class PyCryptoBackend(object):
+    """Backend based on pycrypto or pycryptodome."""
+
+    name = 'pycrypto'
+
+    def __init__(self):
+        from Crypto.Cipher import AES, PKCS1_OAEP
+        from Crypto.Hash import SHA256
+        from Crypto.PublicKey import RSA
+        from Crypto.Signature import PKCS1_PSS
+        from Crypto.Util import Counter
+
+        self.AES = AES
+        self.PKCS1_OAEP = PKCS1_OAEP
+        self.SHA256 = SHA256
+        self.RSA = RSA
+        self.PKCS1_PSS = PKCS1_PSS
+        self.Counter = Counter
+
+    def aes_cbc_encrypt(self, key, iv, data):
+        return self.AES.new(key, self.AES.MODE_CBC, iv).encrypt(data)
+
+    def aes_cbc_decrypt(self, key, iv, data):
+        return self.AES.new(key, self.AES.MODE_CBC, iv).decrypt(data)
+
+    def aes_ctr(self, key, nonce, block, data):
+        counter = self.Counter.new(64, prefix=nonce, initial_value=block)
+        return self.AES.new(key, self.AES.MODE_CTR,
+                            counter=counter).encrypt(data)
+
+    def rsa_generate(self, bits):
+        return self.RSA.generate(bits, e=65537)
+
+    def rsa_import(self, pem):
+        return self.RSA.importKey(pem)
+
+    def rsa_public(self, key):
+        return key.publickey()
+
+    def rsa_export(self, key):
+        return key.exportKey('PEM')
+
+    def rsa_oaep_encrypt(self, pub_key, plaintext):
+        return self.PKCS1_OAEP.new(pub_key).encrypt(plaintext)
+
+    def rsa_oaep_decrypt(self, priv_key, ciphertext):
+        return self.PKCS1_OAEP.new(priv_key).decrypt(ciphertext)
+
+    def rsa_pss_sign(self, priv_key, payload):
+        return self.PKCS1_PSS.new(priv_key).sign(self.SHA256.new(payload))
+
+    def rsa_pss_verify(self, pub_key, signature, payload):
+        return self.rsa_pss_verify_hash(pub_key, signature,
+                                        self.SHA256.new(payload))
+
+    def sha256(self):
+        return self.SHA256.new()
+
+    def rsa_pss_verify_hash(self, pub_key, signature, digest):
+        try:
+            return bool(self.PKCS1_PSS.new(pub_key).verify(digest, signature))
+        except (ValueError, TypeError):
+            return False
+
+    def _ecc(self):
+        try:
+            from Crypto.PublicKey import ECC
+        except ImportError:
+            raise AttributeError("Elliptic curves need pycryptodome or "
+                                 "the openssl backend.")
+        return ECC
+
+    def ec_generate(self, curve):
+        return self._ecc().generate(
+            curve={'ed25519': 'ed25519', 'x25519': 'curve25519'}[curve])
+
+    def ec_import(self, pem):
+        return self._ecc().import_key(pem)
+
+    def ec_curve(self, key):
+        return {'Ed25519': 'ed25519', 'Curve25519': 'x25519'}.get(key.curve)
+
+    def ec_public(self, key):
+        return key.public_key()
+
+    def ec_export(self, key):
+        return key.export_key(format='PEM')
+
+    def x25519_raw(self, pub_key):
+        return bytes(pub_key.export_key(format='raw'))
+
+    def x25519_from_raw(self, raw):
+        return self._ecc().import_key(X25519_SPKI_PREFIX + raw)
+
+    def x25519_exchange(self, priv_key, pub_key):
+        from Crypto.Protocol.DH import key_agreement
+        return bytes(key_agreement(static_priv=priv_key, static_pub=pub_key,
+                                   kdf=lambda secret: secret))
+
+    def ed25519_sign(self, priv_key, payload):
+        from Crypto.Signature import eddsa
+        return eddsa.new(priv_key, 'rfc8032').sign(payload)
+
+    def ed25519_verify(self, pub_key, signature, payload):
+        from Crypto.Signature import eddsa
+        try:
+            eddsa.new(pub_key, 'rfc8032').verify(payload, signature)
+        except (ValueError, TypeError):
+            return False
+        return True
+
+
+class OpenSSLBackend(object):
+    """Backend based on OpenSSL through the cryptography library.
+
+    AES uses the AES-NI instructions of the CPU when they are available.
+    """
+
+    name = 'openssl'
+
+    def __init__(self):
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.backends import default_backend
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import (
+            ed25519, padding, rsa, utils, x25519)
+        from cryptography.hazmat.primitives.ciphers import (
+            Cipher, algorithms, modes)
+
+        self.InvalidSignature = InvalidSignature
+        self.default = default_backend()
+        self.hashes = hashes
+        self.serialization = serialization
+        self.padding = padding
+        self.rsa = rsa
+        self.utils = utils
+        self.ed25519 = ed25519
+        self.x25519 = x25519
+        self.Cipher = Cipher
+        self.algorithms = algorithms
+        self.modes = modes
+
+        self.oaep = padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA1()),
+                                 algorithm=hashes.SHA1(), label=None)
+        self.pss = padding.PSS(mgf=padding.MGF1(hashes.SHA256()),
+                               salt_length=32)
+
+    def _crypt(self, mode, key, data, encrypt):
+        cipher = self.Cipher(self.algorithms.AES(key), mode,
+                             backend=self.default)
+        context = cipher.encryptor() if encrypt else cipher.decryptor()
+        return context.update(data) + context.finalize()
+
+    def aes_cbc_encrypt(self, key, iv, data):
+        return self._crypt(self.modes.CBC(iv), key, data, True)
+
+    def aes_cbc_decrypt(self, key, iv, data):
+        return self._crypt(self.modes.CBC(iv), key, data, False)
+
+    def aes_ctr(self, key, nonce, block, data):
+        counter = nonce + struct.pack('>Q', block)
+        return self._crypt(self.modes.CTR(counter), key, data, True)
+
+    def rsa_generate(self, bits):
+        return self.rsa.generate_private_key(65537, bits, self.default)
+
+    def rsa_import(self, pem):
+        if b'PRIVATE KEY' in pem:
+            return self.serialization.load_pem_private_key(
+                pem, None, self.default)
+        return self.serialization.load_pem_public_key(pem, self.default)
+
+    def rsa_public(self, key):
+        return key.public_key()
+
+    def rsa_export(self, key):
+        if hasattr(key, 'private_bytes'):
+            return key.private_bytes(
+                self.serialization.Encoding.PEM,
+                self.serialization.PrivateFormat.TraditionalOpenSSL,
+                self.serialization.NoEncryption())
+        return key.public_bytes(
+            self.serialization.Encoding.PEM,
+            self.serialization.PublicFormat.SubjectPublicKeyInfo)
+
+    def rsa_oaep_encrypt(self, pub_key, plaintext):
+        return pub_key.encrypt(plaintext, self.oaep)
+
+    def rsa_oaep_decrypt(self, priv_key, ciphertext):
+        return priv_key.decrypt(ciphertext, self.oaep)
+
+    def rsa_pss_sign(self, priv_key, payload):
+        return priv_key.sign(payload, self.pss, self.hashes.SHA256())
+
+    def rsa_pss_verify(self, pub_key, signature, payload):
+        try:
+            pub_key.verify(signature, payload, self.pss, self.hashes.SHA256())
+        except (self.InvalidSignature, ValueError, TypeError):
+            return False
+        return True
+
+    def sha256(self):
+        return hashlib.sha256()
+
+    def rsa_pss_verify_hash(self, pub_key, signature, digest):
+        try:
+            pub_key.verify(signature, digest.digest(), self.pss,
+                           self.utils.Prehashed(self.hashes.SHA256()))
+        except (self.InvalidSignature, ValueError, TypeError):
+            return False
+        return True
+
+    def ec_generate(self, curve):
+        if curve == 'ed25519':
+            return self.ed25519.Ed25519PrivateKey.generate()
+        return self.x25519.X25519PrivateKey.generate()
+
+    def ec_import(self, pem):
+        return self.rsa_import(pem)
+
+    def ec_curve(self, key):
+        if isinstance(key, (self.ed25519.Ed25519PrivateKey,
+                            self.ed25519.Ed25519PublicKey)):
+            return 'ed25519'
+        if isinstance(key, (self.x25519.X25519PrivateKey,
+                            self.x25519.X25519PublicKey)):
+            return 'x25519'
+        return None
+
+    def ec_public(self, key):
+        return key.public_key()
+
+    def ec_export(self, key):
+        if hasattr(key, 'private_bytes'):
+            return key.private_bytes(
+                self.serialization.Encoding.PEM,
+                self.serialization.PrivateFormat.PKCS8,
+                self.serialization.NoEncryption())
+        return self.rsa_export(key)
+
+    def x25519_raw(self, pub_key):
+        return pub_key.public_bytes(self.serialization.Encoding.Raw,
+                                    self.serialization.PublicFormat.Raw)
+
+    def x25519_from_raw(self, raw):
+        return self.x25519.X25519PublicKey.from_public_bytes(raw)
+
+    def x25519_exchange(self, priv_key, pub_key):
+        return priv_key.exchange(pub_key)
+
+    def ed25519_sign(self, priv_key, payload):
+        return priv_key.sign(payload)
+
+    def ed25519_verify(self, pub_key, signature, payload):
+        try:
+            pub_key.verify(signature, payload)
+        except (self.InvalidSignature, ValueError, TypeError):
+            return False
+        return True
+
+
+# Backends by name, in order of preference for "auto"
+BACKENDS = [('openssl', OpenSSLBackend), ('pycrypto', PyCryptoBackend)]
+
+_current = None
+
+
+def select_backend(name='auto'):
+    """Select the backend used by the aes and rsa modules.
+
+    :parameter:
+     name : string
+        "openssl", "pycrypto" or "auto" to use the fastest one installed.
+
+    :raise AttributeError:
+            If `name` is not a known backend.
+    :raise ImportError:
+            If the library of the backend is not installed.
+
+    :return: The backend selected.
+    """
+
+    global _current
+
+    names = [backend_name for backend_name, _ in BACKENDS]
+    if name != 'auto' and name not in names:
+        raise AttributeError("You must provide a valid backend name.")
+
+    for backend_name, backend_class in BACKENDS:
+        if name in ('auto', backend_name):
+            try:
+                _current = backend_class()
+                return _current
+            except ImportError:
+                if name != 'auto':
+                    raise
+
+    raise ImportError("Neither cryptography nor pycrypto is installed.")
+
+
+def get_backend():
+    """Return the selected backend, selecting one automatically if needed."""
+
+    if _current is None:
+        select_backend()
+    return _current
+
+
+__author__ = 'Hakan Kuesne and Mathieu Devaud'
+__since__ = '2016-05-01'
+__date__ = '2016-05-16'
+__version__ = '1.0'
+__email__ = 'hakan@kusne.ch;mathieu.devaud@hefr.ch'
@@ -0,0 +1,672 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2016 Hakan Kuesne && Mathieu Devaud
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" This module provides the chunked container format.
+
+A chunked container is laid out as follows :
+
+    preamble   magic, header length, signature length, data offset
+    header     JSON document describing the container, including the
+               manifest of the files encrypted with AES-256-CTR
+    signature  RSA-PSS or Ed25519 signature of the header
+    padding    zeros up to the data offset (multiple of 4096), with at
+               least 2560 bytes to rekey the container
+    chunks     AES-256-CTR ciphertext followed by an HMAC-SHA256 tag
+    trailer    digests of the chunks in a Merkle container, then a
+               statement binding the digests of the header and of the
+               chunks, its signature, their lengths and a magic
+
+The chunks are bound to the trailer by their SHA256, SHA-512 or BLAKE2b
+digest, as recorded in the header, or by the root of a Merkle tree. SHA-512
+and BLAKE2b are faster than SHA256 on 64-bit CPUs without SHA extensions.
+
+The padding up to the data offset leaves room to rewrite the header in
+place when the session keys are wrapped for new keys, the chunks being left
+untouched.
+
+Every chunk tag covers the nonce, the chunk sequence number, a final flag
+and the ciphertext, so that a corrupted, reordered or truncated chunk is
+detected as soon as it is read. The signed statement of the trailer lets
+anyone holding the public key check the whole container without
+decrypting it.
+"""
+
+
+import base64
+import collections
+import hashlib
+import hmac
+import io
+import json
+import os
+import struct
+
+import aes
+import merkle
+
+MAGIC = b'LKD2'
+VERSION = 2
+CHUNK_SIZE = 1024 * 1024
+NONCE_SIZE = 8
+TAG_SIZE = 32
+ALIGNMENT = 4096
+# Room left in the header for the session keys wrapped for a larger key and
+# its signature, from Ed25519 and X25519 up to RSA-8192
+HEADER_RESERVE = 2560
+# Digests of all the chunks that can be signed in the trailer
+DIGESTS = ('sha256', 'sha512', 'blake2b')
+
+# magic, header length, signature length, data offset
+PREAMBLE = struct.Struct('>4sIII')
+# sequence number, final flag
+CHUNK_INFO = struct.Struct('>QB')
+# statement length, signature length, magic
+TRAILER = struct.Struct('>II4s')
+TRAILER_MAGIC = b'LKDT'
+
+
+class CorruptedChunkError(Exception):
+    """Raised when a chunk fails its authentication."""
+
+    def __init__(self, seq, offset):
+        Exception.__init__(self, "chunk %d at offset %d is corrupted"
+                           % (seq, offset))
+        self.seq = seq
+        self.offset = offset
+
+
+def new_header(wrapped_key, nonce, payload_size, chunk_size=CHUNK_SIZE,
+               kem='RSA-OAEP', sign='RSA-PSS-SHA256', integrity='sha256',
+               payload='tar'):
+    """Create a container header.
+
+    :parameter:
+     wrapped_key : string
+        The session keys encrypted with `kem`, in base64.
+     nonce : string
+        The random CTR nonce of the container.
+     payload_size : int
+        The size in bytes of the plaintext payload.
+     chunk_size : int
+        The size in bytes of the plaintext of a chunk.
+     kem : string
+        The algorithm used to encrypt the session keys.
+     sign : string
+        The algorithm used to sign the header and the trailer.
+     integrity : string
+        One of `DIGESTS` to sign that digest of all the chunks, or "merkle"
+        to sign the root of a Merkle tree whose leaves are the chunks.
+     payload : string
+        The format of the plaintext payload, "tar" or "packed".
+
+    :raise AttributeError:
+            If `chunk_size` is not a positive multiple of the AES block size
+            or `integrity` is unknown.
+
+    :return: A dict, the header of the container.
+    """
+
+    if chunk_size <= 0 or chunk_size % 16:
+        raise AttributeError("The chunk size must be a positive multiple "
+                             "of 16 bytes.")
+    if integrity != 'merkle' and integrity not in DIGESTS:
+        raise AttributeError("Unknown integrity %s." % integrity)
+
+    return {'version': VERSION,
+            'cipher': 'AES-256-CTR',
+            'mac': 'HMAC-SHA256',
+            'kem': kem,
+            'sign': sign,
+            'integrity': integrity,
+            'payload': payload,
+            'key': wrapped_key,
+            'nonce': base64.b64encode(nonce),
+            'chunk_size': chunk_size,
+            'payload_size': payload_size}
+
+
+def seal_manifest(header, keys, manifest):
+    """Encrypt the manifest of the files in the header.
+
+    The manifest is encrypted with its own nonce, so that its keystream
+    never overlaps the one of the chunks, and is authenticated by the
+    signature of the header.
+
+    :parameter:
+     header : dict
+        The header of the container.
+     keys : tuple
+        The AES key and the HMAC key of the container.
+     manifest : list
+        The entries describing the files of the payload.
+    """
+
+    nonce = aes.gen_iv(NONCE_SIZE)
+    header['manifest_nonce'] = base64.b64encode(nonce)
+    header['manifest'] = base64.b64encode(aes.aes_ctr_encrypt(
+        keys[0], nonce, 0, json.dumps(manifest, sort_keys=True)))
+
+
+def open_manifest(header, keys):
+    """Decrypt the manifest of the files from the header.
+
+    :return: A list, the entries describing the files of the payload, or
+    None if the container has no manifest.
+    """
+
+    if 'manifest' not in header:
+        return None
+    nonce = base64.b64decode(header['manifest_nonce'])
+
+    return json.loads(aes.aes_ctr_decrypt(
+        keys[0], nonce, 0, base64.b64decode(header['manifest'])))
+
+
+def encode_header(header):
+    """Serialize a header in a canonical form, ready to be signed."""
+
+    return json.dumps(header, sort_keys=True, separators=(',', ':'))
+
+
+def write_header(out, header_bytes, signature, data_offset=None):
+    """Write the preamble, the header and its signature.
+
+    :parameter:
+     out : file
+        The container opened in binary write mode.
+     header_bytes : string
+        The encoded header.
+     signature : string
+        The signature of `header_bytes`.
+     data_offset : int
+        The offset of the first chunk of a container whose header is
+        rewritten in place. By default the next multiple of 4096 after the
+        header and `HEADER_RESERVE` bytes, so that the header of any key
+        fits when the container is rekeyed.
+
+    :raise ValueError:
+            If the header and its signature do not fit before
+            `data_offset`.
+
+    :return: An int, the offset of the first chunk.
+    """
+
+    used = PREAMBLE.size + len(header_bytes) + len(signature)
+    if data_offset is None:
+        data_offset = -(-(used + HEADER_RESERVE) // ALIGNMENT) * ALIGNMENT
+    elif used > data_offset:
+        raise ValueError("The header does not fit before the first chunk.")
+
+    out.write(PREAMBLE.pack(MAGIC, len(header_bytes), len(signature),
+                            data_offset))
+    out.write(header_bytes)
+    out.write(signature)
+    out.write(b'\0' * (data_offset - used))
+
+    return data_offset
+
+
+def read_header(f):
+    """Read the header of a container.
+
+    :parameter:
+     f : file
+        The container opened in binary read mode.
+
+    :raise ValueError:
+            If `f` is not a chunked container.
+
+    :return: A tuple (header, header_bytes, signature, data_offset).
+    """
+
+    f.seek(0)
+    preamble = f.read(PREAMBLE.size)
+    if len(preamble) != PREAMBLE.size:
+        raise ValueError("This file is not a chunked container.")
+    magic, header_len, signature_len, data_offset = PREAMBLE.unpack(preamble)
+    if magic != MAGIC:
+        raise ValueError("This file is not a chunked container.")
+
+    header_bytes = f.read(header_len)
+    signature = f.read(signature_len)
+    header = json.loads(header_bytes)
+    if header.get('version') != VERSION:
+        raise ValueError("Unsupported container version.")
+
+    return header, header_bytes, signature, data_offset
+
+
+def volume_path(base, index):
+    """Return the path of the volume `index` of a multi-volume container."""
+
+    return '%s.%03d.lkd' % (base, index + 1)
+
+
+def volume_base(path, header):
+    """Return the base path of the multi-volume container of a volume.
+
+    :raise ValueError:
+            If the name of `path` does not match its volume index.
+    """
+
+    suffix = volume_path('', header['volume']['index'])
+    if not path.endswith(suffix):
+        raise ValueError("The volume %s has been renamed." % path)
+
+    return path[:-len(suffix)]
+
+
+def is_container(path):
+    """Tell if `path` is a chunked container rather than a tar archive."""
+
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def chunk_count(header):
+    """Return the number of chunks of the container."""
+
+    return max(1, -(-header['payload_size'] // header['chunk_size']))
+
+
+def chunk_length(header, seq):
+    """Return the plaintext length of the chunk `seq`."""
+
+    if seq < chunk_count(header) - 1:
+        return header['chunk_size']
+    return header['payload_size'] - seq * header['chunk_size']
+
+
+def chunk_offset(header, data_offset, seq):
+    """Return the offset of the chunk `seq` in the container."""
+
+    return data_offset + seq * (header['chunk_size'] + TAG_SIZE)
+
+
+def payload_end(header, data_offset):
+    """Return the offset of the end of the last chunk in the container."""
+
+    return data_offset + header['payload_size'] + \
+        chunk_count(header) * TAG_SIZE
+
+
+def record_ranges(header, data_offset, count=None):
+    """Return the (offset, length) of the first `count` chunks."""
+
+    if count is None:
+        count = chunk_count(header)
+
+    return [(chunk_offset(header, data_offset, seq),
+             chunk_length(header, seq) + TAG_SIZE) for seq in range(count)]
+
+
+class _OpenSSLBlake2b(object):
+    """A BLAKE2b-512 hash object of the cryptography library, for Python
+    versions whose hashlib has no BLAKE2."""
+
+    def __init__(self):
+        from cryptography.hazmat.backends import default_backend
+        from cryptography.hazmat.primitives import hashes
+        self.hash = hashes.Hash(hashes.BLAKE2b(64), default_backend())
+
+    def update(self, data):
+        self.hash.update(data)
+
+    def digest(self):
+        return self.hash.copy().finalize()
+
+    def hexdigest(self):
+        return self.digest().encode('hex')
+
+
+def new_digest(name):
+    """Return an empty hash object of the digest of all the chunks.
+
+    BLAKE2b comes from hashlib where available, else from the cryptography
+    library.
+
+    :parameter:
+     name : string
+        One of `DIGESTS`.
+
+    :raise AttributeError:
+            If the digest is unknown or not available.
+
+    :return: A hash object, with the update and hexdigest methods.
+    """
+
+    if name not in DIGESTS:
+        raise AttributeError("Unknown digest %s." % name)
+    if name == 'blake2b' and not hasattr(hashlib, 'blake2b'):
+        try:
+            return _OpenSSLBlake2b()
+        except ImportError:
+            raise AttributeError("BLAKE2b needs Python 3.6 or the "
+                                 "cryptography library.")
+
+    return hashlib.new(name)
+
+
+def new_statement(header_bytes, payload_digest=None, leaves=None,
+                  digest='sha256'):
+    """Create the statement to sign in the trailer.
+
+    The statement binds the header to the chunks either with the digest of
+    all the chunks or, in a Merkle container, with the root of the Merkle
+    tree whose leaves are the chunks.
+
+    :parameter:
+     header_bytes : string
+        The encoded header.
+     payload_digest : string
+        The digest of the chunks, in hexadecimal.
+     leaves : list
+        The digests of the chunks of a Merkle container.
+     digest : string
+        The algorithm of `payload_digest`, one of `DIGESTS`.
+
+    :return: A string, the encoded statement.
+    """
+
+    statement = {'digest': 'SHA256',
+                 'header': hashlib.sha256(header_bytes).hexdigest()}
+    if leaves is not None:
+        statement['merkle'] = {'hash': 'SHA256',
+                               'leaves': len(leaves),
+                               'root': merkle.root(leaves).encode('hex')}
+    else:
+        statement['hash'] = digest.upper()
+        statement['payload'] = payload_digest
+
+    return json.dumps(statement, sort_keys=True, separators=(',', ':'))
+
+
+def statement_bound(statement, header_bytes):
+    """Tell if a statement is bound to the header, whatever its chunks."""
+
+    return statement.get('header') == hashlib.sha256(header_bytes).hexdigest()
+
+
+def statement_matches(statement, header_bytes, payload_digest=None,
+                      leaves=None, digest='sha256'):
+    """Tell if a statement matches the header and the chunks read."""
+
+    if not statement_bound(statement, header_bytes):
+        return False
+    if leaves is not None:
+        return 'merkle' in statement and \
+            statement['merkle']['leaves'] == len(leaves) and \
+            statement['merkle']['root'] == merkle.root(leaves).encode('hex')
+
+    return statement.get('hash', 'SHA256') == digest.upper() and \
+        statement.get('payload') == payload_digest
+
+
+def rebind_statement(statement, header_bytes, new_header_bytes):
+    """Bind a statement to the new header of a rekeyed container.
+
+    The digests of the chunks are kept, so that they are not read again.
+
+    :raise ValueError:
+            If `statement` is not bound to `header_bytes`.
+
+    :return: A string, the encoded statement.
+    """
+
+    if not statement_bound(statement, header_bytes):
+        raise ValueError("The trailer does not match the header.")
+    statement = dict(statement,
+                     header=hashlib.sha256(new_header_bytes).hexdigest())
+
+    return json.dumps(statement, sort_keys=True, separators=(',', ':'))
+
+
+def statement_offset(header, data_offset, statement):
+    """Return the offset of the statement in the trailer of a container."""
+
+    leaves = statement['merkle']['leaves'] if 'merkle' in statement else 0
+
+    return payload_end(header, data_offset) + leaves * merkle.DIGEST_SIZE
+
+
+def write_trailer(out, statement, signature, leaves=None):
+    """Write the digests of the leaves and the signed statement."""
+
+    if leaves is not None:
+        out.write(b''.join(leaves))
+    out.write(statement)
+    out.write(signature)
+    out.write(TRAILER.pack(len(statement), len(signature), TRAILER_MAGIC))
+
+
+def read_trailer(f, header, data_offset):
+    """Read the signed statement of a container.
+
+    :parameter:
+     f : file
+        The container opened in binary read mode.
+     header : dict
+        The header of the container.
+     data_offset : int
+        The offset of the first chunk.
+
+    :raise ValueError:
+            If the trailer is missing or does not follow the last chunk.
+
+    :return: A tuple (statement, statement_bytes, signature).
+    """
+
+    f.seek(0, 2)
+    end = f.tell()
+    if end < payload_end(header, data_offset) + TRAILER.size:
+        raise ValueError("The trailer of the container is missing.")
+    f.seek(end - TRAILER.size)
+    statement_len, signature_len, magic = TRAILER.unpack(f.read(TRAILER.size))
+    start = end - TRAILER.size - signature_len - statement_len
+    if magic != TRAILER_MAGIC or start < payload_end(header, data_offset):
+        raise ValueError("The trailer of the container is corrupted.")
+
+    f.seek(start)
+    statement_bytes = f.read(statement_len)
+    signature = f.read(signature_len)
+    statement = json.loads(statement_bytes)
+
+    if start != statement_offset(header, data_offset, statement):
+        raise ValueError("The trailer of the container is corrupted.")
+
+    return statement, statement_bytes, signature
+
+
+def read_leaves(f, header, data_offset, statement):
+    """Read the digests of the leaves of a Merkle container.
+
+    The digests are checked against the root of the signed statement, so
+    that a chunk can then be verified alone by hashing it.
+
+    :raise ValueError:
+            If the digests do not match the root of the statement.
+
+    :return: A list, the digests of the chunks.
+    """
+
+    count = statement['merkle']['leaves']
+    f.seek(payload_end(header, data_offset))
+    raw = f.read(count * merkle.DIGEST_SIZE)
+    leaves = [raw[i:i + merkle.DIGEST_SIZE]
+              for i in range(0, len(raw), merkle.DIGEST_SIZE)]
+    if merkle.root(leaves).encode('hex') != statement['merkle']['root']:
+        raise ValueError("The Merkle tree of the container is corrupted.")
+
+    return leaves
+
+
+def _chunk_tag(header, mac_key, seq, ciphertext):
+    final = 1 if seq == chunk_count(header) - 1 else 0
+    mac = hmac.new(mac_key, digestmod=hashlib.sha256)
+    mac.update(header['nonce'].encode('ascii'))
+    mac.update(CHUNK_INFO.pack(seq, final))
+    mac.update(ciphertext)
+    return mac.digest()
+
+
+def seal_chunk(header, keys, seq, plaintext):
+    """Encrypt then MAC a chunk.
+
+    :parameter:
+     header : dict
+        The header of the container.
+     keys : tuple
+        The AES key and the HMAC key of the container.
+     seq : int
+        The sequence number of the chunk.
+     plaintext : string
+        The plaintext of the chunk.
+
+    :return: A string, the ciphertext followed by its tag.
+    """
+
+    nonce = base64.b64decode(header['nonce'])
+    block = seq * header['chunk_size'] // 16
+    ciphertext = aes.aes_ctr_encrypt(keys[0], nonce, block, plaintext)
+
+    return ciphertext + _chunk_tag(header, keys[1], seq, ciphertext)
+
+
+def open_chunk(header, keys, seq, record, offset):
+    """Authenticate then decrypt a chunk.
+
+    :parameter:
+     header : dict
+        The header of the container.
+     keys : tuple
+        The AES key and the HMAC key of the container.
+     seq : int
+        The sequence number of the chunk.
+     record : string
+        The ciphertext of the chunk followed by its tag.
+     offset : int
+        The offset of the chunk in the container, used for error reporting.
+
+    :raise CorruptedChunkError:
+            If the chunk is truncated or its tag does not match.
+
+    :return: A string, the plaintext of the chunk.
+    """
+
+    if len(record) != chunk_length(header, seq) + TAG_SIZE:
+        raise CorruptedChunkError(seq, offset)
+    ciphertext, tag = record[:-TAG_SIZE], record[-TAG_SIZE:]
+    if not hmac.compare_digest(_chunk_tag(header, keys[1], seq, ciphertext),
+                               tag):
+        raise CorruptedChunkError(seq, offset)
+
+    nonce = base64.b64decode(header['nonce'])
+    block = seq * header['chunk_size'] // 16
+
+    return aes.aes_ctr_decrypt(keys[0], nonce, block, ciphertext)
+
+
+class PayloadReader(io.RawIOBase):
+    """Seekable read-only file object over the payload of a container.
+
+    Only the chunks read are authenticated and decrypted, the last
+    `cache_size` ones being kept, so that the payload is read with the
+    memory of a few chunks and a region read again is not decrypted again.
+
+    :parameter:
+     f : file
+        The container opened in binary read mode, a seekable file object.
+     header : dict
+        The header of the container.
+     keys : tuple
+        The AES key and the HMAC key of the container.
+     data_offset : int
+        The offset of the first chunk.
+     cache_size : int
+        The number of decrypted chunks to keep, the least recently used
+        being dropped first.
+     leaves : list
+        The digests of the chunks of a Merkle container read by
+        `read_leaves`, to check every chunk against the signed tree too.
+    """
+
+    def __init__(self, f, header, keys, data_offset, cache_size=1,
+                 leaves=None):
+        self.f = f
+        self.header = header
+        self.keys = keys
+        self.data_offset = data_offset
+        self.cache_size = max(1, cache_size)
+        self.leaves = leaves
+        self.position = 0
+        self.cached = collections.OrderedDict()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.header['payload_size']
+        if offset < 0:
+            raise IOError("Negative seek position %d." % offset)
+        self.position = offset
+        return self.position
+
+    def chunk(self, seq):
+        """Return the plaintext of the chunk `seq`."""
+
+        if seq in self.cached:
+            # Move the chunk to the end, as the most recently used
+            plaintext = self.cached.pop(seq)
+        else:
+            offset = chunk_offset(self.header, self.data_offset, seq)
+            self.f.seek(offset)
+            record = self.f.read(chunk_length(self.header, seq) + TAG_SIZE)
+            if self.leaves is not None and \
+                    not merkle.verify_leaf(self.leaves, seq, record):
+                raise CorruptedChunkError(seq, offset)
+            plaintext = open_chunk(self.header, self.keys, seq, record,
+                                   offset)
+            while len(self.cached) >= self.cache_size:
+                self.cached.popitem(last=False)
+        self.cached[seq] = plaintext
+        return plaintext
+
+    def readinto(self, b):
+        size = min(len(b), self.header['payload_size'] - self.position)
+        done = 0
+        while done < size:
+            seq, start = divmod(self.position, self.header['chunk_size'])
+            data = self.chunk(seq)[start:start + size - done]
+            b[done:done + len(data)] = data
+            done += len(data)
+            self.position += len(data)
+        return max(done, 0)
+
+
+__author__ = 'Hakan Kuesne and Mathieu Devaud'
+__since__ = '2016-05-01'
+__date__ = '2016-05-16'
+__version__ = '1.0'
+__email__ = 'hakan@kusne.ch;mathieu.devaud@hefr.ch'
@@ -20,8 +20,9 @@
 import argparse
 from argparse import RawTextHelpFormatter
 import sys
-import rsa
-import locker
+
+# The crypto, tar and multiprocessing modules are imported by the commands
+# that need them, so that --help and the argument errors are immediate
 
 def print_header():
     print("""
@@ -51,15 +52,57 @@ if __name__ == "__main__":
         formatter_class=RawTextHelpFormatter,
         epilog='Examples of use : \n'
                '   python cryptical --gen 4096\n'
+               '   python cryptical --gen --key-type ecc\n'
                '   python cryptical --lock file1.txt file2.txt --keys priv.pem'
                ' pub.pem --output mySecretArchive\n'
+               '   python cryptical --lock file1.txt --keys priv.pem pub.pem'
+               ' --chunked\n'
+               '   python cryptical --lock file1.txt --keys priv.pem pub.pem'
+               ' --chunked --merkle\n'
+               '   python cryptical --lock file1.txt --keys priv.pem pub.pem'
+               ' --chunked --digest blake2b\n'
+               '   python cryptical --lock *.json --keys priv.pem pub.pem'
+               ' --pack\n'
+               '   python cryptical --lock file1.txt --keys priv.pem pub.pem'
+               ' --volumes 4\n'
+               '   python cryptical --lock file1.txt --keys priv.pem pub.pem'
+               ' --chunked --progress\n'
+               '   python cryptical --unlock mySecretArchive.lkd --keys '
+               'priv.pem pub.pem --progress json 2> events.jsonl\n'
+               '   python cryptical --lock file1.txt --keys priv.pem pub.pem'
+               ' --chunked --max-io-rate 50 --max-cpu-workers 1 '
+               '--low-priority\n'
+               '   python cryptical --lock file1.txt --keys priv.pem pub.pem'
+               ' --chunked --io-mode direct\n'
+               '   python cryptical --lock file1.txt --keys priv.pem pub.pem'
+               ' --profile lock.prof\n'
                '   python cryptical --unlock mySecretArchive.lkd --keys '
-               'priv.pem pub.pem')
+               'priv.pem pub.pem\n'
+               '   python cryptical --list mySecretArchive.lkd --keys '
+               'priv.pem pub.pem\n'
+               '   python cryptical --verify *.lkd --pubkey pub.pem '
+               '--report report.json\n'
+               '   python cryptical --verify big.lkd --pubkey pub.pem --cache'
+               '\n'
+               '   python cryptical --rekey *.lkd --keys priv.pem pub.pem '
+               '--new-keys new_priv.pem new_pub.pem\n'
+               '   python cryptical --unlock big.lkd --keys priv.pem pub.pem '
+               '--cache')
 
     # Key generation arg
     parser.add_argument("-g", "--gen",
+                        nargs='?',
+                        const='4096',
                         choices=['3072', '4096', '6144', '8192'],
-                        help='generate RSA key pair')
+                        help='generate RSA key pair, 4096 bits by default')
+
+    # Key type arg
+    parser.add_argument("--key-type",
+                        choices=['rsa', 'ecc'],
+                        default='rsa',
+                        help='type of key pair to generate, ecc generates an '
+                             'Ed25519 key to sign and an X25519 key to '
+                             'encrypt')
 
     # Key pair files arg
     parser.add_argument("-k", "--keys",
@@ -82,6 +125,53 @@ if __name__ == "__main__":
                         type=file,
                         help='unlock archive with RSA key pair')
 
+    # List mechanism arg
+    parser.add_argument("-t",
+                        "--list",
+                        type=file,
+                        help='list the files of a chunked archive without '
+                             'unlocking it')
+
+    # Verify mechanism arg
+    parser.add_argument("-v",
+                        "--verify",
+                        nargs='+',
+                        help='verify the signature of archives with the '
+                             'RSA public key only, without unlocking them')
+
+    # Rekey mechanism arg
+    parser.add_argument("--rekey",
+                        nargs='+',
+                        help='wrap the key of archives locked with --keys '
+                             'for --new-keys and sign them again, without '
+                             'encrypting their data again')
+
+    # New key pair files arg
+    parser.add_argument("--new-keys",
+                        nargs=2,
+                        type=file,
+                        help='private and public keys to use with --rekey, '
+                             'in the same order as --keys')
+
+    # Public key arg
+    parser.add_argument("-p",
+                        "--pubkey",
+                        type=file,
+                        help='public RSA key to use with --verify, the file '
+                             'has to be in a .pem format')
+
+    # Workers arg
+    parser.add_argument("-w",
+                        "--workers",
+                        type=int,
+                        help='number of processes to use with --verify and '
+                             '--rekey, the number of CPUs by default')
+
+    # Report arg
+    parser.add_argument("--report",
+                        help='file where to write the JSON report of '
+                             '--verify or --rekey')
+
     # Unlock mechanism arg
     parser.add_argument("-o",
                         "--output",
@@ -94,9 +184,143 @@ if __name__ == "__main__":
                         help='use to securely delete the files you want to '
                              'lock')
 
-    try:
+    # Chunked container arg
+    parser.add_argument("-c",
+                        "--chunked",
+                        action="store_true",
+                        help='lock files in a chunked container whose chunks '
+                             'are authenticated one by one, so that a '
+                             'corruption is detected at the first bad chunk')
 
-        print_header()
+    # Chunk size arg
+    parser.add_argument("--chunk-size",
+                        type=int,
+                        default=1024 * 1024,
+                        help='size in bytes of the chunks of a chunked '
+                             'container, 1048576 by default')
+
+    # Merkle tree arg
+    parser.add_argument("-m",
+                        "--merkle",
+                        action="store_true",
+                        help='sign the root of a Merkle tree of the chunks of '
+                             'a chunked container, so that they are verified '
+                             'in parallel')
+
+    # Digest arg
+    parser.add_argument("--digest",
+                        choices=['sha256', 'sha512', 'blake2b'],
+                        default='sha256',
+                        help='digest of all the chunks signed in the trailer '
+                             'of a chunked container, sha256 by default, '
+                             'sha512 and blake2b being faster on 64-bit CPUs '
+                             'without SHA extensions')
+
+    # Packed payload arg
+    parser.add_argument("--pack",
+                        action="store_true",
+                        help='pack the files in a compact index followed by '
+                             'their contents instead of a tar, for many '
+                             'small files')
+
+    # Volumes args
+    parser.add_argument("--volumes",
+                        type=int,
+                        default=1,
+                        help='split the chunked container in this number of '
+                             'volumes written and read concurrently, 1 by '
+                             'default')
+
+    parser.add_argument("--volume-size",
+                        type=int,
+                        help='split the chunked container in volumes of at '
+                             'most this size in bytes')
+
+    # Pipeline queue depth arg
+    parser.add_argument("--queue-depth",
+                        type=int,
+                        default=4,
+                        help='number of buffers in flight between the read, '
+                             'crypto and write threads of a chunked '
+                             'container, 0 to run them serially, 4 by '
+                             'default')
+
+    # Pipeline buffer size arg
+    parser.add_argument("--buffer-size",
+                        type=int,
+                        default=4 * 1024 * 1024,
+                        help='size in bytes of the buffers of the pipeline, '
+                             '4194304 by default')
+
+    # Progress arg
+    parser.add_argument("--progress",
+                        nargs='?',
+                        const='line',
+                        choices=['line', 'json'],
+                        help='report the progress of each stage on stderr, '
+                             'as a line with the throughput and the ETA, or '
+                             'as JSON lines for a scheduler')
+
+    # Resource limits args
+    parser.add_argument("--max-io-rate",
+                        type=float,
+                        help='maximum rate in MB/s of the reads and of the '
+                             'writes of each stage, unlimited by default')
+
+    parser.add_argument("--max-cpu-workers",
+                        type=int,
+                        help='maximum number of threads encrypting or '
+                             'hashing concurrently')
+
+    parser.add_argument("--low-priority",
+                        action="store_true",
+                        help='lower the CPU priority and, on Linux, the I/O '
+                             'priority of the process, to run in the '
+                             'background')
+
+    # Verified signature cache arg
+    parser.add_argument("--cache",
+                        nargs='?',
+                        const=True,
+                        help='remember the archives verified in this cache '
+                             'file, ~/.cryptical/verified.json by default, '
+                             'so that an unchanged archive is not hashed '
+                             'again by --verify or --unlock')
+
+    # Profile arg
+    parser.add_argument("--profile",
+                        metavar='FILE',
+                        help='write the pstats profile of the lock or the '
+                             'unlock in this file and the collapsed stacks of '
+                             'its stages, for flame graphs, in a .folded file '
+                             'next to it')
+
+    # Page cache arg
+    parser.add_argument("--io-mode",
+                        choices=['cached', 'nocache', 'direct'],
+                        default='cached',
+                        help='cached by default, nocache to drop the pages '
+                             'read and written by a chunked container from '
+                             'the page cache, direct to also read the '
+                             'payload with O_DIRECT')
+
+    # Crypto backend arg
+    parser.add_argument("-b",
+                        "--backend",
+                        choices=['auto', 'openssl', 'pycrypto'],
+                        default='auto',
+                        help='cryptographic library to use, openssl '
+                             '(cryptography) is preferred by default when '
+                             'installed')
+
+    # Resume arg
+    parser.add_argument("-r",
+                        "--resume",
+                        action="store_true",
+                        help='resume an interrupted lock or unlock of a '
+                             'chunked container from its last checkpoint')
+
+    try:
 
         # Print help if no args provided
         if len(sys.argv) == 1:
@@ -106,9 +330,98 @@ if __name__ == "__main__":
         # Returns data from the options specified
         args = parser.parse_args()
 
-        # Call RSA key pair generation if args --gen provided
+        print_header()
+
+        # Report the progress on stderr, as a line or as JSON lines
+        on_progress = None
+        if args.progress is not None:
+            import progress
+            if args.progress == 'json':
+                on_progress = progress.json_lines(sys.stderr)
+            else:
+                on_progress = progress.console(sys.stderr)
+
+        # Use the default verified signature cache
+        if args.cache is True:
+            import sigcache
+            args.cache = sigcache.DEFAULT_PATH
+
+        # Run in the background without hurting the other processes
+        if args.low_priority:
+            import throttle
+            if throttle.lower_priority():
+                print("[info] CPU and I/O priority lowered")
+            else:
+                print("[info] CPU priority lowered, the I/O priority is "
+                      "not supported on this system")
+        max_io_rate = args.max_io_rate and args.max_io_rate * 1024 * 1024
+
+        # Select the cryptographic backend
+        import backend
+        print("[info] Crypto backend : %s"
+              % backend.select_backend(args.backend).name)
+
+        # Call key pair generation if args --gen provided
         if args.gen is not None:
-            rsa.gen_rsa_keys(int(args.gen))
+            if args.key_type == 'ecc':
+                import ecc
+                ecc.gen_ecc_keys()
+            else:
+                import rsa
+                rsa.gen_rsa_keys(int(args.gen))
+
+        # Call verification mechanism if args --verify provided
+        elif args.verify is not None and (args.pubkey or args.keys):
+            if args.pubkey is not None:
+                rsa_public_key = args.pubkey.name
+            else:
+                rsa_public_key = args.keys[1].name
+            print("[info] RSA public key : %s\n" % rsa_public_key)
+
+            import json
+            import locker
+            report = locker.verify_many(args.verify, rsa_public_key,
+                                        args.workers, args.cache)
+            for result in report['archives']:
+                print("[%s] %s" % ('valid' if result['valid'] else 'invalid',
+                                   result['archive']))
+            print("[info] %d valid and %d invalid archives verified at "
+                  "%.1f MB/s" % (report['valid'], report['invalid'],
+                                 report['mb_per_s']))
+            if args.cache is not None:
+                print("[info] %d archives found in the cache %s"
+                      % (report['cached'], args.cache))
+
+            if args.report is not None:
+                with open(args.report, 'w') as f:
+                    json.dump(report, f, indent=2, sort_keys=True)
+
+        # Call rekey mechanism if args --rekey provided
+        elif args.rekey is not None and args.keys and args.new_keys:
+            print("[info] RSA key pair : %s %s"
+                  % (args.keys[0].name, args.keys[1].name))
+            print("[info] New RSA key pair : %s %s\n"
+                  % (args.new_keys[0].name, args.new_keys[1].name))
+
+            import json
+            import locker
+            report = locker.rekey_many(args.rekey, args.keys[0].name,
+                                       args.keys[1].name,
+                                       args.new_keys[0].name,
+                                       args.new_keys[1].name, args.workers)
+            for result in report['archives']:
+                if result['rekeyed']:
+                    print("[rekeyed] %s" % result['archive'])
+                else:
+                    print("[failed] %s : %s" % (result['archive'],
+                                                result['error']))
+            print("[info] %d archives rekeyed and %d failed in %f seconds"
+                  % (report['rekeyed'], report['failed'],
+                     report['seconds']))
+
+            if args.report is not None:
+                with open(args.report, 'w') as f:
+                    json.dump(report, f, indent=2, sort_keys=True)
 
         # Get RSA key pair if args --keys provided
         elif args.keys is not None:
@@ -117,6 +430,8 @@ if __name__ == "__main__":
             rsa_public_key = args.keys[1].name
             print("[info] RSA public key : %s\n" % rsa_public_key)
 
+            import locker
+
             # Call locking mechanism if args --lock provided
             if args.lock is not None:
                 files = []
@@ -140,14 +455,41 @@ if __name__ == "__main__":
                     output = 'archive'
 
                 locker.lock_files(files, rsa_private_key, rsa_public_key,
-                                  output, secure_delete)
-                print("[info] Files locked in %s.lkd" % output)
+                                  output, secure_delete, args.chunked,
+                                  args.chunk_size, args.resume, args.merkle,
+                                  args.queue_depth, args.buffer_size,
+                                  args.pack, args.volumes, args.volume_size,
+                                  on_progress, max_io_rate,
+                                  args.max_cpu_workers, args.io_mode,
+                                  args.digest, args.profile)
+                if args.volumes > 1 or args.volume_size is not None:
+                    print("[info] Files locked in %s.001.lkd and the "
+                          "following volumes" % output)
+                else:
+                    print("[info] Files locked in %s.lkd" % output)
 
             # Call unlocking mechanism if args --unlock provided
             elif args.unlock is not None:
                 print("[info] Unlocking archive %s" % args.unlock.name)
                 locker.unlock_file(args.unlock.name, rsa_private_key,
-                                   rsa_public_key)
+                                   rsa_public_key, args.resume,
+                                   args.queue_depth, args.buffer_size,
+                                   on_progress, max_io_rate,
+                                   args.max_cpu_workers, args.io_mode,
+                                   args.cache, args.profile)
+
+            # Call listing mechanism if args --list provided
+            elif args.list is not None:
+                import time
+                manifest = locker.list_archive(args.list.name,
+                                               rsa_private_key,
+                                               rsa_public_key)
+                for entry in manifest or []:
+                    print("%04o %12d %s %s" % (
+                        entry['mode'] & 0o7777, entry['size'],
+                        time.strftime('%Y-%m-%d %H:%M',
+                                      time.localtime(entry['mtime'])),
+                        entry['name']))
         else:
             print("[error] Provide RSA key pair or generate them.")
     except IOError as e:
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2016 Hakan Kuesne && Mathieu Devaud
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" This module provides elliptic curve methods.
+
+An ECC key pair is made of an Ed25519 key to sign and of an X25519 key to
+encrypt, both stored in the same PEM file. Keys are encrypted ECIES-style :
+an ephemeral X25519 key agreement with the recipient, HKDF-SHA256 to derive
+an AES key and an HMAC key, AES-256-CTR then HMAC-SHA256.
+"""
+
+
+import hashlib
+import hmac
+import re
+from base64 import b64decode, b64encode
+
+import aes
+import backend
+
+HKDF_INFO = b'cryptical x25519 key wrap'
+
+PEM_BLOCK = re.compile(b'-----BEGIN [A-Z ]+-----.+?-----END [A-Z ]+-----\n?',
+                       re.DOTALL)
+
+
+def gen_ecc_keys():
+    """Generate an ECC key pair.
+
+    This function generate an Ed25519 key and an X25519 key and create two
+    PEM files to store them.
+
+    :return: Two dicts, the private and the public ECC keys, and two PEM
+    files containing the private key and the public key.
+    """
+
+    print("Generating ECC key pair, Ed25519 and X25519")
+
+    current = backend.get_backend()
+    priv_key = {'sign': current.ec_generate('ed25519'),
+                'kem': current.ec_generate('x25519')}
+    pub_key = public_keys(priv_key)
+
+    # save private keys in a PEM file priv_key.pem
+    f = open('priv_key.pem', 'w')
+    f.write(current.ec_export(priv_key['sign']))
+    f.write(current.ec_export(priv_key['kem']))
+    f.close()
+
+    # save public keys in a PEM file pub_key.pem
+    f = open('pub_key.pem', 'w')
+    f.write(current.ec_export(pub_key['sign']))
+    f.write(current.ec_export(pub_key['kem']))
+    f.close()
+
+    print("ECC key pair generated in priv_key.pem and pub_key.pem")
+
+    return priv_key, pub_key
+
+
+def import_keys(path):
+    """Import an ECC key pair.
+
+    :parameter:
+     path : string
+        The path of the PEM file holding an Ed25519 and an X25519 key.
+
+    :return: A dict with the Ed25519 key in 'sign' and the X25519 key in
+    'kem', or None if `path` does not hold an ECC key pair.
+    """
+
+    with open(path, 'rb') as f:
+        blocks = PEM_BLOCK.findall(f.read())
+    if len(blocks) != 2:
+        return None
+
+    current = backend.get_backend()
+    keys = {}
+    for block in blocks:
+        try:
+            key = current.ec_import(block)
+        except (ValueError, TypeError):
+            return None
+        curve = current.ec_curve(key)
+        if curve == 'ed25519':
+            keys['sign'] = key
+        elif curve == 'x25519':
+            keys['kem'] = key
+
+    if len(keys) != 2:
+        return None
+    return keys
+
+
+def public_keys(priv_key):
+    """Return the public keys of the ECC private key `priv_key`."""
+
+    current = backend.get_backend()
+    return {'sign': current.ec_public(priv_key['sign']),
+            'kem': current.ec_public(priv_key['kem'])}
+
+
+def _hkdf(secret, salt, length):
+    """Derive `length` bytes from `secret` with HKDF-SHA256 (RFC 5869)."""
+
+    prk = hmac.new(salt, secret, hashlib.sha256).digest()
+    okm = b''
+    block = b''
+    counter = 1
+    while len(okm) < length:
+        block = hmac.new(prk, block + HKDF_INFO + chr(counter),
+                         hashlib.sha256).digest()
+        okm += block
+        counter += 1
+
+    return okm[:length]
+
+
+def _wrapping_keys(shared, ephemeral, recipient):
+    okm = _hkdf(shared, ephemeral + recipient, 64)
+    return okm[:32], okm[32:]
+
+
+def ecc_encrypt(pub_key, plaintext):
+    """Encrypt the plaintext with X25519.
+
+    This function encrypt the plaintext for the X25519 public key of the
+    recipient, with an ephemeral key agreement.
+
+    :parameter:
+     pub_key : dict
+        The ECC public key used to encrypt.
+     plaintext : string
+        Plaintext to encrypt.
+
+    :return: A string, the ephemeral public key, the ciphertext and its tag
+    in base64.
+    """
+
+    current = backend.get_backend()
+    ephemeral_key = current.ec_generate('x25519')
+    ephemeral = current.x25519_raw(current.ec_public(ephemeral_key))
+    recipient = current.x25519_raw(pub_key['kem'])
+    enc_key, mac_key = _wrapping_keys(
+        current.x25519_exchange(ephemeral_key, pub_key['kem']), ephemeral,
+        recipient)
+
+    ciphertext = aes.aes_ctr_encrypt(enc_key, b'\0' * 8, 0, plaintext)
+    tag = hmac.new(mac_key, ciphertext, hashlib.sha256).digest()
+
+    return b64encode(ephemeral + ciphertext + tag)
+
+
+def ecc_decrypt(priv_key, ecc_ciphertext):
+    """Decrypt the X25519 ciphertext.
+
+    :parameter:
+     priv_key : dict
+        The ECC private key used to decrypt.
+     ecc_ciphertext : string
+        Ciphertext to decrypt.
+
+    :return: A string, the plaintext after decryption.
+    """
+
+    current = backend.get_backend()
+    try:
+        raw = b64decode(ecc_ciphertext)
+        ephemeral, ciphertext, tag = raw[:32], raw[32:-32], raw[-32:]
+        recipient = current.x25519_raw(current.ec_public(priv_key['kem']))
+        enc_key, mac_key = _wrapping_keys(
+            current.x25519_exchange(priv_key['kem'],
+                                    current.x25519_from_raw(ephemeral)),
+            ephemeral, recipient)
+    except (ValueError, TypeError):
+        print("[error] ECC decryption failed")
+        return False
+
+    if not hmac.compare_digest(
+            hmac.new(mac_key, ciphertext, hashlib.sha256).digest(), tag):
+        print("[error] ECC decryption failed")
+        return False
+
+    return aes.aes_ctr_decrypt(enc_key, b'\0' * 8, 0, ciphertext)
+
+
+def ecc_sign(priv_key, payload):
+    """Sign the payload with Ed25519.
+
+    :parameter:
+     priv_key : dict
+        The ECC private key use to sign the payload.
+     payload : string
+        The payload to sign.
+
+    :return: A string, the Ed25519 signature of the payload.
+    """
+
+    return backend.get_backend().ed25519_sign(priv_key['sign'], payload)
+
+
+def ecc_verify_sign(pub_key, ecc_signature, payload):
+    """Verify the Ed25519 signature of the payload.
+
+    :parameter:
+     pub_key : dict
+        The ECC public key use to verify the signature.
+     ecc_signature : string
+        The signature of the payload.
+     payload : string
+        The payload to verify.
+
+    :return: A boolean, true if the signature is verified for the payload or
+    false if not.
+    """
+
+    return backend.get_backend().ed25519_verify(pub_key['sign'],
+                                                ecc_signature, payload)
+
+
+__author__ = 'Hakan Kuesne and Mathieu Devaud'
+__since__ = '2016-05-01'
+__date__ = '2016-05-16'
+__version__ = '1.0'
+__email__ = 'hakan@kusne.ch;mathieu.devaud@hefr.ch'
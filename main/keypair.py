@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2016 Hakan Kuesne && Mathieu Devaud
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" This module provides methods common to RSA and ECC key pairs.
+
+The algorithms are identified in the containers by the names below, the
+key encapsulation following the type of the public key and the signature
+following the type of the private key.
+"""
+
+
+import hashlib
+import backend
+import ecc
+import rsa
+
+KEM_RSA = 'RSA-OAEP'
+KEM_X25519 = 'X25519-HKDF-SHA256'
+SIGN_RSA = 'RSA-PSS-SHA256'
+SIGN_ED25519 = 'Ed25519'
+
+
+def import_key(path):
+    """Import an RSA key or an ECC key pair from a PEM file.
+
+    A key already imported is returned as is.
+    """
+
+    if not isinstance(path, basestring):
+        return path
+
+    key = ecc.import_keys(path)
+    if key is None:
+        key = rsa.import_key(path)
+
+    return key
+
+
+def is_ecc(key):
+    """Tell if `key` is an ECC key pair rather than an RSA key."""
+
+    return isinstance(key, dict)
+
+
+def public_key(priv_key):
+    """Return the public key of the private key `priv_key`."""
+
+    if is_ecc(priv_key):
+        return ecc.public_keys(priv_key)
+    return rsa.public_key(priv_key)
+
+
+def kem_algorithm(pub_key):
+    """Return the key encapsulation algorithm of the public key."""
+
+    return KEM_X25519 if is_ecc(pub_key) else KEM_RSA
+
+
+def sign_algorithm(priv_key):
+    """Return the signature algorithm of the private key."""
+
+    return SIGN_ED25519 if is_ecc(priv_key) else SIGN_RSA
+
+
+def encrypt_key(pub_key, plaintext):
+    """Encrypt a session key for the owner of `pub_key`.
+
+    :return: A string, the encrypted key in base64, or False on failure.
+    """
+
+    if is_ecc(pub_key):
+        return ecc.ecc_encrypt(pub_key, plaintext)
+    return rsa.rsa_encrypt(pub_key, plaintext)
+
+
+def decrypt_key(priv_key, algorithm, ciphertext):
+    """Decrypt a session key encrypted with `algorithm`.
+
+    :return: A string, the session key, or False on failure.
+    """
+
+    if algorithm != kem_algorithm(priv_key):
+        print("[error] This archive needs a %s key" % algorithm)
+        return False
+    if is_ecc(priv_key):
+        return ecc.ecc_decrypt(priv_key, ciphertext)
+    return rsa.rsa_decrypt(priv_key, ciphertext)
+
+
+def sign(priv_key, payload):
+    """Sign the payload with RSA-PSS or Ed25519."""
+
+    if is_ecc(priv_key):
+        return ecc.ecc_sign(priv_key, payload)
+    return rsa.rsa_sign(priv_key, payload)
+
+
+def verify_sign(pub_key, algorithm, signature, payload):
+    """Verify a signature made with `algorithm`.
+
+    :return: A boolean, True if the signature is verified for the payload.
+    """
+
+    if algorithm != sign_algorithm(pub_key):
+        return False
+    if is_ecc(pub_key):
+        return ecc.ecc_verify_sign(pub_key, signature, payload)
+    return rsa.rsa_verify_sign(pub_key, signature, payload)
+
+
+def fingerprint(pub_key):
+    """Return the SHA256 of the PEM of a public key, in hex."""
+
+    current = backend.get_backend()
+    if is_ecc(pub_key):
+        pem = current.ec_export(pub_key['sign']) + \
+            current.ec_export(pub_key['kem'])
+    else:
+        pem = current.rsa_export(pub_key)
+
+    return hashlib.sha256(pem).hexdigest()
+
+
+__author__ = 'Hakan Kuesne and Mathieu Devaud'
+__since__ = '2016-05-01'
+__date__ = '2016-05-16'
+__version__ = '1.0'
+__email__ = 'hakan@kusne.ch;mathieu.devaud@hefr.ch'
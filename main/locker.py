@@ -17,6 +17,11 @@
 """ This module provides files protection methods. """
 
 import tarfile
+import collections
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from progress import Tracker
+from throttle import TokenBucket
 import os.path
 import io
 import time
@@ -24,15 +29,30 @@ import sys
 import tools
 import aes
 import rsa
-from Crypto.PublicKey import RSA
+import container
+import keypair
+import merkle
+import pagecache
+import pipeline
+import profiling
+import sigcache
 
 # Use AES block size of 16 bytes
 AES_BLOCK_SIZE = 16
 AES_KEY_SIZE = 32
+# Checkpoint the chunked pipelines every 64 MB
+CHECKPOINT_SIZE = 64 * 1024 * 1024
+# Decrypted chunks kept by the file objects of a LockedArchive
+CACHE_CHUNKS = 8
 
 
 def lock_files(files_to_lock, rsa_private_key, rsa_public_key,
-               output='archive', secure_delete=False):
+               output='archive', secure_delete=False, chunked=False,
+               chunk_size=container.CHUNK_SIZE, resume=False, merkle=False,
+               queue_depth=pipeline.DEPTH, buffer_size=pipeline.BUFFER_SIZE,
+               packed=False, volumes=1, volume_size=None, progress=None,
+               max_io_rate=None, max_cpu_workers=None, io_mode='cached',
+               digest='sha256', profile=None):
     """Lock files.
 
     This function lock `files_to_lock` in an archive `output` using RSA
@@ -42,13 +62,62 @@ def lock_files(files_to_lock, rsa_private_key, rsa_public_key,
      files_to_lock : list
         A list of files to lock.
      rsa_private_key : string
-        RSA private key
+        RSA or ECC private key
      rsa_public_key : string
-        RSA public key
+        RSA or ECC public key
      output : string
         The output name of the archive. "archive" by default.
      secure_delete : boolean
         True if the user want to securely delete his `files_to_lock`.
+     chunked : boolean
+        True to lock the files in a chunked container whose chunks are
+        authenticated one by one.
+     chunk_size : int
+        The size in bytes of the chunks of a chunked container.
+     resume : boolean
+        True to resume an interrupted lock of a chunked container from its
+        last checkpoint.
+     merkle : boolean
+        True to sign the root of a Merkle tree of the chunks instead of
+        their SHA256, so that they are verified in parallel.
+     queue_depth : int
+        The number of buffers in flight between the reader, the crypto and
+        the writer stages of a chunked container, 0 to run them serially.
+     buffer_size : int
+        The size in bytes of the buffers of the pipeline, rounded to a whole
+        number of chunks.
+     packed : boolean
+        True to pack the files in a compact index followed by their
+        contents instead of a tar, to cut the overhead of small files.
+     volumes : int
+        The number of volumes `output`.001.lkd, `output`.002.lkd... to
+        split a chunked container in, written concurrently.
+     volume_size : int
+        The maximum size in bytes of the payload of each volume, instead of
+        a number of volumes.
+     progress : function
+        Called as `progress(stage, done, total, mb_per_s)` with the bytes
+        done in the "tar" or "pack" then "encrypt" stages, see the
+        `progress` module.
+     max_io_rate : float
+        The maximum rate in bytes per second of the reads and of the writes
+        of each stage, unlimited by default.
+     max_cpu_workers : int
+        The maximum number of threads encrypting or hashing concurrently,
+        twice the number of CPUs by default.
+     io_mode : string
+        "cached" by default, "nocache" to drop the pages read and written
+        from the page cache, or "direct" to also read the payload with
+        O_DIRECT, see the `pagecache` module.
+     digest : string
+        The digest of all the chunks signed in the trailer of a chunked
+        container without `merkle`, one of `container.DIGESTS`. SHA-512 and
+        BLAKE2b hash faster than SHA256 on 64-bit CPUs without SHA
+        extensions.
+     profile : string
+        The pstats file where to write the profile of the lock, its stages
+        being tagged in the collapsed stacks written next to it, see the
+        `profiling` module.
     """
     try:
         starttime = time.time()
@@ -57,77 +126,52 @@ def lock_files(files_to_lock, rsa_private_key, rsa_public_key,
         # Keys generation and importation
         #######################################################################
 
-        # Importe RSA key from PEM
-        rsa_private_key = RSA.importKey(open(rsa_private_key).read())
-        rsa_public_key = RSA.importKey(open(rsa_public_key).read())
+        # Importe RSA or ECC keys from PEM
+        rsa_private_key = keypair.import_key(rsa_private_key)
+        rsa_public_key = keypair.import_key(rsa_public_key)
 
-        # Generate AES key and iv
-        aes_key = aes.gen_aes_key(AES_KEY_SIZE)
-        aes_iv = aes.gen_iv(AES_BLOCK_SIZE)
+        # ECC keys are only supported in chunked containers
+        if not chunked and (keypair.is_ecc(rsa_private_key) or
+                            keypair.is_ecc(rsa_public_key)):
+            print("[info] ECC keys need a chunked container.")
+            chunked = True
 
-        encrypted_key = rsa.rsa_encrypt(rsa_public_key, aes_key)
+        # The Merkle tree, the packed payloads, the volumes and the other
+        # digests need the chunks
+        split = volumes > 1 or volume_size is not None
+        chunked = chunked or merkle or packed or split or digest != 'sha256'
 
-        f = open('cipherkey.lkd', 'w')
-        f.write(encrypted_key)
-        f.close()
+        limiter = TokenBucket(max_io_rate) if max_io_rate else None
 
-        #######################################################################
-        # Encryption and MAC of the files
-        #######################################################################
+        # Profile the lock only, without the parsing and the imports
+        with profiling.profiled(profile, 'lock'):
+            if split:
+                if resume:
+                    print("[info] Multi-volume containers cannot be "
+                          "resumed, locking from the start.")
+                _lock_volumes(files_to_lock, rsa_private_key,
+                              rsa_public_key, output, chunk_size, merkle,
+                              packed, volumes, volume_size, progress,
+                              limiter, max_cpu_workers, io_mode, digest)
+            elif chunked:
+                _lock_chunked(files_to_lock, rsa_private_key,
+                              rsa_public_key, output, chunk_size, resume,
+                              merkle, queue_depth, buffer_size, packed,
+                              progress, limiter, max_cpu_workers, io_mode,
+                              digest)
+            else:
+                _lock_tar(files_to_lock, rsa_private_key, rsa_public_key,
+                          output, progress, limiter)
 
-        # Put file in a tar archive
-        archive = tools.tarfiles(files_to_lock, 'source.tar')
-        archive_data = open(archive, mode='rb')
-        raw = archive_data.read()
-        archive_data.close()
-
-        # Encrypt the tar file
-        cipherdata = \
-            aes.aes_encrypt(AES_BLOCK_SIZE, aes_iv, aes_key, raw)
-
-        # Save cipher data
-        out = open('encrypted_files.lkd', 'w')
-        out.write(str(cipherdata))
-        out.close()
-
-        # Tar cipherkeys, cipherfile and mac file toghether
-        finalfiles = ['cipherkey.lkd', 'encrypted_files.lkd']
-        ciphertar = tools.tarfiles(finalfiles, 'encrypted_files_and_key.lkd')
-        f = open(ciphertar, mode='rb')
-        ciphertardata = f.read()
-        f.close()
-
-        # Sign data with private key
-        rsa_signature = rsa.rsa_sign(rsa_private_key, ciphertardata)
-
-        # Save signature
-        f = open('encrypted_files_and_key.lkd.sign', 'w')
-        f.write(rsa_signature)
-        f.close()
-
-        # Archive signed file and signature together
-        tools.tarfiles(['encrypted_files_and_key.lkd.sign',
-                        'encrypted_files_and_key.lkd'], output+'.lkd')
-
-        # Secure delete temp files
-        files_to_delete = ['encrypted_files_and_key.lkd.sign',
-                           'encrypted_files.lkd', 'cipherkey.lkd', archive,
-                           ciphertar]
-
-        for file in files_to_delete:
-            success = tools.secure_delete(file)
-            if not success:
-                print('[error] Something went wrong during the secure file '
-                      'delete '
-                      'of ' + file + ', make sure your erase it manually.')
-        # Secure delete sources files
-        if secure_delete:
-            for file in files_to_lock:
-                success = tools.secure_delete(file)
-                if not success:
-                    print('[error] Something went wrong during the secure'
-                          ' file delete of ' + file +
-                          ', make sure your erase it manually.')
+            # Secure delete sources files
+            if secure_delete:
+                with profiling.stage('delete'):
+                    for file in files_to_lock:
+                        success = tools.secure_delete(file)
+                        if not success:
+                            print('[error] Something went wrong during the '
+                                  'secure file delete of ' + file +
+                                  ', make sure your erase it manually.')
 
         endtime = time.time()
         elapsedtime = endtime - starttime
@@ -143,92 +187,636 @@ def lock_files(files_to_lock, rsa_private_key, rsa_public_key,
         sys.exit()
     except:
         print('[error] An unexpected error occurred when locking files.')
+        if os.path.isfile(output + '.lkd.journal'):
+            print('[info] Use --resume to continue from the last '
+                  'checkpoint.')
         sys.exit()
 
 
+def _lock_tar(files_to_lock, rsa_private_key, rsa_public_key, output,
+              progress=None, limiter=None):
+    """Lock files in a tar container signed as a whole.
+
+    The files, the tar and the temporary files of the container are read
+    and written throttled by `limiter`. The tar being encrypted in a single
+    call, the encrypt stage reports its completion only to `progress`.
+    """
+
+    # Generate AES key and iv
+    aes_key = aes.gen_aes_key(AES_KEY_SIZE)
+    aes_iv = aes.gen_iv(AES_BLOCK_SIZE)
+
+    with profiling.stage('wrap'):
+        encrypted_key = rsa.rsa_encrypt(rsa_public_key, aes_key)
+
+    f = open('cipherkey.lkd', 'w')
+    f.write(encrypted_key)
+    f.close()
+
+    #######################################################################
+    # Encryption and MAC of the files
+    #######################################################################
+
+    # Put file in a tar archive
+    tracker = Tracker(progress, 'tar', progress and
+                      tools.files_size(files_to_lock))
+    with profiling.stage('tar'):
+        archive = tools.tarfiles(files_to_lock, 'source.tar', None, tracker,
+                                 limiter=limiter)
+    tracker.finish()
+    raw = _read_file(archive, limiter)
+
+    # Encrypt the tar file, as a whole, the padding, the encryption and the
+    # base64 being tagged by aes_encrypt
+    tracker = Tracker(progress, 'encrypt', len(raw))
+    cipherdata = \
+        aes.aes_encrypt(AES_BLOCK_SIZE, aes_iv, aes_key, raw)
+    tracker.finish()
+
+    # Save cipher data
+    _write_file('encrypted_files.lkd', str(cipherdata), limiter)
+
+    # Tar cipherkeys, cipherfile and mac file toghether
+    finalfiles = ['cipherkey.lkd', 'encrypted_files.lkd']
+    with profiling.stage('tar'):
+        ciphertar = tools.tarfiles(finalfiles, 'encrypted_files_and_key.lkd',
+                                   limiter=limiter)
+    ciphertardata = _read_file(ciphertar, limiter)
+
+    # Sign data with private key
+    with profiling.stage('sign'):
+        rsa_signature = rsa.rsa_sign(rsa_private_key, ciphertardata)
+
+    # Save signature
+    f = open('encrypted_files_and_key.lkd.sign', 'w')
+    f.write(rsa_signature)
+    f.close()
+
+    # Archive signed file and signature together
+    with profiling.stage('tar'):
+        tools.tarfiles(['encrypted_files_and_key.lkd.sign',
+                        'encrypted_files_and_key.lkd'], output+'.lkd',
+                       limiter=limiter)
+
+    # Secure delete temp files
+    files_to_delete = ['encrypted_files_and_key.lkd.sign',
+                       'encrypted_files.lkd', 'cipherkey.lkd', archive,
+                       ciphertar]
+
+    with profiling.stage('delete'):
+        for file in files_to_delete:
+            success = tools.secure_delete(file)
+            if not success:
+                print('[error] Something went wrong during the secure file '
+                      'delete '
+                      'of ' + file + ', make sure your erase it manually.')
+
+
+def _read_file(path, limiter=None):
+    """Read a whole file by blocks throttled by `limiter`."""
+
+    blocks = []
+    with open(path, mode='rb') as f:
+        for block in iter(lambda: f.read(tools.STREAM_BLOCK_SIZE), b''):
+            if limiter is not None:
+                limiter.consume(len(block))
+            blocks.append(block)
+
+    return b''.join(blocks)
+
+
+def _write_file(path, data, limiter=None):
+    """Write a file by blocks throttled by `limiter`."""
+
+    with open(path, mode='wb') as f:
+        for start in range(0, len(data), tools.STREAM_BLOCK_SIZE):
+            block = data[start:start + tools.STREAM_BLOCK_SIZE]
+            if limiter is not None:
+                limiter.consume(len(block))
+            f.write(block)
+
+
+def _extract_file(path, limiter=None):
+    """Extract the members of a tar in the current directory, throttled by
+    `limiter`."""
+
+    tar = tarfile.open(path)
+    for member in tar.getmembers():
+        tar.extract(member)
+        if limiter is not None:
+            # Read then written
+            limiter.consume(2 * member.size)
+    tar.close()
+
+
+def _lock_chunked(files_to_lock, rsa_private_key, rsa_public_key, output,
+                  chunk_size, resume=False, merkle=False,
+                  queue_depth=pipeline.DEPTH,
+                  buffer_size=pipeline.BUFFER_SIZE, packed=False,
+                  progress=None, limiter=None, workers=None,
+                  io_mode='cached', digest='sha256'):
+    """Lock files in a chunked container.
+
+    The tar of the files is encrypted chunk by chunk with AES-256-CTR, each
+    chunk being followed by its HMAC-SHA256 tag. The AES and HMAC keys are
+    encrypted with RSA-OAEP in the header, which is signed with RSA-PSS.
+
+    A journal `output`.lkd.journal records the committed chunks, the tag of
+    the last one and the session keys encrypted for the owner of
+    `rsa_private_key`, so that an interrupted run can be resumed and produce
+    the same archive as an uninterrupted one.
+
+    With `merkle`, the trailer holds the digest of every chunk and the
+    statement signs the root of their Merkle tree, else it signs the
+    `digest` of all the chunks. With `packed`, the files are packed instead
+    of being put in a tar.
+
+    The chunks are read, encrypted and written in a pipeline of
+    `queue_depth` buffers of `buffer_size` bytes, throttled by `limiter`,
+    the leaves of a Merkle tree being hashed by `workers` threads. The tar
+    is read and the container written in the `io_mode` of `pagecache`.
+    """
+
+    journal = output + '.lkd.journal'
+    state = tools.load_journal(journal) if resume else None
+    if state is not None and not _lock_checkpoint_valid(state,
+                                                        files_to_lock,
+                                                        output):
+        print("[info] The checkpoint of %s.lkd is stale, locking from the "
+              "start." % output)
+        state = None
+
+    if state is None:
+        # Put file in a tar archive and describe them in a manifest, or
+        # pack them, the index of a packed payload listing them
+        archive, manifest = _make_payload(files_to_lock, packed, progress,
+                                          limiter, io_mode)
+
+        with profiling.stage('wrap'):
+            header, header_bytes, keys = _new_container(
+                rsa_private_key, rsa_public_key, os.path.getsize(archive),
+                chunk_size, merkle, packed, manifest, digest=digest)
+
+        # Sign header with private key
+        with profiling.stage('sign'):
+            rsa_signature = keypair.sign(rsa_private_key, header_bytes)
+
+        out = open(output + '.lkd', mode='wb')
+        data_offset = container.write_header(out, header_bytes,
+                                             rsa_signature)
+
+        stat = os.stat(archive)
+        state = {'files': files_to_lock,
+                 'archive': archive,
+                 'archive_stat': [stat.st_size, stat.st_mtime],
+                 'key': keypair.encrypt_key(
+                     keypair.public_key(rsa_private_key), keys[0] + keys[1]),
+                 'data_offset': data_offset,
+                 'committed': 0,
+                 'tag': None}
+        _checkpoint(out, journal, state)
+    else:
+        archive = state['archive']
+        raw = keypair.decrypt_key(rsa_private_key,
+                                  keypair.kem_algorithm(rsa_private_key),
+                                  state['key'])
+        keys = (raw[:AES_KEY_SIZE], raw[AES_KEY_SIZE:])
+        out = open(output + '.lkd', mode='r+b')
+        header, header_bytes, _, data_offset = container.read_header(out)
+        print("[info] Resuming the lock of %s.lkd at chunk %d."
+              % (output, state['committed']))
+
+    # Encrypt and MAC the tar chunk by chunk from the last checkpoint,
+    # reading, encrypting and writing in a pipeline
+    chunk_size = header['chunk_size']
+    interval = max(1, CHECKPOINT_SIZE // chunk_size)
+    start = container.chunk_offset(header, data_offset, state['committed'])
+    payload_digest = _payload_digest(header, out, data_offset,
+                                     state['committed'], workers)
+    # O_DIRECT needs aligned offsets, so whole chunks of aligned size
+    batch_size = _batch_size(header, buffer_size, 0)
+    source, direct = pagecache.open_reader(
+        archive, io_mode if chunk_size % pagecache.ALIGNMENT == 0 else
+        'nocache', batch_size)
+    source.seek(state['committed'] * chunk_size)
+    out.seek(start)
+    out.truncate()
+    reads = pagecache.DropBehind(source, False,
+                                 io_mode != 'cached' and not direct)
+    writes = pagecache.DropBehind(out, True, io_mode != 'cached')
+    batches = _batches(header, state['committed'], buffer_size, 0)
+    tracker = Tracker(progress, 'encrypt', header['payload_size'])
+    tracker.update(state['committed'] * chunk_size)
+
+    def read(buffer):
+        seqs = next(batches, None)
+        if seqs is not None:
+            length = sum(container.chunk_length(header, seq)
+                         for seq in seqs)
+            if limiter is not None:
+                limiter.consume(length)
+            if source.readinto(memoryview(buffer)[:length]) != length:
+                raise IOError("%s is shorter than expected." % archive)
+            reads.advance(length)
+        return seqs
+
+    def process(seqs, buffer):
+        records = []
+        position = 0
+        for seq in seqs:
+            length = container.chunk_length(header, seq)
+            records.append(container.seal_chunk(
+                header, keys, seq,
+                memoryview(buffer)[position:position + length].tobytes()))
+            payload_digest.update(records[-1])
+            position += length
+        return records
+
+    def write(seqs, records):
+        for seq, record in zip(seqs, records):
+            if limiter is not None:
+                limiter.consume(len(record))
+            out.write(record)
+            writes.advance(len(record))
+            tracker.update(len(record) - container.TAG_SIZE)
+            if (seq + 1) % interval == 0:
+                state['committed'] = seq + 1
+                state['tag'] = record[-container.TAG_SIZE:].encode('hex')
+                _checkpoint(out, journal, state)
+
+    with profiling.stage('encrypt'):
+        pipeline.run(read, process, write, queue_depth, batch_size)
+        reads.drop()
+        writes.drop()
+    tracker.finish()
+
+    _write_trailer(out, header, header_bytes, payload_digest,
+                   rsa_private_key)
+    out.close()
+    source.close()
+
+    with profiling.stage('delete'):
+        success = tools.secure_delete(archive)
+    if not success:
+        print('[error] Something went wrong during the secure file delete '
+              'of ' + archive + ', make sure your erase it manually.')
+    os.remove(journal)
+
+
+def _make_payload(files_to_lock, packed, progress=None, limiter=None,
+                  io_mode='cached'):
+    """Tar the files with their manifest, or pack them.
+
+    :return: A tuple (archive, manifest), the name of the payload and the
+    entries of the tarred files, None for a packed payload whose index
+    already lists them.
+    """
+
+    # Only walk the files for their total size if it is reported
+    tracker = Tracker(progress, 'pack' if packed else 'tar',
+                      progress and tools.files_size(files_to_lock))
+    with profiling.stage(tracker.stage):
+        if packed:
+            manifest = None
+            archive = tools.packfiles(files_to_lock, 'source.pack', tracker,
+                                      io_mode != 'cached', limiter)
+        else:
+            manifest = []
+            archive = tools.tarfiles(files_to_lock, 'source.tar', manifest,
+                                     tracker, io_mode != 'cached', limiter)
+    tracker.finish()
+
+    return archive, manifest
+
+
+def _new_container(rsa_private_key, rsa_public_key, payload_size, chunk_size,
+                   merkle=False, packed=False, manifest=None, volume=None,
+                   digest='sha256'):
+    """Create the header of a chunked container and its session keys.
+
+    The AES and HMAC keys are generated then encrypted for the owner of
+    `rsa_public_key` in the header, with the manifest of the files and the
+    description of the volume if any.
+
+    :raise AttributeError:
+            If the session keys cannot be encrypted.
+
+    :return: A tuple (header, header_bytes, keys).
+    """
+
+    keys = (aes.gen_aes_key(AES_KEY_SIZE), aes.gen_aes_key(AES_KEY_SIZE))
+    encrypted_key = keypair.encrypt_key(rsa_public_key, keys[0] + keys[1])
+    if not encrypted_key:
+        raise AttributeError("The session keys cannot be encrypted.")
+
+    header = container.new_header(
+        encrypted_key, aes.gen_iv(container.NONCE_SIZE), payload_size,
+        chunk_size, keypair.kem_algorithm(rsa_public_key),
+        keypair.sign_algorithm(rsa_private_key),
+        'merkle' if merkle else digest, 'packed' if packed else 'tar')
+    if manifest is not None:
+        container.seal_manifest(header, keys, manifest)
+    if volume is not None:
+        header['volume'] = volume
+
+    return header, container.encode_header(header), keys
+
+
+def _write_trailer(out, header, header_bytes, payload_digest,
+                   rsa_private_key):
+    """Sign the digests of the header and of the chunks in the trailer."""
+
+    digests = _digest_fields(header, payload_digest)
+    statement = container.new_statement(header_bytes, **digests)
+    with profiling.stage('sign'):
+        signature = keypair.sign(rsa_private_key, statement)
+    container.write_trailer(out, statement, signature, digests.get('leaves'))
+
+
+def _lock_volumes(files_to_lock, rsa_private_key, rsa_public_key, output,
+                  chunk_size, merkle=False, packed=False, volumes=1,
+                  volume_size=None, progress=None, limiter=None,
+                  workers=None, io_mode='cached', digest='sha256'):
+    """Lock files in a multi-volume container.
+
+    The tar of the files is split in `volumes` slices of whole chunks, or in
+    slices of `volume_size` bytes, each one locked concurrently in its own
+    chunked container `output`.001.lkd, `output`.002.lkd... with its own
+    keys, header and signed trailer, binding its chunks with `digest` or
+    with a Merkle tree.
+
+    The header of every volume records the identifier of the set, the index
+    of the volume, the number of volumes, its offset and the total size of
+    the payload, so that volumes cannot be mixed up, reordered or dropped.
+
+    At most `workers` volumes are locked at once, twice the number of CPUs
+    by default, the tar being read and the volumes written in the `io_mode`
+    of `pagecache`.
+    """
+
+    archive, manifest = _make_payload(files_to_lock, packed, progress,
+                                      limiter, io_mode)
+
+    # Split the payload in slices of whole chunks
+    size = os.path.getsize(archive)
+    chunks = max(1, -(-size // chunk_size))
+    if volume_size:
+        per_volume = max(1, volume_size // chunk_size)
+    else:
+        per_volume = -(-chunks // max(1, volumes))
+    count = -(-chunks // per_volume)
+    set_id = aes.gen_iv(16).encode('hex')
+    tracker = Tracker(progress, 'encrypt', size)
+
+    def lock_volume(index):
+        offset = index * per_volume * chunk_size
+        volume = {'set': set_id, 'index': index, 'count': count,
+                  'offset': offset, 'size': size}
+        header, header_bytes, keys = _new_container(
+            rsa_private_key, rsa_public_key,
+            min(per_volume * chunk_size, size - offset), chunk_size,
+            merkle, packed, manifest if index == 0 else None, volume,
+            digest)
+
+        with open(container.volume_path(output, index), mode='wb') as out:
+            data_offset = container.write_header(
+                out, header_bytes, keypair.sign(rsa_private_key,
+                                                header_bytes))
+            # The volumes are already hashed concurrently, a limited
+            # number of workers is not multiplied by Merkle threads
+            payload_digest = _new_digest(header, workers and 1)
+            writes = pagecache.DropBehind(out, True, io_mode != 'cached')
+            with open(archive, mode='rb') as source:
+                source.seek(offset)
+                reads = pagecache.DropBehind(source, False,
+                                             io_mode != 'cached')
+                for seq in range(container.chunk_count(header)):
+                    length = container.chunk_length(header, seq)
+                    if limiter is not None:
+                        limiter.consume(length)
+                    record = container.seal_chunk(header, keys, seq,
+                                                  source.read(length))
+                    reads.advance(length)
+                    if limiter is not None:
+                        limiter.consume(len(record))
+                    out.write(record)
+                    writes.advance(len(record))
+                    payload_digest.update(record)
+                    tracker.update(length)
+                reads.drop()
+            writes.drop()
+            _write_trailer(out, header, header_bytes, payload_digest,
+                           rsa_private_key)
+
+    # The threads of the pool run in the stage of the calling thread
+    pool = ThreadPool(min(count,
+                          workers or 2 * multiprocessing.cpu_count()))
+    try:
+        with profiling.stage('encrypt'):
+            pool.map(lock_volume, range(count))
+    finally:
+        pool.close()
+        pool.join()
+    tracker.finish()
+
+    with profiling.stage('delete'):
+        success = tools.secure_delete(archive)
+    if not success:
+        print('[error] Something went wrong during the secure file delete '
+              'of ' + archive + ', make sure your erase it manually.')
+
+
+def _lock_checkpoint_valid(state, files_to_lock, output):
+    """Check that a lock checkpoint matches the files and the output."""
+
+    archive = state['archive']
+    if state['files'] != list(files_to_lock) or \
+            not os.path.isfile(archive) or \
+            not os.path.isfile(output + '.lkd'):
+        return False
+    stat = os.stat(archive)
+    if [stat.st_size, stat.st_mtime] != state['archive_stat']:
+        return False
+    if state['committed'] == 0:
+        return True
+
+    # The last committed chunk must still be on the disk
+    with open(output + '.lkd', mode='rb') as out:
+        header, _, _, data_offset = container.read_header(out)
+        out.seek(container.chunk_offset(header, data_offset,
+                                        state['committed']) -
+                 container.TAG_SIZE)
+        return out.read(container.TAG_SIZE).encode('hex') == state['tag']
+
+
+def _payload_digest(header, f, data_offset, committed, workers=None):
+    """Return the digest of the chunks of a container.
+
+    The digest is a hash object of the algorithm of the header, or a
+    `merkle.LeafHasher` hashing with `workers` threads in a Merkle
+    container, already updated with the first `committed` chunks of `f`.
+    """
+
+    if header.get('integrity') == 'merkle':
+        ranges = container.record_ranges(header, data_offset, committed)
+        if not isinstance(getattr(f, 'name', None), basestring):
+            # An in-memory container is hashed as it is read
+            digest = _new_digest(header, workers)
+            for offset, length in ranges:
+                f.seek(offset)
+                digest.update(f.read(length))
+            return digest
+        f.flush()
+        return merkle.LeafHasher(merkle.hash_leaves(f.name, ranges, workers),
+                                 workers)
+
+    return _hash_range(f, _new_digest(header), data_offset,
+                       min(container.chunk_offset(header, data_offset,
+                                                  committed),
+                           container.payload_end(header, data_offset)))
+
+
+def _new_digest(header, workers=None):
+    """Return an empty digest of the chunks of a container."""
+
+    if header.get('integrity') == 'merkle':
+        return merkle.LeafHasher(workers=workers)
+
+    return container.new_digest(header.get('integrity', 'sha256'))
+
+
+def _digest_fields(header, payload_digest):
+    """Return the digest of the chunks as `container.new_statement` args."""
+
+    if header.get('integrity') == 'merkle':
+        return {'leaves': payload_digest.finish()}
+
+    return {'payload_digest': payload_digest.hexdigest(),
+            'digest': header.get('integrity', 'sha256')}
+
+
+def _hash_range(f, digest, start, end):
+    """Return the hash object `digest` updated with the bytes of `f` in a
+    range."""
+
+    f.seek(start)
+    while start < end:
+        data = f.read(min(CHECKPOINT_SIZE, end - start))
+        if not data:
+            break
+        digest.update(data)
+        start += len(data)
+
+    return digest
+
+
+def _batch_size(header, buffer_size, overhead):
+    """Return the size of the pipeline buffers, a whole number of chunks.
+
+    :parameter:
+     header : dict
+        The header of the container.
+     buffer_size : int
+        The size in bytes requested for the buffers.
+     overhead : int
+        The bytes read with each chunk, its tag when unlocking.
+    """
+
+    record_size = header['chunk_size'] + overhead
+    return max(1, buffer_size // record_size) * record_size
+
+
+def _batches(header, first, buffer_size, overhead):
+    """Generate the lists of chunks read in each buffer of the pipeline."""
+
+    per_buffer = _batch_size(header, buffer_size, overhead) // \
+        (header['chunk_size'] + overhead)
+    count = container.chunk_count(header)
+    for seq in range(first, count, per_buffer):
+        yield range(seq, min(seq + per_buffer, count))
+
+
+def _checkpoint(out, journal, state):
+    """Flush `out` to the disk then record `state` in `journal`."""
+
+    out.flush()
+    os.fsync(out.fileno())
+    tools.save_journal(journal, state)
+
+
 # Unlock given file
-def unlock_file(cipherfile, rsa_private_key, rsa_public_key):
+def unlock_file(cipherfile, rsa_private_key, rsa_public_key, resume=False,
+                queue_depth=pipeline.DEPTH, buffer_size=pipeline.BUFFER_SIZE,
+                progress=None, max_io_rate=None, max_cpu_workers=None,
+                io_mode='cached', cache=None, profile=None):
     """Unlock archive.
 
     This function unlock an archive `cipherfile` using RSA private key
-    `rsa_private_key` and RSA public key `rsa_public_key`.
+    `rsa_private_key` and RSA public key `rsa_public_key`. Both tar and
+    chunked containers are supported.
 
     :parameter:
      cipherfile : string
         Name of the archive to unlock.
      rsa_private_key : string
-        RSA private key
+        RSA or ECC private key
      rsa_public_key : string
-        RSA public key
+        RSA or ECC public key
+     resume : boolean
+        True to resume an interrupted unlock of a chunked container from its
+        last checkpoint.
+     queue_depth : int
+        The number of buffers in flight between the reader, the crypto and
+        the writer stages of a chunked container, 0 to run them serially.
+     buffer_size : int
+        The size in bytes of the buffers of the pipeline, rounded to a whole
+        number of chunks.
+     progress : function
+        Called as `progress(stage, done, total, mb_per_s)` with the bytes
+        done in the "decrypt" then "extract" stages of a chunked container,
+        see the `progress` module.
+     max_io_rate : float
+        The maximum rate in bytes per second of the reads and of the writes
+        of each stage of a chunked container, unlimited by default.
+     max_cpu_workers : int
+        The maximum number of threads decrypting or hashing concurrently,
+        twice the number of CPUs by default.
+     io_mode : string
+        "cached" by default, or "nocache" to drop the pages read and
+        written by a chunked container from the page cache, see the
+        `pagecache` module.
+     cache : string
+        The path of a `sigcache` file of verified archives, so that an
+        archive already verified by `verify_many` and unchanged since is
+        not hashed again.
+     profile : string
+        The pstats file where to write the profile of the unlock, its
+        stages being tagged in the collapsed stacks written next to it, see
+        the `profiling` module.
     """
     try:
         starttime = time.time()
 
-        # Importe RSA key from PEM
-        rsa_private_key = RSA.importKey(open(rsa_private_key).read())
-        rsa_public_key = RSA.importKey(open(rsa_public_key).read())
-
-        # Extract encrypted tar and signature
-        tar = tarfile.open(cipherfile)
-
-        for file in tar.getnames():
-            tar.extract(file)
-        tar.close()
-
-        # Verification of the payload
-        archive_data = open('encrypted_files_and_key.lkd.sign', mode='rb')
-        raw_signature = archive_data.read()
-        archive_data.close()
-        archive_data = open('encrypted_files_and_key.lkd', mode='rb')
-        raw_files = archive_data.read()
-        archive_data.close()
-        if not rsa.rsa_verify_sign(rsa_public_key, raw_signature, raw_files):
-            print("[warning] This file has been corrupted ! Don't use it !")
-            # clean tar filed
-            files_to_delete = ["encrypted_files_and_key.lkd.sign",
-                               "encrypted_files_and_key.lkd"]
-
-            for eachfile in files_to_delete:
-                if os.path.isfile(eachfile):
-                    tools.secure_delete(eachfile, passes=1)
-        else:
-            print("[info] This file is authentic !")
+        # Importe RSA or ECC keys from PEM
+        rsa_private_key = keypair.import_key(rsa_private_key)
+        rsa_public_key = keypair.import_key(rsa_public_key)
 
-            # Extract encrypted files and symetric key
-            tar = tarfile.open('encrypted_files_and_key.lkd')
+        limiter = TokenBucket(max_io_rate) if max_io_rate else None
 
-            for eachfile in tar.getnames():
-                tar.extract(eachfile)
-            tar.close()
-
-            # Decryption of the keys
-            archive_data = open('cipherkey.lkd', mode='rb')
-            raw = archive_data.read()
-            archive_data.close()
-            aes_key = rsa.rsa_decrypt(rsa_private_key, raw)
-
-            # Decrypt files
-            archive_data = open('encrypted_files.lkd', mode='rb')
-
-            raw_files = archive_data.read()
-            archive_data.close()
-
-            bytestar = io.BytesIO(
-                str(aes.aes_decrypt(AES_BLOCK_SIZE, aes_key, raw_files)))
-
-            # Untar files
-            tar = tarfile.open(fileobj=bytestar)
-            for eachfile in tar.getnames():
-                tar.extract(eachfile)
-
-            # Delete container related files
-            files_to_delete = ["cipherkey.lkd", "encrypted_files_and_key.lkd",
-                               "encrypted_files_and_key.lkd.sign",
-                               "encrypted_files.lkd", cipherfile]
-
-            for eachfile in files_to_delete:
-                tools.secure_delete(eachfile, passes=1)
+        # Profile the unlock only, without the parsing and the imports
+        with profiling.profiled(profile, 'unlock'):
+            if container.is_container(cipherfile):
+                unlocked = _unlock_chunked(cipherfile, rsa_private_key,
+                                           rsa_public_key, resume,
+                                           queue_depth, buffer_size,
+                                           progress, limiter,
+                                           max_cpu_workers, io_mode, cache)
+            else:
+                unlocked = _unlock_tar(cipherfile, rsa_private_key,
+                                       rsa_public_key, cache, progress,
+                                       limiter)
 
+        if unlocked:
             endtime = time.time()
             elapsedtime = endtime - starttime
 
@@ -245,6 +833,13 @@ def unlock_file(cipherfile, rsa_private_key, rsa_public_key):
                            "encrypted_files_and_key.lkd.sign",
                            "encrypted_files.lkd"]
 
+        # Keep the decrypted chunks if the unlock can be resumed
+        if os.path.isfile(cipherfile + '.journal'):
+            print('[info] Use --resume to continue from the last '
+                  'checkpoint.')
+        else:
+            files_to_delete.append("source.tar")
+
         for eachfile in files_to_delete:
             if os.path.isfile(eachfile):
                 tools.secure_delete(eachfile, passes=1)
@@ -252,6 +847,1159 @@ def unlock_file(cipherfile, rsa_private_key, rsa_public_key):
         sys.exit()
 
 
+def _unlock_tar(cipherfile, rsa_private_key, rsa_public_key, cache=None,
+                progress=None, limiter=None):
+    """Unlock a tar container signed as a whole.
+
+    The container, its temporary files and the files extracted are read
+    and written throttled by `limiter`. The payload being decrypted in a
+    single call, the decrypt stage reports its completion only to
+    `progress`, the extract stage reporting the bytes of each member.
+
+    :return: A boolean, True if the archive has been unlocked.
+    """
+
+    verified = _cached_verification(cache, cipherfile, rsa_public_key)
+
+    # Extract encrypted tar and signature
+    _extract_file(cipherfile, limiter)
+
+    # Verification of the payload
+    raw_signature = _read_file('encrypted_files_and_key.lkd.sign', limiter)
+    raw_files = _read_file('encrypted_files_and_key.lkd', limiter)
+    with profiling.stage('verify'):
+        authentic = verified or \
+            rsa.rsa_verify_sign(rsa_public_key, raw_signature, raw_files)
+    if not authentic:
+        print("[warning] This file has been corrupted ! Don't use it !")
+        # clean tar filed
+        files_to_delete = ["encrypted_files_and_key.lkd.sign",
+                           "encrypted_files_and_key.lkd"]
+
+        for eachfile in files_to_delete:
+            if os.path.isfile(eachfile):
+                tools.secure_delete(eachfile, passes=1)
+        return False
+
+    print("[info] This file is authentic !")
+
+    # Extract encrypted files and symetric key
+    _extract_file('encrypted_files_and_key.lkd', limiter)
+
+    # Decryption of the keys
+    archive_data = open('cipherkey.lkd', mode='rb')
+    raw = archive_data.read()
+    archive_data.close()
+    with profiling.stage('unwrap'):
+        aes_key = rsa.rsa_decrypt(rsa_private_key, raw)
+
+    # Decrypt files, the base64, the decryption and the padding being
+    # tagged by aes_decrypt
+    raw_files = _read_file('encrypted_files.lkd', limiter)
+
+    tracker = Tracker(progress, 'decrypt', len(raw_files))
+    bytestar = io.BytesIO(
+        str(aes.aes_decrypt(AES_BLOCK_SIZE, aes_key, raw_files)))
+    tracker.finish()
+
+    # Untar files, each member extracted being throttled and tracked
+    tracker = Tracker(progress, 'extract', 0)
+    with profiling.stage('extract'):
+        tar = tarfile.open(fileobj=bytestar)
+        members = tar.getmembers()
+        tracker.total = sum(member.size for member in members)
+        for member in members:
+            tools.extract_member(tar, member)
+            if limiter is not None:
+                limiter.consume(member.size)
+            tracker.update(member.size)
+    tracker.finish()
+
+    # Delete container related files
+    files_to_delete = ["cipherkey.lkd", "encrypted_files_and_key.lkd",
+                       "encrypted_files_and_key.lkd.sign",
+                       "encrypted_files.lkd", cipherfile]
+
+    with profiling.stage('delete'):
+        for eachfile in files_to_delete:
+            tools.secure_delete(eachfile, passes=1)
+
+    return True
+
+
+def _cached_verification(cache, cipherfile, rsa_public_key):
+    """Tell if `cipherfile` is in the `sigcache` file `cache`."""
+
+    if cache is None:
+        return False
+    verified_cache = sigcache.VerifiedCache(cache)
+    if not verified_cache.contains(verified_cache.key(
+            cipherfile, keypair.fingerprint(rsa_public_key))):
+        return False
+    verified_cache.save()
+    print("[info] %s was verified and has not changed since." % cipherfile)
+
+    return True
+
+
+def _open_header(source, rsa_private_key, rsa_public_key):
+    """Verify the header of a chunked container and decrypt its keys.
+
+    :return: A tuple (header, header_bytes, data_offset, keys), or False if
+    the header is not authentic or the keys cannot be decrypted.
+    """
+
+    header, header_bytes, rsa_signature, data_offset = \
+        container.read_header(source)
+
+    # Verification of the header
+    if not keypair.verify_sign(rsa_public_key, header['sign'], rsa_signature,
+                               header_bytes):
+        print("[warning] This file has been corrupted ! Don't use it !")
+        return False
+
+    print("[info] This file is authentic !")
+
+    # Decryption of the keys
+    raw = keypair.decrypt_key(rsa_private_key, header['kem'], header['key'])
+    if not raw:
+        return False
+
+    return (header, header_bytes, data_offset,
+            (raw[:AES_KEY_SIZE], raw[AES_KEY_SIZE:]))
+
+
+def _verify_trailer(source, header, header_bytes, data_offset,
+                    payload_digest, rsa_public_key):
+    """Check the signed statement of a chunked container.
+
+    :return: A boolean, True if the statement is signed by `rsa_public_key`
+    and matches the header and the digest of the chunks.
+    """
+
+    try:
+        statement, statement_bytes, rsa_signature = \
+            container.read_trailer(source, header, data_offset)
+    except ValueError:
+        return False
+
+    return keypair.verify_sign(rsa_public_key, header['sign'], rsa_signature,
+                               statement_bytes) and \
+        container.statement_matches(statement, header_bytes,
+                                    **_digest_fields(header, payload_digest))
+
+
+def _unlock_chunked(cipherfile, rsa_private_key, rsa_public_key,
+                    resume=False, queue_depth=pipeline.DEPTH,
+                    buffer_size=pipeline.BUFFER_SIZE, progress=None,
+                    limiter=None, workers=None, io_mode='cached',
+                    cache=None):
+    """Unlock a chunked container.
+
+    The header signature is verified first, then every chunk is
+    authenticated before being decrypted, so that a corruption is reported
+    at the first bad chunk with its offset instead of after a full read.
+
+    A journal `cipherfile`.journal records the chunks already decrypted in
+    the temporary tar, so that an interrupted run can be resumed.
+
+    The chunks are read, decrypted and written in a pipeline of
+    `queue_depth` buffers of `buffer_size` bytes, throttled by `limiter`,
+    the leaves of a Merkle tree being hashed by `workers` threads. The
+    container is read and the tar written in the `io_mode` of `pagecache`,
+    O_DIRECT being used as nocache as the records are not aligned.
+
+    A container found in the `sigcache` file `cache` is not hashed, its
+    header signature and the tags of its chunks being still checked.
+
+    :return: A boolean, True if the archive has been unlocked.
+    """
+
+    source = open(cipherfile, mode='rb')
+    with profiling.stage('verify'):
+        opened = _open_header(source, rsa_private_key, rsa_public_key)
+    if not opened:
+        source.close()
+        return False
+    header, header_bytes, data_offset, keys = opened
+
+    if 'volume' in header:
+        source.close()
+        return _unlock_volumes(cipherfile, header, rsa_private_key,
+                               rsa_public_key, progress, limiter, workers,
+                               io_mode, cache)
+
+    journal = cipherfile + '.journal'
+    stat = os.stat(cipherfile)
+    state = tools.load_journal(journal) if resume else None
+    if state is not None and \
+            (state['archive_stat'] != [stat.st_size, stat.st_mtime] or
+             not os.path.isfile('source.tar')):
+        print("[info] The checkpoint of %s is stale, unlocking from the "
+              "start." % cipherfile)
+        state = None
+    if state is None:
+        state = {'archive_stat': [stat.st_size, stat.st_mtime],
+                 'committed': 0}
+        archive = open('source.tar', mode='wb')
+    else:
+        print("[info] Resuming the unlock of %s at chunk %d."
+              % (cipherfile, state['committed']))
+        archive = open('source.tar', mode='r+b')
+
+    # Authenticate and decrypt the chunks in a temporary tar
+    interval = max(1, CHECKPOINT_SIZE // header['chunk_size'])
+    archive.seek(state['committed'] * header['chunk_size'])
+    archive.truncate()
+    verified = _cached_verification(cache, cipherfile, rsa_public_key)
+    payload_digest = None if verified else \
+        _payload_digest(header, source, data_offset, state['committed'],
+                        workers)
+    source.seek(container.chunk_offset(header, data_offset,
+                                       state['committed']))
+    reads = pagecache.DropBehind(source, False, io_mode != 'cached')
+    writes = pagecache.DropBehind(archive, True, io_mode != 'cached')
+    batches = _batches(header, state['committed'], buffer_size,
+                       container.TAG_SIZE)
+    tracker = Tracker(progress, 'decrypt', header['payload_size'])
+    tracker.update(state['committed'] * header['chunk_size'])
+
+    def read(buffer):
+        seqs = next(batches, None)
+        if seqs is None:
+            return None
+        length = sum(container.chunk_length(header, seq) +
+                     container.TAG_SIZE for seq in seqs)
+        if limiter is not None:
+            limiter.consume(length)
+        end = source.readinto(memoryview(buffer)[:length])
+        reads.advance(end)
+        return seqs, end
+
+    def process(job, buffer):
+        seqs, end = job
+        plaintexts = []
+        position = 0
+        for seq in seqs:
+            length = container.chunk_length(header, seq) + container.TAG_SIZE
+            # A truncated record fails its authentication
+            record = memoryview(buffer)[position:min(position + length,
+                                                     end)].tobytes()
+            plaintexts.append(container.open_chunk(
+                header, keys, seq, record,
+                container.chunk_offset(header, data_offset, seq)))
+            if payload_digest is not None:
+                payload_digest.update(record)
+            position += length
+        return plaintexts
+
+    def write(job, plaintexts):
+        for seq, plaintext in zip(job[0], plaintexts):
+            if limiter is not None:
+                limiter.consume(len(plaintext))
+            archive.write(plaintext)
+            writes.advance(len(plaintext))
+            tracker.update(len(plaintext))
+            if (seq + 1) % interval == 0:
+                state['committed'] = seq + 1
+                _checkpoint(archive, journal, state)
+
+    try:
+        with profiling.stage('decrypt'):
+            pipeline.run(read, process, write, queue_depth,
+                         _batch_size(header, buffer_size,
+                                     container.TAG_SIZE))
+            reads.drop()
+            writes.drop()
+        with profiling.stage('verify'):
+            authentic = verified or \
+                _verify_trailer(source, header, header_bytes, data_offset,
+                                payload_digest, rsa_public_key)
+    except container.CorruptedChunkError as e:
+        authentic = False
+        print("[warning] This file has been corrupted, %s !" % e)
+    archive.close()
+    source.close()
+
+    if not authentic:
+        tools.secure_delete('source.tar', passes=1)
+        if os.path.isfile(journal):
+            os.remove(journal)
+        print("[warning] This file has been corrupted ! Don't use it !")
+        return False
+    tracker.finish()
+
+    _extract_payload(header, progress, limiter, io_mode)
+
+    # Delete container related files
+    with profiling.stage('delete'):
+        for eachfile in ['source.tar', cipherfile]:
+            tools.secure_delete(eachfile, passes=1)
+    if os.path.isfile(journal):
+        os.remove(journal)
+
+    return True
+
+
+def _extract_payload(header, progress=None, limiter=None, io_mode='cached'):
+    """Untar or unpack the decrypted payload source.tar in the CWD.
+
+    Out of the "cached" `io_mode`, the extracted files are flushed and
+    dropped from the page cache one by one.
+    """
+
+    tracker = Tracker(progress, 'extract', 0)
+    nocache = io_mode != 'cached'
+    with profiling.stage('extract'):
+        if header.get('payload') == 'packed':
+            tools.unpackfiles('source.tar', '.', tracker, nocache, limiter)
+        else:
+            tar = tarfile.open('source.tar')
+            members = tar.getmembers()
+            tracker.total = sum(member.size for member in members)
+            for member in members:
+                tools.extract_member(tar, member)
+                if nocache and member.isfile():
+                    pagecache.evict(member.name, written=True)
+                if limiter is not None:
+                    # Read then written
+                    limiter.consume(2 * member.size)
+                tracker.update(member.size)
+            tar.close()
+    tracker.finish()
+
+
+def _unlock_volumes(cipherfile, header, rsa_private_key, rsa_public_key,
+                    progress=None, limiter=None, workers=None,
+                    io_mode='cached', cache=None):
+    """Unlock a multi-volume container from any of its volumes.
+
+    The volumes are authenticated and decrypted concurrently, each one in
+    its slice of the temporary tar. They must all belong to the set of
+    `cipherfile` and cover the whole payload. At most `workers` volumes are
+    unlocked at once, twice the number of CPUs by default, the volumes being
+    read and the tar written in the `io_mode` of `pagecache`. The volumes
+    found in the `sigcache` file `cache` are not hashed.
+
+    :return: A boolean, True if the archive has been unlocked.
+    """
+
+    volume = header['volume']
+    base = container.volume_base(cipherfile, header)
+    paths = [container.volume_path(base, index)
+             for index in range(volume['count'])]
+    missing = [path for path in paths if not os.path.isfile(path)]
+    if missing:
+        print("[error] Missing volumes : %s" % ', '.join(missing))
+        return False
+
+    with open('source.tar', mode='wb') as archive:
+        archive.truncate(volume['size'])
+    tracker = Tracker(progress, 'decrypt', volume['size'])
+
+    def unlock_volume(index):
+        with open(paths[index], mode='rb') as source:
+            opened = _open_header(source, rsa_private_key, rsa_public_key)
+            if not opened:
+                return None
+            header, header_bytes, data_offset, keys = opened
+            current = header.get('volume', {})
+            if [current.get(field) for field in ('set', 'index', 'count',
+                                                 'size')] != \
+                    [volume['set'], index, volume['count'], volume['size']]:
+                print("[warning] %s does not belong to this archive !"
+                      % paths[index])
+                return None
+
+            # The volumes are already hashed concurrently, a limited
+            # number of workers is not multiplied by Merkle threads
+            verified = _cached_verification(cache, paths[index],
+                                            rsa_public_key)
+            payload_digest = None if verified else \
+                _new_digest(header, workers and 1)
+            with open('source.tar', mode='r+b') as archive:
+                archive.seek(current['offset'])
+                source.seek(data_offset)
+                reads = pagecache.DropBehind(source, False,
+                                             io_mode != 'cached')
+                writes = pagecache.DropBehind(archive, True,
+                                              io_mode != 'cached')
+                try:
+                    for seq in range(container.chunk_count(header)):
+                        record = source.read(
+                            container.chunk_length(header, seq) +
+                            container.TAG_SIZE)
+                        reads.advance(len(record))
+                        if limiter is not None:
+                            limiter.consume(len(record))
+                        plaintext = container.open_chunk(
+                            header, keys, seq, record,
+                            container.chunk_offset(header, data_offset,
+                                                   seq))
+                        if limiter is not None:
+                            limiter.consume(len(plaintext))
+                        archive.write(plaintext)
+                        writes.advance(len(plaintext))
+                        if payload_digest is not None:
+                            payload_digest.update(record)
+                        tracker.update(len(plaintext))
+                    reads.drop()
+                    writes.drop()
+                except container.CorruptedChunkError as e:
+                    print("[warning] %s has been corrupted, %s !"
+                          % (paths[index], e))
+                    return None
+            if not verified and \
+                    not _verify_trailer(source, header, header_bytes,
+                                        data_offset, payload_digest,
+                                        rsa_public_key):
+                return None
+
+            return current['offset'], header['payload_size']
+
+    pool = ThreadPool(min(volume['count'],
+                          workers or 2 * multiprocessing.cpu_count()))
+    try:
+        with profiling.stage('decrypt'):
+            slices = pool.map(unlock_volume, range(volume['count']))
+    finally:
+        pool.close()
+        pool.join()
+
+    # The volumes must follow each other without gap nor overlap
+    end = 0
+    for piece in slices:
+        if piece is None or piece[0] != end:
+            end = None
+            break
+        end += piece[1]
+    if end != volume['size']:
+        tools.secure_delete('source.tar', passes=1)
+        print("[warning] This file has been corrupted ! Don't use it !")
+        return False
+    tracker.finish()
+
+    _extract_payload(header, progress, limiter, io_mode)
+
+    # Delete container related files
+    with profiling.stage('delete'):
+        for eachfile in ['source.tar'] + paths:
+            tools.secure_delete(eachfile, passes=1)
+
+    return True
+
+
+def lock_objects(objects, rsa_private_key, rsa_public_key,
+                 chunk_size=container.CHUNK_SIZE, merkle=False,
+                 digest='sha256'):
+    """Lock in-memory objects.
+
+    This function lock `objects` in a chunked container without touching the
+    filesystem. The container is produced as it is read from the returned
+    file object, so that only one chunk is held in memory whatever the size
+    of the objects.
+
+    :parameter:
+     objects : dict
+        The contents of the files by name, as strings or seekable file
+        objects read from their current position.
+     rsa_private_key : string
+        RSA or ECC private key, as a PEM file or an imported key
+     rsa_public_key : string
+        RSA or ECC public key, as a PEM file or an imported key
+     chunk_size : int
+        The size in bytes of the chunks of the container.
+     merkle : boolean
+        True to sign the root of a Merkle tree of the chunks.
+     digest : string
+        The digest of all the chunks signed without `merkle`, one of
+        `container.DIGESTS`.
+
+    :raise AttributeError:
+            If there is no objects, a file object is not seekable or the
+            keys are not valid.
+
+    :return: A read-only file object, the chunked container.
+    """
+
+    rsa_private_key = keypair.import_key(rsa_private_key)
+    rsa_public_key = keypair.import_key(rsa_public_key)
+
+    manifest = []
+    payload_size, tar = tools.tar_objects(objects, manifest)
+    header, header_bytes, keys = _new_container(
+        rsa_private_key, rsa_public_key, payload_size, chunk_size, merkle,
+        manifest=manifest, digest=digest)
+
+    def generate():
+        out = io.BytesIO()
+        container.write_header(out, header_bytes,
+                               keypair.sign(rsa_private_key, header_bytes))
+        yield out.getvalue()
+
+        payload_digest = _new_digest(header)
+        for seq, plaintext in enumerate(tools.rechunk(tar,
+                                                      header['chunk_size'])):
+            record = container.seal_chunk(header, keys, seq, plaintext)
+            payload_digest.update(record)
+            yield record
+
+        out = io.BytesIO()
+        _write_trailer(out, header, header_bytes, payload_digest,
+                       rsa_private_key)
+        yield out.getvalue()
+
+    return tools.IteratorReader(generate())
+
+
+def unlock_to_objects(fileobj, rsa_private_key, rsa_public_key):
+    """Unlock a chunked container held in memory.
+
+    This function verify the header and the trailer of the container read
+    from `fileobj` without touching the filesystem, then return a stream
+    for each file. The streams authenticate and decrypt the chunks as they
+    are read, so that only one chunk is held in memory at a time.
+
+    :parameter:
+     fileobj : file
+        The chunked container, a seekable file object opened in binary
+        mode. It must stay open while the streams are read.
+     rsa_private_key : string
+        RSA or ECC private key, as a PEM file or an imported key
+     rsa_public_key : string
+        RSA or ECC public key, as a PEM file or an imported key
+
+    :raise CorruptedChunkError:
+            When a stream is read, if a chunk has been altered since the
+            container was verified.
+
+    :return: A dict of the file objects of the files by name, or None if
+    the container is not authentic.
+    """
+
+    rsa_private_key = keypair.import_key(rsa_private_key)
+    rsa_public_key = keypair.import_key(rsa_public_key)
+
+    try:
+        opened = _open_header(fileobj, rsa_private_key, rsa_public_key)
+    except ValueError as e:
+        print("[error] %s" % e)
+        return None
+    if not opened:
+        return None
+    header, header_bytes, data_offset, keys = opened
+    if header.get('payload') == 'packed':
+        print("[error] Only tar payloads can be unlocked in memory.")
+        return None
+
+    payload_digest = _payload_digest(header, fileobj, data_offset,
+                                     container.chunk_count(header))
+    if not _verify_trailer(fileobj, header, header_bytes, data_offset,
+                           payload_digest, rsa_public_key):
+        print("[warning] This file has been corrupted ! Don't use it !")
+        return None
+
+    tar = tarfile.open(fileobj=container.PayloadReader(fileobj, header, keys,
+                                                       data_offset),
+                       mode='r:')
+
+    return dict((member.name, tar.extractfile(member))
+                for member in tar.getmembers() if member.isfile())
+
+
+class _MemberReader(io.RawIOBase):
+    """Seekable read-only file object over the bytes of a file in the
+    payload of a container."""
+
+    def __init__(self, payload, offset, size):
+        self.payload = payload
+        self.offset = offset
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise IOError("Negative seek position %d." % offset)
+        self.position = offset
+        return self.position
+
+    def readinto(self, b):
+        size = max(0, min(len(b), self.size - self.position))
+        # The payload is shared by the files, seek it before every read
+        self.payload.seek(self.offset + self.position)
+        data = self.payload.read(size)
+        b[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class LockedArchive(object):
+    """Read the files of a chunked container without unlocking it.
+
+    The header of the container is verified and its session keys decrypted
+    once, then `open` returns a seekable read-only file object for a file
+    of the payload. Reading a range of a file only authenticates and
+    decrypts the chunks covering it, the last `cache_size` chunks being
+    kept, so that a few KB are read at any offset of a huge file without
+    decrypting the whole container.
+
+    The signature of the trailer and its binding to the header are checked
+    when the archive is opened, and in a Merkle container the digests of
+    the chunks are checked against the signed root, every chunk read being
+    then checked against its digest. The HMAC of every chunk is checked
+    whatever the integrity. With `verify`, the whole payload is also hashed
+    and checked against the trailer, as by `unlock_file`.
+
+    :parameter:
+     cipherfile : string
+        Name of the chunked container.
+     rsa_private_key : string
+        RSA or ECC private key, as a PEM file or an imported key
+     rsa_public_key : string
+        RSA or ECC public key, as a PEM file or an imported key
+     cache_size : int
+        The number of decrypted chunks to keep.
+     verify : boolean
+        True to hash the whole payload when the archive is opened.
+
+    :raise ValueError:
+            If `cipherfile` is not a chunked container or is not authentic.
+    """
+
+    def __init__(self, cipherfile, rsa_private_key, rsa_public_key,
+                 cache_size=CACHE_CHUNKS, verify=False):
+        rsa_private_key = keypair.import_key(rsa_private_key)
+        rsa_public_key = keypair.import_key(rsa_public_key)
+
+        self.f = open(cipherfile, mode='rb')
+        try:
+            self._open(rsa_private_key, rsa_public_key, cache_size, verify)
+        except:
+            self.f.close()
+            raise
+
+    def _open(self, rsa_private_key, rsa_public_key, cache_size, verify):
+        opened = _open_header(self.f, rsa_private_key, rsa_public_key)
+        if not opened:
+            raise ValueError("The header of the archive is not authentic.")
+        header, header_bytes, data_offset, keys = opened
+        if 'volume' in header:
+            raise ValueError("Only single volume archives can be read.")
+
+        statement, statement_bytes, rsa_signature = \
+            container.read_trailer(self.f, header, data_offset)
+        if not keypair.verify_sign(rsa_public_key, header['sign'],
+                                   rsa_signature, statement_bytes) or \
+                not container.statement_bound(statement, header_bytes):
+            raise ValueError("The trailer of the archive is not authentic.")
+        leaves = None
+        if 'merkle' in statement:
+            leaves = container.read_leaves(self.f, header, data_offset,
+                                           statement)
+        if verify and not _verify_trailer(
+                self.f, header, header_bytes, data_offset,
+                _payload_digest(header, self.f, data_offset,
+                                container.chunk_count(header)),
+                rsa_public_key):
+            raise ValueError("The payload of the archive is corrupted.")
+
+        self.header = header
+        self.payload = container.PayloadReader(self.f, header, keys,
+                                               data_offset, cache_size,
+                                               leaves)
+        self.members = collections.OrderedDict()
+        self.tar = None
+        if header.get('payload') == 'packed':
+            entries, offset = tools.read_pack_index(self.payload)
+            for entry in entries:
+                self.members[entry['name']] = \
+                    (offset + entry['offset'], entry['size'])
+        else:
+            self.tar = tarfile.open(fileobj=self.payload, mode='r:')
+            for member in self.tar.getmembers():
+                if member.isfile():
+                    self.members[member.name] = member
+
+    def names(self):
+        """Return the names of the files of the archive."""
+
+        return list(self.members)
+
+    def open(self, member):
+        """Open a file of the archive.
+
+        :parameter:
+         member : string
+            The name of the file.
+
+        :raise KeyError:
+                If the archive has no file `member`.
+        :raise CorruptedChunkError:
+                When the file object is read, if a chunk has been altered.
+
+        :return: A seekable read-only file object.
+        """
+
+        entry = self.members[member]
+        if self.tar is None:
+            return _MemberReader(self.payload, *entry)
+        if entry.issparse():
+            # The holes of a sparse file are not stored in the payload
+            return self.tar.extractfile(entry)
+
+        return _MemberReader(self.payload, entry.offset_data, entry.size)
+
+    def close(self):
+        """Close the container, the files opened can no longer be read."""
+
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def list_archive(cipherfile, rsa_private_key, rsa_public_key):
+    """List the files of an archive.
+
+    This function only verify the header of the chunked container
+    `cipherfile` and decrypt its manifest, or the chunks holding the index
+    of a packed payload, so it does not depend on the size of the payload
+    and leave the archive untouched. The files of a multi-volume container
+    are listed from its first volume, whichever volume is given.
+
+    :parameter:
+     cipherfile : string
+        Name of the archive to list.
+     rsa_private_key : string
+        RSA or ECC private key
+     rsa_public_key : string
+        RSA or ECC public key
+
+    :return: A list of dicts with the name, size, mtime, mode and sha256 of
+    each file, or None if the archive cannot be listed.
+    """
+
+    # Importe RSA or ECC keys from PEM
+    rsa_private_key = keypair.import_key(rsa_private_key)
+    rsa_public_key = keypair.import_key(rsa_public_key)
+
+    if not container.is_container(cipherfile):
+        print("[error] Only chunked containers can be listed.")
+        return None
+
+    return _list_container(cipherfile, rsa_private_key, rsa_public_key)
+
+
+def _list_container(cipherfile, rsa_private_key, rsa_public_key,
+                    volume_set=None):
+    """List the files of a chunked container, or of the first volume of the
+    set `volume_set` of a multi-volume container."""
+
+    with open(cipherfile, mode='rb') as source:
+        opened = _open_header(source, rsa_private_key, rsa_public_key)
+        if not opened:
+            return None
+        header, _, data_offset, keys = opened
+        volume = header.get('volume', {})
+
+        if volume_set is not None and \
+                [volume.get('set'), volume.get('index')] != [volume_set, 0]:
+            print("[warning] %s does not belong to this archive !"
+                  % cipherfile)
+            return None
+
+        # The manifest and the index are in the first volume
+        if volume.get('index', 0) > 0:
+            try:
+                first = container.volume_path(
+                    container.volume_base(cipherfile, header), 0)
+            except ValueError as e:
+                print("[error] %s" % e)
+                return None
+            if not os.path.isfile(first):
+                print("[error] The files are listed in the first volume "
+                      "%s, which is missing." % first)
+                return None
+            print("[info] Listing the files from the first volume %s."
+                  % first)
+            return _list_container(first, rsa_private_key, rsa_public_key,
+                                   volume['set'])
+
+        if header.get('payload') == 'packed':
+            entries, _ = tools.read_pack_index(container.PayloadReader(
+                source, header, keys, data_offset))
+            return [{'name': entry['name'], 'size': entry['size'],
+                     'mtime': entry['mtime'], 'mode': entry['mode'],
+                     'sha256': entry['sha256']} for entry in entries]
+
+    manifest = container.open_manifest(header, keys)
+    if manifest is None:
+        print("[error] This archive has no manifest.")
+
+    return manifest
+
+
+def verify_many(archives, rsa_public_key, workers=None, cache=None):
+    """Verify the signature of many archives.
+
+    This function check the archives `archives` with the RSA public key
+    `rsa_public_key` only, without decrypting nor extracting them. A chunked
+    container is streamed through SHA256 and its signed trailer checked, the
+    signed payload of a tar container is hashed by blocks and the signature
+    of its SHA256 checked. The archives are spread over a pool of `workers`
+    processes.
+
+    With a `cache`, the archives already verified and unchanged since are
+    not read again, and the ones verified are added to it.
+
+    :parameter:
+     archives : list
+        The names of the archives to verify.
+     rsa_public_key : string
+        RSA or ECC public key
+     workers : int
+        The number of processes to use, the number of CPUs by default.
+     cache : string
+        The path of a `sigcache` file of verified archives, None to verify
+        them all.
+
+    :return: A dict, the report of the verification with a result per
+    archive and the throughput of the whole run.
+    """
+
+    starttime = time.time()
+
+    # The keys are computed before the verification, so that an archive
+    # changed meanwhile is not remembered as verified
+    results = [None] * len(archives)
+    if cache is not None:
+        cache = sigcache.VerifiedCache(cache)
+        fingerprint = keypair.fingerprint(
+            keypair.import_key(rsa_public_key))
+        keys = [cache.key(archive, fingerprint) for archive in archives]
+        for index, archive in enumerate(archives):
+            if cache.contains(keys[index]):
+                results[index] = {'archive': archive, 'valid': True,
+                                  'bytes': os.path.getsize(archive),
+                                  'seconds': 0.0, 'error': None,
+                                  'cached': True}
+    missing = [index for index, result in enumerate(results)
+               if result is None]
+
+    verified = []
+    if missing:
+        pool = multiprocessing.Pool(workers)
+        try:
+            verified = pool.map(_verify_archive,
+                                [(archives[index], rsa_public_key)
+                                 for index in missing], chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    for index, result in zip(missing, verified):
+        results[index] = result
+        if cache is not None and result['valid']:
+            cache.add(keys[index])
+    if cache is not None:
+        cache.save()
+
+    elapsedtime = time.time() - starttime
+    size = sum(result['bytes'] for result in results)
+
+    return {'archives': results,
+            'total': len(results),
+            'valid': sum(1 for result in results if result['valid']),
+            'invalid': sum(1 for result in results if not result['valid']),
+            'cached': sum(1 for result in results if result['cached']),
+            'bytes': size,
+            'seconds': elapsedtime,
+            'mb_per_s': size / 1048576.0 / elapsedtime if elapsedtime else 0}
+
+
+def _verify_archive(args):
+    """Verify one archive, run in the processes of `verify_many`."""
+
+    cipherfile, rsa_public_key = args
+    result = {'archive': cipherfile, 'valid': False, 'bytes': 0,
+              'seconds': 0.0, 'error': None, 'cached': False}
+    starttime = time.time()
+
+    try:
+        result['bytes'] = os.path.getsize(cipherfile)
+        rsa_public_key = keypair.import_key(rsa_public_key)
+
+        if container.is_container(cipherfile):
+            with open(cipherfile, mode='rb') as source:
+                header, header_bytes, rsa_signature, data_offset = \
+                    container.read_header(source)
+                result['valid'] = \
+                    keypair.verify_sign(rsa_public_key, header['sign'],
+                                        rsa_signature, header_bytes) and \
+                    _verify_trailer(source, header, header_bytes,
+                                    data_offset,
+                                    _payload_digest(
+                                        header, source, data_offset,
+                                        container.chunk_count(header)),
+                                    rsa_public_key)
+        else:
+            # The signed payload is hashed by blocks, not read in memory
+            tar = tarfile.open(cipherfile)
+            raw_signature = tar.extractfile(
+                'encrypted_files_and_key.lkd.sign').read()
+            payload = tar.extractfile('encrypted_files_and_key.lkd')
+            result['valid'] = \
+                not keypair.is_ecc(rsa_public_key) and \
+                rsa.rsa_verify_sign_blocks(
+                    rsa_public_key, raw_signature,
+                    iter(lambda: payload.read(tools.STREAM_BLOCK_SIZE), b''))
+            tar.close()
+        if not result['valid']:
+            result['error'] = 'signature mismatch'
+    except Exception as e:
+        result['error'] = str(e) or e.__class__.__name__
+
+    result['seconds'] = time.time() - starttime
+
+    return result
+
+
+def rekey_many(archives, rsa_private_key, rsa_public_key, new_private_key,
+               new_public_key, workers=None):
+    """Wrap the session keys of many archives for new keys.
+
+    This function decrypt the session keys of the archives `archives` with
+    the private key `rsa_private_key`, encrypt them for the owner of
+    `new_public_key` and sign the archives again with `new_private_key`,
+    without decrypting nor encrypting their data.
+
+    The header and the trailer of a chunked container are checked with
+    `rsa_public_key` then rewritten in place, the new header fitting in the
+    padding before the first chunk. The trailer keeps the signed digests of
+    the chunks, which are not read. The original header and trailer are
+    saved in `archive`.rekey until both are written, so that an interrupted
+    rekey is rolled back by the next one.
+
+    A tar container is signed as a whole, it is read in memory and written
+    again with the new encrypted key and signature, then renamed over the
+    original. It needs RSA keys.
+
+    The archives are spread over a pool of `workers` processes.
+
+    :parameter:
+     archives : list
+        The names of the archives to rekey.
+     rsa_private_key : string
+        RSA or ECC private key the archives are locked for
+     rsa_public_key : string
+        RSA or ECC public key the archives are signed with
+     new_private_key : string
+        RSA or ECC private key to sign the archives with
+     new_public_key : string
+        RSA or ECC public key to lock the archives for
+     workers : int
+        The number of processes to use, the number of CPUs by default.
+
+    :return: A dict, the report of the rekey with a result per archive.
+    """
+
+    starttime = time.time()
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        results = pool.map(_rekey_archive,
+                           [(archive, rsa_private_key, rsa_public_key,
+                             new_private_key, new_public_key)
+                            for archive in archives], chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    return {'archives': results,
+            'total': len(results),
+            'rekeyed': sum(1 for result in results if result['rekeyed']),
+            'failed': sum(1 for result in results if not result['rekeyed']),
+            'seconds': time.time() - starttime}
+
+
+def _rekey_archive(args):
+    """Rekey one archive, run in the processes of `rekey_many`."""
+
+    cipherfile = args[0]
+    result = {'archive': cipherfile, 'rekeyed': False, 'seconds': 0.0,
+              'error': None}
+    starttime = time.time()
+
+    try:
+        keys = [keypair.import_key(key) for key in args[1:]]
+        if container.is_container(cipherfile):
+            _rekey_chunked(cipherfile, *keys)
+        else:
+            _rekey_tar(cipherfile, *keys)
+        result['rekeyed'] = True
+    except Exception as e:
+        result['error'] = str(e) or e.__class__.__name__
+
+    result['seconds'] = time.time() - starttime
+
+    return result
+
+
+def _rekey_chunked(cipherfile, rsa_private_key, rsa_public_key,
+                   new_private_key, new_public_key):
+    """Rewrite the header and the trailer of a chunked container for new
+    keys.
+
+    :raise ValueError:
+            If the container is not authentic, its keys cannot be wrapped
+            again or the new header does not fit before the first chunk.
+    """
+
+    backup = cipherfile + '.rekey'
+    with open(cipherfile, mode='r+b') as f:
+        _rollback_rekey(f, backup)
+
+        header, header_bytes, signature, data_offset = \
+            container.read_header(f)
+        statement, statement_bytes, statement_signature = \
+            container.read_trailer(f, header, data_offset)
+        if not keypair.verify_sign(rsa_public_key, header['sign'],
+                                   signature, header_bytes) or \
+                not keypair.verify_sign(rsa_public_key, header['sign'],
+                                        statement_signature,
+                                        statement_bytes):
+            raise ValueError("The archive is not authentic.")
+
+        raw = keypair.decrypt_key(rsa_private_key, header['kem'],
+                                  header['key'])
+        if not raw:
+            raise ValueError("The session keys cannot be decrypted.")
+        encrypted_key = keypair.encrypt_key(new_public_key, raw)
+        if not encrypted_key:
+            raise ValueError("The session keys cannot be encrypted.")
+
+        header.update(key=encrypted_key,
+                      kem=keypair.kem_algorithm(new_public_key),
+                      sign=keypair.sign_algorithm(new_private_key))
+        new_header_bytes = container.encode_header(header)
+        new_signature = keypair.sign(new_private_key, new_header_bytes)
+        if container.PREAMBLE.size + len(new_header_bytes) + \
+                len(new_signature) > data_offset:
+            raise ValueError("The new header does not fit before the first "
+                             "chunk.")
+        new_statement = container.rebind_statement(
+            statement, header_bytes, new_header_bytes)
+
+        # Save the original header and trailer until both are rewritten
+        start = container.statement_offset(header, data_offset, statement)
+        f.seek(0)
+        head = f.read(data_offset)
+        f.seek(start)
+        tools.save_journal(backup, {'header': head.encode('hex'),
+                                    'trailer': f.read().encode('hex'),
+                                    'offset': start})
+
+        f.seek(0)
+        container.write_header(f, new_header_bytes, new_signature,
+                               data_offset)
+        f.seek(start)
+        container.write_trailer(f, new_statement,
+                                keypair.sign(new_private_key,
+                                             new_statement))
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.remove(backup)
+
+
+def _rollback_rekey(f, backup):
+    """Restore the header and the trailer saved by an interrupted rekey."""
+
+    state = tools.load_journal(backup)
+    if state is None:
+        return
+    print("[info] Rolling back the interrupted rekey of %s." % f.name)
+
+    f.seek(0)
+    f.write(state['header'].decode('hex'))
+    f.seek(state['offset'])
+    f.write(state['trailer'].decode('hex'))
+    f.truncate()
+    f.flush()
+    os.fsync(f.fileno())
+    os.remove(backup)
+
+
+def _rekey_tar(cipherfile, rsa_private_key, rsa_public_key, new_private_key,
+               new_public_key):
+    """Rewrite a tar container with its key encrypted for new keys.
+
+    :raise ValueError:
+            If the container is not authentic, the keys are not RSA keys or
+            the AES key cannot be wrapped again.
+    """
+
+    if any(keypair.is_ecc(key) for key in (rsa_private_key, rsa_public_key,
+                                           new_private_key, new_public_key)):
+        raise ValueError("A tar container needs RSA keys.")
+
+    tar = tarfile.open(cipherfile)
+    outer = tar.getmember('encrypted_files_and_key.lkd')
+    signature_info = tar.getmember('encrypted_files_and_key.lkd.sign')
+    raw_signature = tar.extractfile(signature_info).read()
+    raw_files = tar.extractfile(outer).read()
+    tar.close()
+    if not rsa.rsa_verify_sign(rsa_public_key, raw_signature, raw_files):
+        raise ValueError("The archive is not authentic.")
+
+    # Replace the encrypted key, the encrypted files being copied as is
+    inner = tarfile.open(fileobj=io.BytesIO(raw_files))
+    ciphertar = io.BytesIO()
+    rewritten = tarfile.open(fileobj=ciphertar, mode='w')
+    for member in inner.getmembers():
+        data = inner.extractfile(member).read()
+        if member.name == 'cipherkey.lkd':
+            aes_key = rsa.rsa_decrypt(rsa_private_key, data)
+            data = aes_key and rsa.rsa_encrypt(new_public_key, aes_key)
+            if not data:
+                raise ValueError("The AES key cannot be wrapped again.")
+            member.size = len(data)
+        rewritten.addfile(member, io.BytesIO(data))
+    rewritten.close()
+    raw_files = ciphertar.getvalue()
+    raw_signature = rsa.rsa_sign(new_private_key, raw_files)
+
+    # Write the new container beside the original then replace it
+    tmp = cipherfile + '.tmp'
+    tar = tarfile.open(tmp, mode='w')
+    signature_info.size = len(raw_signature)
+    tar.addfile(signature_info, io.BytesIO(raw_signature))
+    outer.size = len(raw_files)
+    tar.addfile(outer, io.BytesIO(raw_files))
+    tar.close()
+    with open(tmp, mode='rb') as f:
+        os.fsync(f.fileno())
+    os.rename(tmp, cipherfile)
+
+
 __author__ = 'Hakan Kuesne and Mathieu Devaud'
 __since__ = '2016-05-01'
 __date__ = '2016-05-16'
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2016 Hakan Kuesne && Mathieu Devaud
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" This module provides Merkle tree methods.
+
+The leaves are hashed with a 0x00 prefix and the nodes with a 0x01 prefix,
+so that a leaf cannot be passed off as a node. A node without sibling is
+promoted to the upper level as is.
+
+Hashing runs in threads, hashlib releasing the GIL on large buffers, so the
+leaves of a file are hashed on every core.
+"""
+
+
+import hashlib
+import hmac
+import multiprocessing
+import threading
+from multiprocessing.pool import ThreadPool
+
+DIGEST_SIZE = 32
+
+
+def leaf_hash(data):
+    """Return the SHA256 digest of a leaf."""
+
+    return hashlib.sha256(b'\x00' + data).digest()
+
+
+def node_hash(left, right):
+    """Return the SHA256 digest of a node from its two children."""
+
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def root(leaves):
+    """Compute the root of a Merkle tree.
+
+    :parameter:
+     leaves : list
+        The digests of the leaves, in order.
+
+    :return: A string, the digest of the root.
+    """
+
+    level = list(leaves) or [leaf_hash(b'')]
+    while len(level) > 1:
+        upper = [node_hash(level[i], level[i + 1])
+                 for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            upper.append(level[-1])
+        level = upper
+
+    return level[0]
+
+
+def verify_leaf(leaves, index, data):
+    """Tell if `data` is the leaf `index` of the verified `leaves`."""
+
+    return 0 <= index < len(leaves) and \
+        hmac.compare_digest(leaf_hash(data), leaves[index])
+
+
+def hash_leaves(path, ranges, workers=None):
+    """Hash ranges of a file as leaves, in parallel.
+
+    :parameter:
+     path : string
+        The file to read.
+     ranges : list
+        The (offset, length) of each leaf in the file.
+     workers : int
+        The number of threads to use, the number of CPUs by default.
+
+    :return: A list, the digests of the leaves in the order of `ranges`.
+    """
+
+    local = threading.local()
+
+    def hash_range(leaf_range):
+        if not hasattr(local, 'f'):
+            local.f = open(path, 'rb')
+        local.f.seek(leaf_range[0])
+        return leaf_hash(local.f.read(leaf_range[1]))
+
+    pool = ThreadPool(workers or multiprocessing.cpu_count())
+    try:
+        return pool.map(hash_range, ranges, chunksize=16)
+    finally:
+        pool.close()
+        pool.join()
+
+
+class LeafHasher(object):
+    """Hash leaves in background threads while they are produced.
+
+    At most twice as many leaves as threads are kept in memory, `update`
+    blocking until the oldest one is hashed.
+    """
+
+    def __init__(self, leaves=None, workers=None):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.pool = ThreadPool(self.workers)
+        self.pending = []
+        self.leaves = list(leaves or [])
+
+    def update(self, data):
+        self.pending.append(self.pool.apply_async(leaf_hash, (data,)))
+        if len(self.pending) > 2 * self.workers:
+            self.leaves.append(self.pending.pop(0).get())
+
+    def finish(self):
+        """Wait for the pending leaves and return all the digests."""
+
+        self.leaves.extend(result.get() for result in self.pending)
+        self.pending = []
+        self.pool.close()
+        self.pool.join()
+
+        return self.leaves
+
+
+__author__ = 'Hakan Kuesne and Mathieu Devaud'
+__since__ = '2016-05-01'
+__date__ = '2016-05-16'
+__version__ = '1.0'
+__email__ = 'hakan@kusne.ch;mathieu.devaud@hefr.ch'
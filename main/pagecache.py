@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2016 Hakan Kuesne && Mathieu Devaud
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" This module provides page-cache-friendly I/O methods.
+
+A lock or an unlock reads and writes every byte once, so caching them only
+evicts the hot data of the other processes. The I/O modes are :
+
+ cached
+    The default, the kernel caches everything.
+ nocache
+    The files are read and written sequentially and the pages behind the
+    cursors are dropped with posix_fadvise, the written ones being flushed
+    first.
+ direct
+    As nocache, the payload being read with O_DIRECT in aligned buffers so
+    that it never enters the page cache.
+
+Python 2 has no os.posix_fadvise, it is called from the libc with ctypes.
+Where it is not available, the hints are silently skipped.
+"""
+
+
+import ctypes
+import ctypes.util
+import io
+import mmap
+import os
+
+MODES = ('cached', 'nocache', 'direct')
+
+# Drop the pages behind the cursors every 8 MB
+WINDOW = 8 * 1024 * 1024
+# Alignment of the offsets, sizes and buffers of O_DIRECT
+ALIGNMENT = 4096
+
+POSIX_FADV_SEQUENTIAL = 2
+POSIX_FADV_DONTNEED = 4
+
+_libc = None
+
+
+def _posix_fadvise():
+    """Return the posix_fadvise function of the libc, or None."""
+
+    global _libc
+    if _libc is None:
+        try:
+            _libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                                use_errno=True)
+            _libc.posix_fadvise.argtypes = [ctypes.c_int, ctypes.c_longlong,
+                                            ctypes.c_longlong, ctypes.c_int]
+        except (AttributeError, OSError, TypeError):
+            _libc = False
+    return getattr(_libc, 'posix_fadvise', None) if _libc else None
+
+
+def fadvise(f, offset, length, advice):
+    """Give an access pattern hint for a range of a file.
+
+    :parameter:
+     f : file
+        The file, or its descriptor.
+     offset : int
+        The start of the range.
+     length : int
+        The length of the range, 0 up to the end of the file.
+     advice : int
+        The POSIX_FADV_* hint.
+
+    :return: A boolean, True if the hint has been given.
+    """
+
+    fd = f if isinstance(f, int) else f.fileno()
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(fd, offset, length, advice)
+        return True
+    function = _posix_fadvise()
+    return function is not None and function(fd, offset, length,
+                                             advice) == 0
+
+
+class DropBehind(object):
+    """Drop the cached pages behind the cursor of a sequential file.
+
+    The cursor is advanced with the bytes read or written, and every
+    `window` bytes the pages behind it are dropped. The written pages are
+    flushed to the disk first, as dirty pages cannot be dropped. Disabled,
+    it does nothing.
+
+    :parameter:
+     f : file
+        The file, at the start of the sequential access.
+     write : boolean
+        True if the file is written, False if it is read.
+     enabled : boolean
+        False to keep the default caching.
+    """
+
+    def __init__(self, f, write=False, enabled=True, window=WINDOW):
+        self.f = f
+        self.write = write
+        self.enabled = enabled
+        self.window = window
+        if enabled:
+            self.start = self.position = f.tell()
+            fadvise(f, 0, 0, POSIX_FADV_SEQUENTIAL)
+
+    def advance(self, size):
+        """Move the cursor `size` bytes forward."""
+
+        if self.enabled:
+            self.move_to(self.position + size)
+
+    def move_to(self, position):
+        """Move the cursor forward to `position`."""
+
+        if not self.enabled:
+            return
+        self.position = position
+        if self.position - self.start >= self.window:
+            self.drop()
+
+    def drop(self):
+        """Drop the pages between the last drop and the cursor."""
+
+        if not self.enabled or self.position == self.start:
+            return
+        if self.write:
+            self.f.flush()
+            os.fdatasync(self.f.fileno())
+        fadvise(self.f, self.start, self.position - self.start,
+                POSIX_FADV_DONTNEED)
+        self.start = self.position
+
+
+def evict(path, written=False):
+    """Drop the cached pages of a file, flushed first if it was `written`."""
+
+    try:
+        with open(path, 'rb') as f:
+            if written:
+                os.fdatasync(f.fileno())
+            return fadvise(f, 0, 0, POSIX_FADV_DONTNEED)
+    except (IOError, OSError):
+        return False
+
+
+class DirectReader(io.RawIOBase):
+    """Read a file with O_DIRECT, bypassing the page cache.
+
+    The data is read in an aligned buffer then copied in the buffer given
+    to `readinto`, whose size must be a multiple of `ALIGNMENT` except at
+    the end of the file. The offsets given to `seek` must be aligned.
+
+    :parameter:
+     path : string
+        The file to read.
+     buffer_size : int
+        The largest size read at once.
+    """
+
+    def __init__(self, path, buffer_size):
+        self.raw = io.FileIO(os.open(path, os.O_RDONLY | os.O_DIRECT), 'r')
+        size = -(-buffer_size // ALIGNMENT) * ALIGNMENT
+        # An anonymous map is aligned on a page
+        self.map = mmap.mmap(-1, size)
+        self.view = memoryview((ctypes.c_char * size).from_buffer(self.map))
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self.raw.seek(offset, whence)
+
+    def tell(self):
+        return self.raw.tell()
+
+    def readinto(self, b):
+        length = len(b)
+        aligned = -(-length // ALIGNMENT) * ALIGNMENT
+        done = 0
+        while done < aligned:
+            n = self.raw.readinto(self.view[done:aligned])
+            if not n:
+                break
+            done += n
+        if done > length:
+            raise IOError("Unaligned O_DIRECT read of %d bytes." % length)
+        b[:done] = self.view[:done]
+        return done
+
+    def close(self):
+        if not self.closed:
+            self.raw.close()
+            del self.view
+            self.map.close()
+        super(DirectReader, self).close()
+
+
+def open_reader(path, mode, buffer_size):
+    """Open a file to read it sequentially in an I/O mode.
+
+    :parameter:
+     path : string
+        The file to read.
+     mode : string
+        One of `MODES`.
+     buffer_size : int
+        The largest size read at once, for O_DIRECT.
+
+    :return: A tuple (file, direct), the file opened in binary read mode and
+    True if it bypasses the page cache. O_DIRECT falls back to a regular
+    file if the system or the filesystem does not support it.
+    """
+
+    if mode == 'direct' and hasattr(os, 'O_DIRECT'):
+        try:
+            return DirectReader(path, buffer_size), True
+        except (OSError, IOError):
+            pass
+    return open(path, mode='rb'), False
+
+
+__author__ = 'Hakan Kuesne and Mathieu Devaud'
+__since__ = '2016-05-01'
+__date__ = '2016-05-16'
+__version__ = '1.0'
+__email__ = 'hakan@kusne.ch;mathieu.devaud@hefr.ch'
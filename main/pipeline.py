@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2016 Hakan Kuesne && Mathieu Devaud
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" This module provides a pipelined read, process and write engine.
+
+A reader thread fills buffers taken from a pool, the calling thread
+processes them and gives them back to the pool, and a writer thread writes
+the results. The queues are bounded by the number of buffers, so that the
+disk is read and written while the CPU encrypts, with a fixed amount of
+memory. AES, HMAC and SHA256 release the GIL on large buffers, so the three
+stages really overlap.
+"""
+
+
+import Queue
+import sys
+import threading
+
+# Number of buffers in flight between the stages
+DEPTH = 4
+# Size in bytes of each buffer
+BUFFER_SIZE = 4 * 1024 * 1024
+
+_STOP = object()
+
+
+def run(read, process, write, depth=DEPTH, buffer_size=BUFFER_SIZE):
+    """Run a pipeline until `read` has no more jobs.
+
+    :parameter:
+     read : function
+        Called in the reader thread with a bytearray of `buffer_size` bytes
+        to fill, returns a job describing what was read, or None at the
+        end.
+     process : function
+        Called in the calling thread with a job and its buffer, returns the
+        result to write. The buffer is reused once it returns, so it must
+        not be kept.
+     write : function
+        Called in the writer thread with a job and its result, in the order
+        of the jobs.
+     depth : int
+        The number of buffers, the pipeline running serially in the calling
+        thread if lower than 1.
+     buffer_size : int
+        The size in bytes of the buffers.
+
+    :raise Exception:
+            The first exception raised by a stage, the others being stopped.
+    """
+
+    if depth < 1:
+        buffer = bytearray(buffer_size)
+        job = read(buffer)
+        while job is not None:
+            write(job, process(job, buffer))
+            job = read(buffer)
+        return
+
+    free = Queue.Queue()
+    for _ in range(depth):
+        free.put(bytearray(buffer_size))
+    filled = Queue.Queue()
+    done = Queue.Queue(depth)
+    errors = []
+    stop = threading.Event()
+
+    def reader():
+        while True:
+            buffer = free.get()
+            if buffer is _STOP or stop.is_set():
+                return
+            try:
+                job = read(buffer)
+            except BaseException:
+                errors.append(sys.exc_info()[1])
+                job = None
+            filled.put((job, buffer))
+            if job is None:
+                return
+
+    def writer():
+        while True:
+            item = done.get()
+            if item is _STOP:
+                return
+            if not errors:
+                try:
+                    write(*item)
+                except BaseException:
+                    errors.append(sys.exc_info()[1])
+
+    threads = [threading.Thread(target=reader),
+               threading.Thread(target=writer)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        while not errors:
+            job, buffer = filled.get()
+            if job is None:
+                break
+            result = process(job, buffer)
+            free.put(buffer)
+            done.put((job, result))
+    finally:
+        stop.set()
+        free.put(_STOP)
+        done.put(_STOP)
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+__author__ = 'Hakan Kuesne and Mathieu Devaud'
+__since__ = '2016-05-01'
+__date__ = '2016-05-16'
+__version__ = '1.0'
+__email__ = 'hakan@kusne.ch;mathieu.devaud@hefr.ch'
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2016 Hakan Kuesne && Mathieu Devaud
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" This module provides profiling methods.
+
+A profiled lock or unlock is run under cProfile, in the calling thread and
+in the pipeline and volume threads it starts, while the stacks of all the
+threads are sampled. The blocks of the lock and unlock are tagged with
+their stage : tar, pad, encrypt, base64, sign, delete...
+
+The profile is written as pstats, to be read with the pstats module, and
+the samples as collapsed stacks, one line per stack starting with its
+stages followed by the number of samples, to be read with flamegraph.pl or
+speedscope.
+"""
+
+
+import cProfile
+import collections
+import contextlib
+import os
+import pstats
+import sys
+import threading
+import time
+
+# Sample the stacks of the threads every 5 ms
+INTERVAL = 0.005
+
+# The profiler of the running lock or unlock
+_active = None
+
+
+class _Untagged(object):
+    """The stage of a block run without profiler, doing nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class Profiler(object):
+    """Profile a block and sample the stacks of its threads.
+
+    :parameter:
+     path : string
+        The pstats file, the collapsed stacks being written next to it with
+        the .folded extension.
+     interval : float
+        The time in seconds between two samples.
+    """
+
+    def __init__(self, path, interval=INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.profile = cProfile.Profile()
+        self.thread_profiles = []
+        self.samples = collections.Counter()
+        self.times = collections.OrderedDict()
+        self.tags = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.owner = threading.current_thread().ident
+        self.sampler = threading.Thread(target=self._sample)
+        self.sampler.daemon = True
+
+    def start(self):
+        """Start the profile in the calling thread, in the threads started
+        from now on and the sampling."""
+
+        self.sampler.start()
+        threading.setprofile(self._profile_thread)
+        self.profile.enable()
+
+    def stop(self):
+        """Stop the profile and write the pstats and the collapsed stacks."""
+
+        self.profile.disable()
+        threading.setprofile(None)
+        self.stopped.set()
+        self.sampler.join()
+
+        stats = pstats.Stats(self.profile)
+        for profile in self.thread_profiles:
+            try:
+                stats.add(profile)
+            except TypeError:
+                # A thread which has not called any function
+                pass
+        stats.dump_stats(self.path)
+        with open(folded_path(self.path), 'w') as f:
+            for stack, count in sorted(self.samples.items()):
+                f.write("%s %d\n" % (stack, count))
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Tag the block run by the calling thread as the stage `name`."""
+
+        ident = threading.current_thread().ident
+        with self.lock:
+            tags = self.tags.setdefault(ident, [])
+            tags.append(name)
+            key = ';'.join(self._stages(ident))
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            with self.lock:
+                tags.pop()
+                self.times[key] = self.times.get(key, 0.0) + elapsed
+
+    def report(self):
+        """Print the time spent in each stage, by all the threads."""
+
+        for key, elapsed in self.times.items():
+            print("[profile] %-32s %9.3f s" % (key, elapsed))
+        print("[info] Profile written in %s and %s"
+              % (self.path, folded_path(self.path)))
+
+    def _profile_thread(self, frame, event, arg):
+        """Profile a new thread, called on its first event."""
+
+        profile = cProfile.Profile()
+        with self.lock:
+            self.thread_profiles.append(profile)
+        profile.enable()
+
+    def _sample(self):
+        """Count the stacks of the threads until the profile is stopped."""
+
+        own = threading.current_thread().ident
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, frame in frames.items():
+                    if ident == own:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append("%s.%s" % (os.path.splitext(
+                            os.path.basename(code.co_filename))[0],
+                            code.co_name))
+                        frame = frame.f_back
+                    self.samples[';'.join(self._stages(ident) +
+                                          stack[::-1])] += 1
+
+    def _stages(self, ident):
+        """Return the stages of a thread, the other threads running in the
+        stage of the calling thread."""
+
+        stages = list(self.tags.get(ident, []))
+        if ident != self.owner:
+            stages = self.tags.get(self.owner, []) + stages
+        return stages
+
+
+def folded_path(path):
+    """Return the path of the collapsed stacks of the profile `path`."""
+
+    return os.path.splitext(path)[0] + '.folded'
+
+
+@contextlib.contextmanager
+def profiled(path, name):
+    """Profile the block as the stage `name` if `path` is not None.
+
+    The profiles do not nest, a block run in a profiled one only being
+    tagged as a stage.
+
+    :parameter:
+     path : string
+        The pstats file to write, None to not profile.
+     name : string
+        The stage of the block, "lock" or "unlock".
+    """
+
+    global _active
+    if path is None or _active is not None:
+        with stage(name):
+            yield
+        return
+
+    profiler = Profiler(path)
+    _active = profiler
+    profiler.start()
+    try:
+        with profiler.stage(name):
+            yield
+    finally:
+        _active = None
+        profiler.stop()
+        profiler.report()
+
+
+def stage(name):
+    """Return a context manager tagging its block as the stage `name` of
+    the running profile, doing nothing if there is none."""
+
+    profiler = _active
+    if profiler is None:
+        return _Untagged()
+    return profiler.stage(name)
+
+
+__author__ = 'Hakan Kuesne and Mathieu Devaud'
+__since__ = '2016-05-01'
+__date__ = '2016-05-16'
+__version__ = '1.0'
+__email__ = 'hakan@kusne.ch;mathieu.devaud@hefr.ch'
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2016 Hakan Kuesne && Mathieu Devaud
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" This module provides progress reporting methods.
+
+A progress callback is called as `callback(stage, done, total, mb_per_s)`
+with the name of the stage, the bytes done and the total bytes of the stage
+and the current throughput, at most every `INTERVAL` seconds and once when
+the stage is finished.
+"""
+
+
+import json
+import sys
+import threading
+import time
+
+# Minimum delay in seconds between two events of a stage
+INTERVAL = 0.5
+
+MB = 1024 * 1024.0
+
+
+class Tracker(object):
+    """Track the bytes done in a stage and report them to a callback.
+
+    The tracker can be updated from several threads. Without callback, the
+    updates do nothing.
+
+    :parameter:
+     callback : function
+        The progress callback, or None.
+     stage : string
+        The name of the stage.
+     total : int
+        The total bytes of the stage.
+    """
+
+    def __init__(self, callback, stage, total, interval=INTERVAL):
+        self.callback = callback
+        self.stage = stage
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.lock = threading.Lock()
+        self.start = self.last_time = time.time()
+        self.last_done = 0
+
+    def update(self, size):
+        """Add `size` bytes done, reporting them if the interval elapsed."""
+
+        if self.callback is None:
+            return
+        with self.lock:
+            self.done += size
+            now = time.time()
+            # The last event of the stage is reported by `finish`
+            if now - self.last_time < self.interval or \
+                    self.done >= self.total:
+                return
+            rate = (self.done - self.last_done) / MB / (now - self.last_time)
+            self.last_time = now
+            self.last_done = self.done
+            done = self.done
+        self.callback(self.stage, done, self.total, rate)
+
+    def finish(self):
+        """Report the end of the stage with its average throughput."""
+
+        if self.callback is None:
+            return
+        with self.lock:
+            elapsed = max(time.time() - self.start, 1e-9)
+            self.done = max(self.done, self.total)
+        self.callback(self.stage, self.done, self.total,
+                      self.done / MB / elapsed)
+
+
+def console(stream=sys.stderr):
+    """Return a callback printing a progress line with an ETA."""
+
+    def callback(stage, done, total, mb_per_s):
+        percent = 100.0 * done / total if total else 100.0
+        if done >= total:
+            eta = 'done'
+        elif mb_per_s > 0:
+            eta = 'ETA %s' % time.strftime(
+                '%H:%M:%S', time.gmtime((total - done) / MB / mb_per_s))
+        else:
+            eta = 'ETA --:--:--'
+        stream.write("\r[progress] %-8s %5.1f %% %10.1f / %.1f MB "
+                     "%8.1f MB/s %s   " % (stage, percent, done / MB,
+                                           total / MB, mb_per_s, eta))
+        if done >= total:
+            stream.write("\n")
+        stream.flush()
+
+    return callback
+
+
+def json_lines(stream=sys.stdout):
+    """Return a callback printing every event as a line of JSON."""
+
+    def callback(stage, done, total, mb_per_s):
+        stream.write(json.dumps({'stage': stage, 'done': done,
+                                 'total': total, 'mb_per_s': mb_per_s,
+                                 'time': time.time()},
+                                sort_keys=True) + "\n")
+        stream.flush()
+
+    return callback
+
+
+__author__ = 'Hakan Kuesne and Mathieu Devaud'
+__since__ = '2016-05-01'
+__date__ = '2016-05-16'
+__version__ = '1.0'
+__email__ = 'hakan@kusne.ch;mathieu.devaud@hefr.ch'
@@ -17,11 +17,9 @@
 """ This module provides rsa methods. """
 
 
-from Crypto.PublicKey import RSA
-from Crypto.Cipher import PKCS1_OAEP
-from Crypto.Signature import PKCS1_PSS
-from Crypto.Hash import SHA256
-from base64 import b64decode
+from base64 import b64decode, b64encode
+
+import backend
 
 
 def gen_rsa_keys(bits):
@@ -47,20 +45,20 @@ def gen_rsa_keys(bits):
 
     try:
         # generate a private and a public rsa key
-        new_key = RSA.generate(bits, e=65537)
+        new_key = backend.get_backend().rsa_generate(bits)
         # store the public key in a pem format
-        pub_key = new_key.publickey()
+        pub_key = public_key(new_key)
         # store the private key in a pem format
         priv_key = new_key
 
         # save private key in a PEM file priv_key.pem
         f = open('priv_key.pem', 'w')
-        f.write(new_key.exportKey('PEM'))
+        f.write(backend.get_backend().rsa_export(priv_key))
         f.close()
 
         # save public key in a PEM file pub_key.pem
         f = open('pub_key.pem', 'w')
-        f.write(new_key.publickey().exportKey('PEM'))
+        f.write(backend.get_backend().rsa_export(pub_key))
         f.close()
 
     except ValueError:
@@ -72,6 +70,29 @@ def gen_rsa_keys(bits):
     return priv_key, pub_key
 
 
+def import_key(path):
+    """Import an RSA key.
+
+    This function import a private or a public RSA key from a PEM file with
+    the selected backend.
+
+    :parameter:
+     path : string
+        The path of the PEM file.
+
+    :return: An RSA key object.
+    """
+
+    with open(path, 'rb') as f:
+        return backend.get_backend().rsa_import(f.read())
+
+
+def public_key(priv_key):
+    """Return the public key of the RSA private key `priv_key`."""
+
+    return backend.get_backend().rsa_public(priv_key)
+
+
 def rsa_encrypt(pub_key, plaintext):
     """Encrypt the plaintext with RSA.
 
@@ -88,16 +109,15 @@ def rsa_encrypt(pub_key, plaintext):
     """
 
     try:
-        # create PKCS1 OAEP cipher to perform encryption
-        cipherer = PKCS1_OAEP.new(pub_key)
-        # encrypt the plaintext
-        rsa_ciphertext = cipherer.encrypt(plaintext)
+        # encrypt the plaintext with PKCS1 OAEP
+        rsa_ciphertext = backend.get_backend().rsa_oaep_encrypt(pub_key,
+                                                                plaintext)
     except ValueError:
         print("[error] RSA encryption failed")
         return False
 
     # encode the ciphertext in base64
-    return rsa_ciphertext.encode('base64')
+    return b64encode(rsa_ciphertext)
 
 
 def rsa_decrypt(priv_key, rsa_ciphertext):
@@ -116,10 +136,9 @@ def rsa_decrypt(priv_key, rsa_ciphertext):
     """
 
     try:
-        # create PKCS1 OAEP cipher to perform decryption
-        cipherer = PKCS1_OAEP.new(priv_key)
-        # decode then decrypt the ciphertext
-        rsa_plaintext = cipherer.decrypt(b64decode(rsa_ciphertext))
+        # decode then decrypt the ciphertext with PKCS1 OAEP
+        rsa_plaintext = backend.get_backend().rsa_oaep_decrypt(
+            priv_key, b64decode(rsa_ciphertext))
     except (ValueError, TypeError):
         print("[error] RSA decryption failed")
         return False
@@ -142,14 +161,8 @@ def rsa_sign(priv_key, payload):
     :return: A string, the RSA-PSS signature of the payload.
     """
 
-    # prepare the SHA256 hash
-    h = SHA256.new()
-    # create the SHA256 hash of the payload
-    h.update(payload)
-    # prepare the PKCS1-PSS signature with the private key
-    signer = PKCS1_PSS.new(priv_key)
-    # sign the hash
-    thesignature = signer.sign(h)
+    # sign the SHA256 hash of the payload with PKCS1-PSS
+    thesignature = backend.get_backend().rsa_pss_sign(priv_key, payload)
 
     return thesignature
 
@@ -172,14 +185,9 @@ def rsa_verify_sign(pub_key, rsa_signature, payload):
     false if not.
     """
 
-    # prepare the SHA256 hash
-    h = SHA256.new()
-    # create the SHA256 hash of the payload
-    h.update(payload)
-    # prepare the PKCS1-PSS signature with the public key
-    verifier = PKCS1_PSS.new(pub_key)
-
-    if verifier.verify(h, rsa_signature):
+    # verify the PKCS1-PSS signature of the SHA256 hash of the payload
+    if backend.get_backend().rsa_pss_verify(pub_key, rsa_signature,
+                                            payload):
         sign_ok = True
     else:
         sign_ok = False
@@ -187,6 +195,33 @@ def rsa_verify_sign(pub_key, rsa_signature, payload):
     return sign_ok
 
 
+
+def rsa_verify_sign_blocks(pub_key, rsa_signature, blocks):
+    """Verify the signature of a payload read by blocks.
+
+    This function hash the blocks of the payload one by one, so that the
+    payload is never held in memory, and control the RSA-PSS signature of
+    the hash using the public key of the source.
+
+    :parameter:
+     pub_key : RSA key object
+        The rsa public key use to verify the signature.
+     rsa_signature : string
+        The signature of the payload.
+     blocks : iterable
+        The strings of the payload, in order.
+
+    :return: A boolean, true if the signature is verified for the payload or
+    false if not.
+    """
+
+    thebackend = backend.get_backend()
+    digest = thebackend.sha256()
+    for block in blocks:
+        digest.update(block)
+
+    return thebackend.rsa_pss_verify_hash(pub_key, rsa_signature, digest)
+
 __author__ = 'Hakan Kuesne and Mathieu Devaud'
 __since__ = '2016-05-01'
 __date__ = '2016-05-16'
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2016 Hakan Kuesne && Mathieu Devaud
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" This module provides a persistent cache of verified signatures.
+
+An archive whose signature has been verified is remembered under a key
+made of its path, device, inode, size, mtime and ctime, the fingerprint of
+the public key and the digest of its head and tail, which hold the signed
+header and trailer of a chunked container. The bytes in between are only
+covered by the times of the file : a write changes its ctime, which unlike
+the mtime cannot be set back by its owner, so a file written since it was
+verified is hashed again. Replacing the file or the cache still needs the
+rights of their owner, or of root, who can change the clock.
+
+Only successful verifications are cached. The cache is a JSON file readable
+by its owner only, as whoever can write it can have any archive accepted.
+"""
+
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cryptical',
+                            'verified.json')
+# Maximum number of entries, the least recently used being evicted
+MAX_ENTRIES = 10000
+# Size in bytes of the head and of the tail of the archive in its digest
+EDGE_SIZE = 64 * 1024
+
+
+def container_digest(f):
+    """Return the SHA256 of the head and the tail of an archive, in hex."""
+
+    digest = hashlib.sha256()
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(0)
+    digest.update(f.read(EDGE_SIZE))
+    f.seek(max(EDGE_SIZE, size - EDGE_SIZE))
+    digest.update(f.read(EDGE_SIZE))
+
+    return digest.hexdigest()
+
+
+class VerifiedCache(object):
+    """A cache of the archives verified with a public key.
+
+    The key of an archive must be computed before it is verified, so that
+    a change made meanwhile gives another key.
+
+    :parameter:
+     path : string
+        The path of the cache file, created if needed.
+     max_entries : int
+        The maximum number of entries kept when the cache is saved.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (IOError, ValueError):
+            self.entries = {}
+
+    def key(self, archive, fingerprint):
+        """Return the key of an archive for the public key `fingerprint`,
+        or None if the archive cannot be read."""
+
+        try:
+            with open(archive, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                parts = [os.path.realpath(archive), stat.st_dev,
+                         stat.st_ino, stat.st_size, repr(stat.st_mtime),
+                         repr(stat.st_ctime), fingerprint,
+                         container_digest(f)]
+        except (IOError, OSError):
+            return None
+
+        return hashlib.sha256(json.dumps(parts)).hexdigest()
+
+    def contains(self, key):
+        """Tell if `key` has been verified, marking it as recently used."""
+
+        if key is None or key not in self.entries:
+            return False
+        self.entries[key] = time.time()
+        return True
+
+    def add(self, key):
+        """Remember that `key` has been verified."""
+
+        if key is not None:
+            self.entries[key] = time.time()
+
+    def save(self):
+        """Evict the least recently used entries and write the cache."""
+
+        if len(self.entries) > self.max_entries:
+            recent = sorted(self.entries, key=self.entries.get,
+                            reverse=True)[:self.max_entries]
+            self.entries = dict((key, self.entries[key]) for key in recent)
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        # A unique temporary file, created with the 0600 mode
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.entries, f)
+        os.rename(tmp, self.path)
+
+
+__author__ = 'Hakan Kuesne and Mathieu Devaud'
+__since__ = '2016-05-01'
+__date__ = '2016-05-16'
+__version__ = '1.0'
+__email__ = 'hakan@kusne.ch;mathieu.devaud@hefr.ch'
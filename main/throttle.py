@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2016 Hakan Kuesne && Mathieu Devaud
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" This module provides resource limiting methods.
+
+A token bucket limits the bytes read and written by the stages of a lock or
+an unlock, and the priority of the process can be lowered, so that a
+background job does not hurt the latency of the services of the host.
+"""
+
+
+import ctypes
+import ctypes.util
+import os
+import platform
+import threading
+import time
+
+# ioprio_set syscall numbers by architecture
+_IOPRIO_SET = {'x86_64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30,
+               'armv7l': 314, 'ppc64le': 273}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_BE = 2
+_IOPRIO_CLASS_SHIFT = 13
+
+
+class TokenBucket(object):
+    """Limit a flow of bytes to a rate, with bursts of one second.
+
+    The bucket can be shared by several threads, each one sleeping in
+    `consume` until enough tokens are available.
+
+    :parameter:
+     rate : float
+        The maximum rate in bytes per second.
+     burst : int
+        The capacity of the bucket in bytes, `rate` by default.
+    """
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise AttributeError("The rate must be positive.")
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def consume(self, size):
+        """Take `size` tokens, sleeping until they are available."""
+
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            # The debt of a request larger than the bucket is paid by
+            # sleeping, the next requests waiting for it
+            self.tokens -= size
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay > 0:
+            time.sleep(delay)
+
+
+def lower_priority(niceness=10):
+    """Lower the CPU and I/O priority of the process.
+
+    The niceness is increased by `niceness`, and on Linux the process is
+    moved to the lowest level of the best-effort I/O class, so that the
+    other processes are served first by the disk scheduler.
+
+    :return: A boolean, True if the I/O priority has been lowered.
+    """
+
+    try:
+        os.nice(niceness)
+    except (AttributeError, OSError):
+        pass
+
+    number = _IOPRIO_SET.get(platform.machine())
+    if platform.system() != 'Linux' or number is None:
+        return False
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        priority = (_IOPRIO_CLASS_BE << _IOPRIO_CLASS_SHIFT) | 7
+        return libc.syscall(number, _IOPRIO_WHO_PROCESS, 0, priority) == 0
+    except (AttributeError, OSError):
+        return False
+
+
+__author__ = 'Hakan Kuesne and Mathieu Devaud'
+__since__ = '2016-05-01'
+__date__ = '2016-05-16'
+__version__ = '1.0'
+__email__ = 'hakan@kusne.ch;mathieu.devaud@hefr.ch'
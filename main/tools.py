@@ -18,11 +18,43 @@
 
 
 import argparse
+import errno
+import hashlib
+import io
+import json
 import os
 import random
 import string
+import struct
+import sys
 import tarfile
+import time
 import ntpath
+import pagecache
+
+# Read the file objects streamed in a tar by blocks of 1 MB
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+# Packed payload : magic, number of files and size of the index, then for
+# each file its offset after the index, size, mtime, mode, name length and
+# SHA256
+PACK_MAGIC = b'LKP2'
+PACK_PREAMBLE = struct.Struct('>4sQQ')
+PACK_ENTRY = struct.Struct('>QQQIH32s')
+
+# Packed payloads of the first version, without the SHA256 of the files
+PACK_MAGIC_V1 = b'LKP1'
+PACK_ENTRY_V1 = struct.Struct('>QQQIH')
+
+# lseek whences finding the data and the holes of a sparse file, missing
+# from the os module of Python 2
+SEEK_DATA = getattr(os, 'SEEK_DATA',
+                    3 if sys.platform.startswith('linux') else None)
+SEEK_HOLE = getattr(os, 'SEEK_HOLE',
+                    4 if sys.platform.startswith('linux') else None)
+# Sparse extents in the GNU sparse header and in each extension block
+SPARSE_HEADER_EXTENTS = 4
+SPARSE_BLOCK_EXTENTS = 21
 
 
 def path_leaf(path):
@@ -58,16 +90,37 @@ def id_generator(size=8, chars=string.ascii_uppercase + string.digits):
 
 
 # Takes list of files as argument, put them in tar archive and return it.
-def tarfiles(files_list, outname):
+def tarfiles(files_list, outname, manifest=None, tracker=None,
+             nocache=False, limiter=None):
     """Create a tar of input files.
 
-    This function create a tar of `files_list` named `outname`.
+    This function create a tar of `files_list` named `outname`, the
+    directories being walked. If a `manifest` list is given, an entry
+    describing each member is appended to it, the SHA256 of a regular file
+    being computed while it is added to the tar. The entries of the
+    directories, links and special files have no SHA256, their mode telling
+    their type.
+
+    The holes of a sparse regular file are found with SEEK_DATA and
+    SEEK_HOLE, and only its data is stored in a GNU sparse member, so that
+    the size of the tar and the time to build it follow the allocated data
+    instead of the size of the files. `extract_member` recreates the holes.
 
     :parameter:
      files_list : list
         The id length in number of chars.
      outname : string
         The chars to use to create random id.
+     manifest : list
+        The list where to append the entries of the files.
+     tracker : progress.Tracker
+        The tracker to update with the bytes of the files added.
+     nocache : boolean
+        True to drop the regular files read and the tar written from the
+        page cache.
+     limiter : throttle.TokenBucket
+        The token bucket limiting the bytes of the files read and of the tar
+        written, or None.
 
     :raise ArgumentError:
             If there is no files in `files_list`.
@@ -79,13 +132,720 @@ def tarfiles(files_list, outname):
         raise argparse.ArgumentError("You must give one or more filenames.")
     filename = outname
     tar = tarfile.open(filename, 'w')
+    writes = pagecache.DropBehind(tar.fileobj, True, nocache)
     for name in files_list:
-        filename = path_leaf(name)
-        tar.add(name, arcname=filename)
+        for path, arcname in _walk(name, path_leaf(name)):
+            offset = tar.offset
+            entry = _add_member(tar, path, arcname, tracker,
+                                manifest is not None, limiter)
+            if manifest is not None and entry is not None:
+                manifest.append(entry)
+            if nocache and os.path.isfile(path):
+                pagecache.evict(path)
+            writes.move_to(tar.offset)
+            if limiter is not None:
+                limiter.consume(tar.offset - offset)
     tar.close()
+    writes.drop()
     return tar.name
 
 
+def _walk(path, arcname):
+    """Yield the (path, arcname) of `path` and, if it is a directory, of
+    its content in the order of `tar.add`, without following links."""
+
+    yield path, arcname
+    if os.path.islink(path) or not os.path.isdir(path):
+        return
+    for top, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        relative = os.path.relpath(top, path)
+        prefix = arcname if relative == '.' else \
+            '/'.join([arcname] + relative.split(os.sep))
+        for child in sorted(dirnames + filenames):
+            yield os.path.join(top, child), prefix + '/' + child
+
+
+def _add_member(tar, path, arcname, tracker=None, hashed=True,
+                limiter=None):
+    """Add a file, but not the content of a directory, to `tar` and return
+    its manifest entry, or None if the type of the file is not supported
+    by tar. A regular file is only hashed if `hashed` is True, and is read
+    throttled by `limiter`."""
+
+    if os.path.islink(path) or not os.path.isfile(path):
+        tarinfo = tar.gettarinfo(path, arcname=arcname)
+        if tarinfo is None:
+            # A socket
+            return None
+        tar.addfile(tarinfo)
+        return {'name': arcname,
+                'size': tarinfo.size,
+                'mtime': tarinfo.mtime,
+                'mode': tarinfo.mode,
+                'sha256': None}
+
+    extents = data_extents(path)
+    if extents is not None:
+        return _add_sparse(tar, path, arcname, extents, tracker, limiter)
+    if not hashed:
+        tar.add(path, arcname=arcname)
+        size = os.path.getsize(path)
+        if tracker is not None:
+            tracker.update(size)
+        if limiter is not None:
+            limiter.consume(size)
+        return None
+    return _add_hashed(tar, path, arcname, tracker, limiter)
+
+
+class _HashingFile(object):
+    """Read a file while updating a hash and a tracker with the data read,
+    the reads being throttled by a token bucket."""
+
+    def __init__(self, fileobj, digest, tracker=None, limiter=None):
+        self.fileobj = fileobj
+        self.digest = digest
+        self.tracker = tracker
+        self.limiter = limiter
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.digest.update(data)
+        if self.tracker is not None:
+            self.tracker.update(len(data))
+        if self.limiter is not None:
+            self.limiter.consume(len(data))
+        return data
+
+
+def _add_hashed(tar, name, arcname, tracker=None, limiter=None):
+    """Add a regular file to `tar` and return its manifest entry."""
+
+    tarinfo = tar.gettarinfo(name, arcname=arcname)
+    digest = hashlib.sha256()
+    with open(name, 'rb') as f:
+        tar.addfile(tarinfo, _HashingFile(f, digest, tracker, limiter))
+
+    return {'name': arcname,
+            'size': tarinfo.size,
+            'mtime': tarinfo.mtime,
+            'mode': tarinfo.mode,
+            'sha256': digest.hexdigest()}
+
+
+def data_extents(path):
+    """Find the data of a sparse file.
+
+    :parameter:
+     path : string
+        The regular file.
+
+    :return: A list of (offset, size) tuples, the extents holding the data
+    of the file, or None if it has no hole or the holes cannot be found.
+    """
+
+    stat = os.stat(path)
+    # A file with all its blocks allocated has no hole
+    if SEEK_DATA is None or not hasattr(stat, 'st_blocks') or \
+            stat.st_blocks * 512 >= stat.st_size:
+        return None
+
+    extents = []
+    offset = 0
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        while offset < stat.st_size:
+            try:
+                start = os.lseek(fd, offset, SEEK_DATA)
+            except OSError as e:
+                # Only a hole up to the end of the file
+                if e.errno == errno.ENXIO:
+                    break
+                raise
+            end = min(os.lseek(fd, start, SEEK_HOLE), stat.st_size)
+            extents.append((start, end - start))
+            offset = end
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+    if sum(size for _, size in extents) >= stat.st_size:
+        return None
+    return extents
+
+
+def _sparse_headers(tar, tarinfo, extents):
+    """Return the GNU sparse header of a member and its extension blocks.
+
+    The header describes the first extents, the size of the file and the
+    size of the data stored, each extension block describing the next
+    extents.
+    """
+
+    realsize = tarinfo.size
+    tarinfo.type = tarfile.GNUTYPE_SPARSE
+    tarinfo.size = sum(size for _, size in extents)
+    # As GNU tar, end a file with a hole by an empty extent at its end
+    if not extents or sum(extents[-1]) < realsize:
+        extents = extents + [(realsize, 0)]
+    buf = tarinfo.tobuf(tarfile.GNU_FORMAT, tar.encoding, tar.errors)
+    # A long name is stored in blocks before the header itself
+    prefix = buf[:-tarfile.BLOCKSIZE]
+    header = bytearray(buf[-tarfile.BLOCKSIZE:])
+
+    def pack(block, position, count):
+        for offset, size in extents[position:position + count]:
+            block.extend(tarfile.itn(offset, 12, tarfile.GNU_FORMAT))
+            block.extend(tarfile.itn(size, 12, tarfile.GNU_FORMAT))
+
+    sparse = bytearray()
+    pack(sparse, 0, SPARSE_HEADER_EXTENTS)
+    header[386:386 + len(sparse)] = sparse
+    header[482] = 1 if len(extents) > SPARSE_HEADER_EXTENTS else 0
+    header[483:495] = tarfile.itn(realsize, 12, tarfile.GNU_FORMAT)
+    header[148:156] = b' ' * 8
+    header[148:155] = b'%06o\0' % tarfile.calc_chksums(bytes(header))[0]
+
+    blocks = bytearray()
+    for position in range(SPARSE_HEADER_EXTENTS, len(extents),
+                          SPARSE_BLOCK_EXTENTS):
+        block = bytearray()
+        pack(block, position, SPARSE_BLOCK_EXTENTS)
+        block.extend(b'\0' * (504 - len(block)))
+        block.append(1 if position + SPARSE_BLOCK_EXTENTS < len(extents)
+                     else 0)
+        block.extend(b'\0' * 7)
+        blocks.extend(block)
+
+    return prefix + bytes(header) + bytes(blocks)
+
+
+def _add_sparse(tar, name, arcname, extents, tracker=None, limiter=None):
+    """Add the data `extents` of a sparse file to `tar` as a GNU sparse
+    member and return its manifest entry.
+
+    The holes are not read, so the SHA256 of the file is None.
+    """
+
+    tarinfo = tar.gettarinfo(name, arcname=arcname)
+    entry = {'name': arcname,
+             'size': tarinfo.size,
+             'mtime': tarinfo.mtime,
+             'mode': tarinfo.mode,
+             'sha256': None}
+
+    buf = _sparse_headers(tar, tarinfo, extents)
+    tar.fileobj.write(buf)
+    tar.offset += len(buf)
+    with open(name, 'rb') as f:
+        for offset, size in extents:
+            f.seek(offset)
+            while size > 0:
+                data = f.read(min(STREAM_BLOCK_SIZE, size))
+                if not data:
+                    raise IOError("%s is shorter than expected." % name)
+                tar.fileobj.write(data)
+                size -= len(data)
+                if tracker is not None:
+                    tracker.update(len(data))
+                if limiter is not None:
+                    limiter.consume(len(data))
+    if tracker is not None:
+        tracker.update(entry['size'] - tarinfo.size)
+    padding = -tarinfo.size % tarfile.BLOCKSIZE
+    tar.fileobj.write(b'\0' * padding)
+    tar.offset += tarinfo.size + padding
+    tar.members.append(tarinfo)
+
+    return entry
+
+
+def sparse_extents(tarinfo):
+    """Return the (offset, size) data extents of a sparse tar member."""
+
+    extents = []
+    for section in tarinfo.sparse:
+        if isinstance(section, tuple):
+            offset, size = section
+        elif hasattr(section, 'realpos'):
+            # The data sections of the sparse map of Python 2
+            offset, size = section.offset, section.size
+        else:
+            continue
+        if size:
+            extents.append((offset, size))
+    return extents
+
+
+def extract_member(tar, tarinfo, path='.'):
+    """Extract a member of a tar in `path`.
+
+    A sparse member is written extent by extent, seeking over its holes, so
+    that they are recreated instead of being filled with zeros.
+
+    :parameter:
+     tar : tarfile.TarFile
+        The tar opened in read mode.
+     tarinfo : tarfile.TarInfo
+        The member to extract.
+     path : string
+        The directory where to extract the member.
+    """
+
+    if not tarinfo.issparse():
+        tar.extract(tarinfo, path)
+        return
+
+    target = os.path.join(path, tarinfo.name)
+    directory = os.path.dirname(target)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    source = tar.extractfile(tarinfo)
+    with open(target, 'wb') as f:
+        for offset, size in sparse_extents(tarinfo):
+            source.seek(offset)
+            f.seek(offset)
+            while size > 0:
+                data = source.read(min(STREAM_BLOCK_SIZE, size))
+                if not data:
+                    raise IOError("%s is shorter than expected."
+                                  % tarinfo.name)
+                f.write(data)
+                size -= len(data)
+        f.truncate(tarinfo.size)
+    source.close()
+    tar.chmod(tarinfo, target)
+    tar.utime(tarinfo, target)
+
+
+def files_size(files_list):
+    """Return the total size in bytes of the regular files of `files_list`,
+    the directories being walked."""
+
+    size = 0
+    for name in files_list:
+        if os.path.isdir(name):
+            for root, _, files in os.walk(name):
+                for filename in files:
+                    path = os.path.join(root, filename)
+                    if os.path.isfile(path):
+                        size += os.path.getsize(path)
+        elif os.path.isfile(name):
+            size += os.path.getsize(name)
+    return size
+
+
+def save_journal(path, state):
+    """Atomically save a checkpoint journal.
+
+    This function write `state` in a temporary file, flush it to the disk
+    then rename it to `path`, so that the journal is either the previous or
+    the new checkpoint even if the process is killed meanwhile.
+
+    :parameter:
+     path : string
+        The path of the journal.
+     state : dict
+        The checkpoint to save, must be serializable in JSON.
+    """
+
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as journal:
+        json.dump(state, journal, sort_keys=True)
+        journal.flush()
+        os.fsync(journal.fileno())
+    os.rename(tmp, path)
+
+
+def load_journal(path):
+    """Load a checkpoint journal.
+
+    :parameter:
+     path : string
+        The path of the journal.
+
+    :return: A dict, the last checkpoint saved, or None if there is none.
+    """
+
+    if not os.path.isfile(path):
+        return None
+    with open(path) as journal:
+        return json.load(journal)
+
+
+def tar_objects(objects, manifest=None):
+    """Stream a tar of in-memory objects.
+
+    This function describe `objects` in tar headers and return the size of
+    the tar with a generator of its bytes, so that the tar is never held in
+    memory. A file object is read by blocks from its current position to
+    its end, it must therefore be seekable so that its size is known.
+
+    :parameter:
+     objects : dict
+        The contents of the files by name, as strings or file objects.
+     manifest : list
+        The list where to append the entries of the files. The SHA256 of a
+        file object is None, as it is only read once.
+
+    :raise AttributeError:
+            If there is no objects or a file object is not seekable.
+
+    :return: A tuple (size, generator), the size of the tar and its bytes.
+    """
+
+    if len(objects) < 1:
+        raise AttributeError("You must give one or more objects.")
+
+    mtime = int(time.time())
+    members = []
+    size = 0
+    for name in sorted(objects):
+        content = objects[name]
+        tarinfo = tarfile.TarInfo(name)
+        tarinfo.mtime = mtime
+        tarinfo.mode = 0o644
+        if isinstance(content, bytes):
+            tarinfo.size = len(content)
+            digest = hashlib.sha256(content).hexdigest()
+        else:
+            try:
+                position = content.tell()
+                content.seek(0, os.SEEK_END)
+                tarinfo.size = content.tell() - position
+                content.seek(position)
+            except (AttributeError, IOError, ValueError):
+                raise AttributeError("The file object of %s must be "
+                                     "seekable." % name)
+            digest = None
+        tar_header = tarinfo.tobuf(tarfile.DEFAULT_FORMAT, tarfile.ENCODING,
+                                   'strict')
+        members.append((tar_header, tarinfo, content))
+        size += len(tar_header) + \
+            -(-tarinfo.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        if manifest is not None:
+            manifest.append({'name': tarinfo.name,
+                             'size': tarinfo.size,
+                             'mtime': tarinfo.mtime,
+                             'mode': tarinfo.mode,
+                             'sha256': digest})
+
+    # End of archive blocks, padded to a full record as tarfile does
+    size += 2 * tarfile.BLOCKSIZE
+    end = 2 * tarfile.BLOCKSIZE + (-size % tarfile.RECORDSIZE)
+    size += -size % tarfile.RECORDSIZE
+
+    def generate():
+        for tar_header, tarinfo, content in members:
+            yield tar_header
+            if isinstance(content, bytes):
+                for start in range(0, tarinfo.size, STREAM_BLOCK_SIZE):
+                    yield content[start:start + STREAM_BLOCK_SIZE]
+            else:
+                left = tarinfo.size
+                while left > 0:
+                    data = content.read(min(STREAM_BLOCK_SIZE, left))
+                    if not data:
+                        raise IOError("The file object of %s is shorter "
+                                      "than its size." % tarinfo.name)
+                    left -= len(data)
+                    yield data
+            yield b'\0' * (-tarinfo.size % tarfile.BLOCKSIZE)
+        yield b'\0' * end
+
+    return size, generate()
+
+
+def rechunk(blocks, size):
+    """Regroup an iterable of strings in strings of `size` bytes.
+
+    The last string is shorter, or empty if there is no data at all.
+    """
+
+    pending = []
+    pending_size = 0
+    emitted = False
+    for block in blocks:
+        pending.append(block)
+        pending_size += len(block)
+        if pending_size >= size:
+            data = b''.join(pending)
+            for start in range(0, len(data) - size + 1, size):
+                yield data[start:start + size]
+            emitted = True
+            rest = data[len(data) - len(data) % size:]
+            pending = [rest]
+            pending_size = len(rest)
+    if pending_size or not emitted:
+        yield b''.join(pending)
+
+
+class IteratorReader(io.RawIOBase):
+    """Read-only file object over an iterable of strings.
+
+    The strings are pulled from the iterable as the file object is read, so
+    that a stream produced by a generator is never held in memory.
+    """
+
+    def __init__(self, blocks):
+        self.blocks = iter(blocks)
+        self.pending = b''
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self.position == len(self.pending):
+            try:
+                self.pending = next(self.blocks)
+            except StopIteration:
+                return 0
+            self.position = 0
+        size = min(len(b), len(self.pending) - self.position)
+        b[:size] = self.pending[self.position:self.position + size]
+        self.position += size
+        return size
+
+
+def packfiles(files_list, outname, tracker=None, nocache=False,
+              limiter=None):
+    """Create a packed payload of input files.
+
+    A packed payload is a compact index of the names, sizes, offsets,
+    mtimes, modes and SHA256 of the files followed by their concatenated
+    contents, so that a small file costs its name and 62 bytes instead of
+    the 512 bytes header and the padding of a tar member. The directories
+    are walked and only their regular files are packed. The SHA256 being
+    known once the files are read, the index is written again after them.
+
+    :parameter:
+     files_list : list
+        The files and directories to pack.
+     outname : string
+        The name of the packed payload.
+     tracker : progress.Tracker
+        The tracker to update with the bytes of the files packed.
+     nocache : boolean
+        True to drop the files read and the payload written from the page
+        cache.
+     limiter : throttle.TokenBucket
+        The token bucket limiting the bytes of the files read and of the
+        payload written, or None.
+
+    :raise AttributeError:
+            If there is no files in `files_list`.
+
+    :return: A string, the name of the packed payload.
+    """
+
+    if len(files_list) < 1:
+        raise AttributeError("You must give one or more filenames.")
+
+    entries = []
+    for name in files_list:
+        arcname = path_leaf(name.rstrip('/\\'))
+        if os.path.isdir(name):
+            for root, dirs, files in os.walk(name):
+                dirs.sort()
+                prefix = os.path.relpath(root, name)
+                for filename in sorted(files):
+                    path = os.path.join(root, filename)
+                    if os.path.isfile(path):
+                        entries.append((path, os.path.normpath(
+                            os.path.join(arcname, prefix, filename))))
+        else:
+            entries.append((name, arcname))
+
+    fields = []
+    offset = 0
+    sizes = []
+    for path, arcname in entries:
+        stat = os.stat(path)
+        arcname = arcname.replace(os.sep, '/')
+        fields.append((offset, stat.st_size, int(stat.st_mtime),
+                       stat.st_mode & 0o7777, arcname))
+        sizes.append(stat.st_size)
+        offset += stat.st_size
+
+    def pack_index(digests):
+        return b''.join(PACK_ENTRY.pack(offset, size, mtime, mode,
+                                        len(arcname), digest) + arcname
+                        for (offset, size, mtime, mode, arcname), digest
+                        in zip(fields, digests))
+
+    digests = []
+    with open(outname, 'wb') as out:
+        index = pack_index([b'\0' * 32] * len(fields))
+        out.write(PACK_PREAMBLE.pack(PACK_MAGIC, len(entries), len(index)))
+        out.write(index)
+        writes = pagecache.DropBehind(out, True, nocache)
+        # Small files are gathered and written by blocks, the large ones
+        # being copied block by block
+        pending = []
+        pending_size = 0
+        for (path, _), size in zip(entries, sizes):
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                if size >= STREAM_BLOCK_SIZE:
+                    out.write(b''.join(pending))
+                    writes.advance(pending_size)
+                    pending = []
+                    pending_size = 0
+                    copied = 0
+                    while copied < size:
+                        block = f.read(min(STREAM_BLOCK_SIZE, size - copied))
+                        if not block:
+                            break
+                        if limiter is not None:
+                            # Read then written
+                            limiter.consume(2 * len(block))
+                        digest.update(block)
+                        out.write(block)
+                        writes.advance(len(block))
+                        copied += len(block)
+                        if tracker is not None:
+                            tracker.update(len(block))
+                    if copied != size:
+                        raise IOError("%s changed while it was packed." %
+                                      path)
+                else:
+                    data = f.read(size)
+                    if len(data) != size:
+                        raise IOError("%s changed while it was packed." %
+                                      path)
+                    if limiter is not None:
+                        # Read then written
+                        limiter.consume(2 * size)
+                    digest.update(data)
+                    pending.append(data)
+                    pending_size += size
+                    if tracker is not None:
+                        tracker.update(size)
+            digests.append(digest.digest())
+            if nocache:
+                pagecache.evict(path)
+            if pending_size >= STREAM_BLOCK_SIZE:
+                out.write(b''.join(pending))
+                writes.advance(pending_size)
+                pending = []
+                pending_size = 0
+        out.write(b''.join(pending))
+        writes.advance(pending_size)
+        writes.drop()
+
+        out.seek(PACK_PREAMBLE.size)
+        out.write(pack_index(digests))
+
+    return outname
+
+
+def read_pack_index(f):
+    """Read the index of a packed payload.
+
+    :parameter:
+     f : file
+        The packed payload opened in binary read mode, at its start.
+
+    :raise ValueError:
+            If `f` is not a packed payload.
+
+    :return: A tuple (entries, data_offset), a list of dicts with the name,
+    offset, size, mtime, mode and SHA256 in hexadecimal of each file, the
+    SHA256 being None in a payload of the first version, and the offset of
+    the contents.
+    """
+
+    preamble = f.read(PACK_PREAMBLE.size)
+    if len(preamble) != PACK_PREAMBLE.size:
+        raise ValueError("This is not a packed payload.")
+    magic, count, index_len = PACK_PREAMBLE.unpack(preamble)
+    if magic not in (PACK_MAGIC, PACK_MAGIC_V1):
+        raise ValueError("This is not a packed payload.")
+    entry_struct = PACK_ENTRY if magic == PACK_MAGIC else PACK_ENTRY_V1
+
+    index = f.read(index_len)
+    entries = []
+    position = 0
+    for _ in range(count):
+        fields = entry_struct.unpack_from(index, position)
+        offset, size, mtime, mode, name_len = fields[:5]
+        position += entry_struct.size
+        entries.append({'name': index[position:position + name_len],
+                        'offset': offset,
+                        'size': size,
+                        'mtime': mtime,
+                        'mode': mode,
+                        'sha256': fields[5].encode('hex')
+                        if len(fields) > 5 else None})
+        position += name_len
+
+    return entries, PACK_PREAMBLE.size + index_len
+
+
+def unpackfiles(path, outdir='.', tracker=None, nocache=False,
+                limiter=None):
+    """Extract the files of a packed payload.
+
+    :parameter:
+     path : string
+        The packed payload.
+     outdir : string
+        The directory where to extract the files.
+     tracker : progress.Tracker
+        The tracker to update with the bytes of the files extracted, its
+        total being set to the size of the files.
+     nocache : boolean
+        True to flush the extracted files and drop them from the page cache.
+     limiter : throttle.TokenBucket
+        The token bucket limiting the bytes of the payload read and of the
+        files written, or None.
+
+    :raise ValueError:
+            If a name is absolute or goes up the directory tree.
+
+    :return: A list, the names of the extracted files.
+    """
+
+    with open(path, 'rb') as f:
+        entries, data_offset = read_pack_index(f)
+        if tracker is not None:
+            tracker.total = sum(entry['size'] for entry in entries)
+        f.seek(data_offset)
+        for entry in entries:
+            name = entry['name']
+            if name.startswith('/') or '..' in name.split('/'):
+                raise ValueError("Unsafe name in the packed payload : %s"
+                                 % name)
+            if f.tell() != data_offset + entry['offset']:
+                f.seek(data_offset + entry['offset'])
+            target = os.path.join(outdir, *name.split('/'))
+            parent = os.path.dirname(target)
+            if parent and not os.path.isdir(parent):
+                os.makedirs(parent)
+            with open(target, 'wb') as out:
+                left = entry['size']
+                while left > 0:
+                    data = f.read(min(STREAM_BLOCK_SIZE, left))
+                    if not data:
+                        raise IOError("The packed payload is truncated.")
+                    out.write(data)
+                    left -= len(data)
+                    if tracker is not None:
+                        tracker.update(len(data))
+                    if limiter is not None:
+                        # Read then written
+                        limiter.consume(2 * len(data))
+            if nocache:
+                pagecache.evict(target, written=True)
+            os.chmod(target, entry['mode'])
+            os.utime(target, (entry['mtime'], entry['mtime']))
+
+    return [entry['name'] for entry in entries]
+
+
 def secure_delete(path, passes=1):
     """Secure way to delete files.
 
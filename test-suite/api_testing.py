@@ -17,11 +17,26 @@
 
 """ This module provides API testing methods. """
 
-from subprocess import call
+from subprocess import call, check_output
+import hashlib
+import io
+import json
 import os.path
+import pstats
+import shutil
 import time
 import tarfile
+import main.backend
+import main.container
+import main.keypair
 import main.tools
+import main.locker
+
+# Budget in seconds of the median startup of --help, above the interpreter
+STARTUP_BUDGET = 0.05
+# Modules that --help must not import
+HEAVY_MODULES = ['locker', 'tarfile', 'multiprocessing', 'rsa', 'ecc',
+                 'backend', 'Crypto', 'cryptography']
 
 
 def key_generation():
@@ -231,6 +246,1132 @@ def unlock_altered_archive():
         return True
 
 
+def chunked_case():
+    """Test API with a chunked container.
+
+    This function test the API in a case where the files are lock in a
+    chunked container then unlock with the right key and no alteration.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API with chunked container...")
+
+    # create test files
+    file = open("test1.txt", 'w')
+    file.write("I'm test1.txt" * 10000)
+    file.close()
+
+    file = open("test2.txt", 'w')
+    file.write("I'm test2.txt")
+    file.close()
+
+    # lock the files in small chunks
+    call(["python", "../main/cryptical.py", "--lock", "test1.txt",
+          "test2.txt", "--keys", "priv_key.pem", "pub_key.pem", "--output",
+          "archive", "--chunked", "--chunk-size", "4096"])
+
+    os.remove("test1.txt")
+    os.remove("test2.txt")
+
+    call(["python", "../main/cryptical.py", "--unlock", "archive.lkd",
+          "--keys", "priv_key.pem", "pub_key.pem"])
+
+    if os.path.isfile("test1.txt") and \
+            open("test1.txt").read() == "I'm test1.txt" * 10000:
+        print("[result] Chunked case successful...")
+        return True
+    else:
+        print("[result] Chunked case unsuccessful, archive not unlocked...")
+        return False
+
+
+def unlock_corrupted_chunk():
+    """Test API when a chunk of a chunked container has been altered.
+
+    This function test the API in a case where one byte of a chunk has been
+    flipped.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API with corrupted chunk...")
+
+    # create test files
+    file = open("test1.txt", 'w')
+    file.write("I'm test1.txt" * 10000)
+    file.close()
+
+    # lock the files in small chunks
+    call(["python", "../main/cryptical.py", "--lock", "test1.txt", "--keys",
+          "priv_key.pem", "pub_key.pem", "--output", "archive", "--chunked",
+          "--chunk-size", "4096"])
+
+    os.remove("test1.txt")
+
+    # flip one byte in the third chunk
+    file = open("archive.lkd", 'r+b')
+    data_offset = main.container.read_header(file)[3]
+    file.seek(data_offset + 2 * (4096 + 32) + 100)
+    byte = file.read(1)
+    file.seek(-1, os.SEEK_CUR)
+    file.write(chr(ord(byte) ^ 1))
+    file.close()
+
+    call(["python", "../main/cryptical.py", "--unlock", "archive.lkd",
+          "--keys", "priv_key.pem", "pub_key.pem"])
+
+    if os.path.isfile("test1.txt") or os.path.isfile("source.tar"):
+        print("[result] Corrupted chunk case unsuccessful, archive has been "
+              "unlocked when altered")
+        return False
+    else:
+        print("[result] Corrupted chunk case successful, archive not "
+              "unlocked ...")
+        return True
+
+
+def list_case():
+    """Test API when listing a chunked container.
+
+    This function test the API in a case where the files of a chunked
+    container are listed without unlocking it.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API listing...")
+
+    # create test files
+    file = open("test1.txt", 'w')
+    file.write("I'm test1.txt")
+    file.close()
+
+    file = open("test2.txt", 'w')
+    file.write("I'm test2.txt")
+    file.close()
+
+    # lock the files
+    call(["python", "../main/cryptical.py", "--lock", "test1.txt",
+          "test2.txt", "--keys", "priv_key.pem", "pub_key.pem", "--output",
+          "archive", "--chunked"])
+
+    listing = check_output(["python", "../main/cryptical.py", "--list",
+                            "archive.lkd", "--keys", "priv_key.pem",
+                            "pub_key.pem"])
+
+    if "test1.txt" in listing and "test2.txt" in listing and \
+            os.path.isfile("archive.lkd"):
+        print("[result] List case successful...")
+        return True
+    else:
+        print("[result] List case unsuccessful...")
+        return False
+
+
+def list_tree_case():
+    """Test API when listing a chunked container of a directory tree.
+
+    This function test the API in a case where a nested directory is locked
+    with a file in a chunked container, and check that the manifest lists
+    every file, directory and link of the tree, and that the tree is
+    restored when the container is unlocked.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API listing a directory tree...")
+
+    # create a tree with a nested directory, an empty one and a link
+    if os.path.isdir("tree"):
+        shutil.rmtree("tree")
+    os.makedirs("tree/sub/deep")
+    os.mkdir("tree/empty")
+    for name in ["tree/a.txt", "tree/sub/b.txt", "tree/sub/deep/c.txt",
+                 "test1.txt"]:
+        file = open(name, 'w')
+        file.write("I'm %s" % name)
+        file.close()
+    os.symlink("sub/b.txt", "tree/link")
+
+    main.locker.lock_files(["tree", "test1.txt"], "priv_key.pem",
+                           "pub_key.pem", "archive", chunked=True)
+    manifest = main.locker.list_archive("archive.lkd", "priv_key.pem",
+                                        "pub_key.pem") or []
+    entries = dict((entry['name'], entry) for entry in manifest)
+    hashed = entries.get("tree/sub/deep/c.txt", {}).get('sha256') == \
+        hashlib.sha256("I'm tree/sub/deep/c.txt").hexdigest()
+
+    shutil.rmtree("tree")
+    os.remove("test1.txt")
+    main.locker.unlock_file("archive.lkd", "priv_key.pem", "pub_key.pem")
+
+    if sorted(entries) == ["test1.txt", "tree", "tree/a.txt", "tree/empty",
+                           "tree/link", "tree/sub", "tree/sub/b.txt",
+                           "tree/sub/deep", "tree/sub/deep/c.txt"] and \
+            hashed and os.path.isdir("tree/empty") and \
+            os.readlink("tree/link") == "sub/b.txt" and \
+            open("tree/sub/deep/c.txt").read() == \
+            "I'm tree/sub/deep/c.txt":
+        print("[result] List tree case successful...")
+        shutil.rmtree("tree")
+        return True
+    else:
+        print("[result] List tree case unsuccessful...")
+        return False
+
+
+def resume_case():
+    """Test API when resuming interrupted runs of a chunked container.
+
+    This function test the API in a case where the lock and the unlock of a
+    chunked container fail at a chunk, then are resumed from their last
+    checkpoint, and check that the resumed lock writes the chunks of an
+    uninterrupted lock, that a lock checkpoint of a changed tar is stale and
+    that the resumed unlock restores the file.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API resuming interrupted runs...")
+
+    # create test files
+    file = open("test1.txt", 'wb')
+    file.write(os.urandom(1024 * 1024))
+    file.close()
+    content = open("test1.txt", 'rb').read()
+
+    locker = main.locker
+    saved = (locker.CHECKPOINT_SIZE, locker.aes.gen_aes_key,
+             locker.aes.gen_iv, locker.container.seal_chunk,
+             locker.container.open_chunk)
+    # 256 chunks, checkpointed every 16 chunks and batched by 16
+    options = {'chunked': True, 'chunk_size': 4096,
+               'buffer_size': 16 * 4096}
+    seqs = []
+    armed = []
+
+    def failing(function):
+        def interrupted(header, keys, seq, *args):
+            seqs.append(seq)
+            if seq == 150 and armed:
+                raise RuntimeError("interrupted at chunk 150")
+            return function(header, keys, seq, *args)
+        return interrupted
+
+    def payload(name):
+        with open(name, 'rb') as f:
+            header, _, _, data_offset = main.container.read_header(f)
+            end = main.container.payload_end(header, data_offset)
+            f.seek(data_offset)
+            return f.read(end - data_offset)
+
+    def run(interrupt, function, *args, **kwargs):
+        armed[:] = [True] if interrupt else []
+        del seqs[:]
+        try:
+            function(*args, **kwargs)
+        except SystemExit:
+            pass
+        return min(seqs or [None])
+
+    results = []
+    try:
+        # the same keys and nonce give the chunks of an uninterrupted lock
+        locker.CHECKPOINT_SIZE = 64 * 1024
+        locker.aes.gen_aes_key = lambda size: b'k' * size
+        locker.aes.gen_iv = lambda size: b'n' * size
+        locker.container.seal_chunk = failing(saved[3])
+        locker.container.open_chunk = failing(saved[4])
+        keys = ("priv_key.pem", "pub_key.pem")
+
+        run(False, locker.lock_files, ["test1.txt"], *keys,
+            output="expected", **options)
+        expected = payload("expected.lkd")
+
+        # interrupted then resumed lock
+        run(True, locker.lock_files, ["test1.txt"], *keys,
+            output="archive", **options)
+        state = locker.tools.load_journal("archive.lkd.journal")
+        results.append(state['committed'] > 0 and
+                       locker._lock_checkpoint_valid(state, ["test1.txt"],
+                                                     "archive"))
+        first = run(False, locker.lock_files, ["test1.txt"], *keys,
+                    output="archive", resume=True, **options)
+        results.append(first == state['committed'] and
+                       not os.path.isfile("archive.lkd.journal") and
+                       payload("archive.lkd") == expected)
+
+        # interrupted lock resumed after its tar has changed
+        run(True, locker.lock_files, ["test1.txt"], *keys,
+            output="stale", **options)
+        state = locker.tools.load_journal("stale.lkd.journal")
+        with open(state['archive'], 'ab') as tar:
+            tar.write(b'\0')
+        results.append(not locker._lock_checkpoint_valid(
+            state, ["test1.txt"], "stale"))
+        first = run(False, locker.lock_files, ["test1.txt"], *keys,
+                    output="stale", resume=True, **options)
+        results.append(first == 0 and payload("stale.lkd") == expected)
+
+        # interrupted then resumed unlock
+        os.remove("test1.txt")
+        run(True, locker.unlock_file, "archive.lkd", *keys,
+            buffer_size=options['buffer_size'])
+        state = locker.tools.load_journal("archive.lkd.journal")
+        first = run(False, locker.unlock_file, "archive.lkd", *keys,
+                    resume=True, buffer_size=options['buffer_size'])
+        results.append(0 < state['committed'] == first and
+                       not os.path.isfile("archive.lkd.journal") and
+                       not os.path.isfile("source.tar") and
+                       open("test1.txt", 'rb').read() == content)
+    except (IOError, KeyError, TypeError):
+        results.append(False)
+    finally:
+        (locker.CHECKPOINT_SIZE, locker.aes.gen_aes_key, locker.aes.gen_iv,
+         locker.container.seal_chunk, locker.container.open_chunk) = saved
+        for name in ["expected.lkd", "stale.lkd"]:
+            if os.path.isfile(name):
+                os.remove(name)
+
+    if results == [True] * 5:
+        print("[result] Resume case successful...")
+        return True
+    else:
+        print("[result] Resume case unsuccessful...")
+        return False
+
+
+def verify_case():
+    """Test API when verifying archives with the public key only.
+
+    This function test the API in a case where an intact and an altered
+    chunked container, and an intact and an altered tar container, are
+    verified without being unlocked.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API verification...")
+
+    # create test files
+    file = open("test1.txt", 'w')
+    file.write("I'm test1.txt" * 10000)
+    file.close()
+
+    # lock the file twice
+    for output in ["archive", "altered"]:
+        call(["python", "../main/cryptical.py", "--lock", "test1.txt",
+              "--keys", "priv_key.pem", "pub_key.pem", "--output", output,
+              "--chunked", "--chunk-size", "4096"])
+
+    for output in ["tar", "tar_altered"]:
+        call(["python", "../main/cryptical.py", "--lock", "test1.txt",
+              "--keys", "priv_key.pem", "pub_key.pem", "--output", output])
+
+    # flip one byte of the second archive
+    file = open("altered.lkd", 'r+b')
+    file.seek(main.container.read_header(file)[3] + 100)
+    byte = file.read(1)
+    file.seek(-1, os.SEEK_CUR)
+    file.write(chr(ord(byte) ^ 1))
+    file.close()
+
+    # flip one byte of the signed payload of the second tar container
+    tar = tarfile.open("tar_altered.lkd")
+    offset = tar.getmember("encrypted_files_and_key.lkd").offset_data
+    tar.close()
+    file = open("tar_altered.lkd", 'r+b')
+    file.seek(offset + 100)
+    byte = file.read(1)
+    file.seek(-1, os.SEEK_CUR)
+    file.write(chr(ord(byte) ^ 1))
+    file.close()
+
+    call(["python", "../main/cryptical.py", "--verify", "archive.lkd",
+          "altered.lkd", "tar.lkd", "tar_altered.lkd", "--pubkey",
+          "pub_key.pem", "--report", "report.json"])
+
+    report = json.load(open("report.json"))
+    valid = dict((result['archive'], result['valid'])
+                 for result in report['archives'])
+
+    for output in ["tar.lkd", "tar_altered.lkd"]:
+        os.remove(output)
+
+    if valid == {"archive.lkd": True, "altered.lkd": False,
+                 "tar.lkd": True, "tar_altered.lkd": False}:
+        print("[result] Verify case successful...")
+        return True
+    else:
+        print("[result] Verify case unsuccessful...")
+        return False
+
+
+def ecc_case():
+    """Test API with an ECC key pair.
+
+    This function test the API in a case where an Ed25519 and X25519 key
+    pair is generated, then used to lock and unlock files.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API with ECC keys...")
+
+    # generate the keys apart from the RSA ones
+    if not os.path.isdir("ecc"):
+        os.mkdir("ecc")
+    call(["python", "../../main/cryptical.py", "--gen", "--key-type", "ecc"],
+         cwd="ecc")
+
+    # create test files
+    file = open("ecc/test1.txt", 'w')
+    file.write("I'm test1.txt")
+    file.close()
+
+    # lock then unlock the file
+    call(["python", "../../main/cryptical.py", "--lock", "test1.txt",
+          "--keys", "priv_key.pem", "pub_key.pem", "--output", "archive"],
+         cwd="ecc")
+
+    os.remove("ecc/test1.txt")
+
+    call(["python", "../../main/cryptical.py", "--unlock", "archive.lkd",
+          "--keys", "priv_key.pem", "pub_key.pem"], cwd="ecc")
+
+    if os.path.isfile("ecc/test1.txt") and \
+            open("ecc/test1.txt").read() == "I'm test1.txt":
+        print("[result] ECC case successful...")
+        return True
+    else:
+        print("[result] ECC case unsuccessful...")
+        return False
+
+
+def merkle_case():
+    """Test API with a Merkle tree signed chunked container.
+
+    This function test the API in a case where an intact and an altered
+    Merkle container are verified, then the intact one is unlocked.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API with Merkle tree...")
+
+    # create test files
+    file = open("test1.txt", 'w')
+    file.write("I'm test1.txt" * 10000)
+    file.close()
+
+    # lock the file twice
+    for output in ["archive", "altered"]:
+        call(["python", "../main/cryptical.py", "--lock", "test1.txt",
+              "--keys", "priv_key.pem", "pub_key.pem", "--output", output,
+              "--chunked", "--chunk-size", "4096", "--merkle"])
+
+    os.remove("test1.txt")
+
+    # flip one byte in the third chunk of the second archive
+    file = open("altered.lkd", 'r+b')
+    file.seek(main.container.read_header(file)[3] + 2 * (4096 + 32) + 100)
+    byte = file.read(1)
+    file.seek(-1, os.SEEK_CUR)
+    file.write(chr(ord(byte) ^ 1))
+    file.close()
+
+    call(["python", "../main/cryptical.py", "--verify", "archive.lkd",
+          "altered.lkd", "--pubkey", "pub_key.pem", "--report",
+          "report.json"])
+
+    report = json.load(open("report.json"))
+    valid = dict((result['archive'], result['valid'])
+                 for result in report['archives'])
+
+    call(["python", "../main/cryptical.py", "--unlock", "archive.lkd",
+          "--keys", "priv_key.pem", "pub_key.pem"])
+
+    if valid == {"archive.lkd": True, "altered.lkd": False} and \
+            os.path.isfile("test1.txt") and \
+            open("test1.txt").read() == "I'm test1.txt" * 10000:
+        print("[result] Merkle case successful...")
+        return True
+    else:
+        print("[result] Merkle case unsuccessful...")
+        return False
+
+
+def memory_case():
+    """Test API with in-memory objects.
+
+    This function test the API in a case where a string and a file object
+    are locked in memory then unlocked to streams, without any file.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API in memory...")
+
+    objects = {"test1.txt": "I'm test1.txt",
+               "test2.txt": io.BytesIO("I'm test2.txt" * 100000)}
+
+    locked = main.locker.lock_objects(objects, "priv_key.pem", "pub_key.pem",
+                                      chunk_size=4096)
+    streams = main.locker.unlock_to_objects(io.BytesIO(locked.read()),
+                                            "priv_key.pem", "pub_key.pem")
+
+    if streams is not None and \
+            streams["test1.txt"].read() == "I'm test1.txt" and \
+            streams["test2.txt"].read() == "I'm test2.txt" * 100000:
+        print("[result] Memory case successful...")
+        return True
+    else:
+        print("[result] Memory case unsuccessful...")
+        return False
+
+
+def packed_case():
+    """Test API with a packed payload.
+
+    This function test the API in a case where many small files and a large
+    one in their middle are packed, listed with their SHA256 then unlocked.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API with packed payload...")
+
+    # create test files
+    if not os.path.isdir("packed"):
+        os.mkdir("packed")
+    for i in range(100):
+        file = open("packed/test%d.json" % i, 'w')
+        file.write('{"test": %d}' % i)
+        file.close()
+    # a large file, copied by blocks, with a partial last block
+    file = open("packed/large.bin", 'wb')
+    file.write(os.urandom(5 * 512 * 1024 + 7))
+    file.close()
+    content = open("packed/large.bin", 'rb').read()
+    names = ["packed/test%d.json" % i for i in range(50)] + \
+        ["packed/large.bin"] + \
+        ["packed/test%d.json" % i for i in range(50, 100)]
+
+    # lock the files
+    call(["python", "../main/cryptical.py", "--lock"] + names +
+         ["--keys", "priv_key.pem", "pub_key.pem", "--output", "archive",
+          "--pack"])
+
+    listing = check_output(["python", "../main/cryptical.py", "--list",
+                            "archive.lkd", "--keys", "priv_key.pem",
+                            "pub_key.pem"])
+    manifest = main.locker.list_archive("archive.lkd", "priv_key.pem",
+                                        "pub_key.pem") or []
+    hashed = [entry['sha256'] for entry in manifest] == \
+        [hashlib.sha256(open(name, 'rb').read()).hexdigest()
+         for name in names]
+
+    for name in names:
+        os.remove(name)
+
+    call(["python", "../main/cryptical.py", "--unlock", "archive.lkd",
+          "--keys", "priv_key.pem", "pub_key.pem"])
+
+    if "test99.json" in listing and "large.bin" in listing and hashed and \
+            all(open("test%d.json" % i).read() == '{"test": %d}' % i
+                for i in range(100)) and \
+            open("large.bin", 'rb').read() == content:
+        print("[result] Packed case successful...")
+        os.remove("large.bin")
+        return True
+    else:
+        print("[result] Packed case unsuccessful...")
+        return False
+
+
+def volumes_case():
+    """Test API with a multi-volume container.
+
+    This function test the API in a case where a file is locked in three
+    volumes, then listed and unlocked from its second volume.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API with volumes...")
+
+    # create test files
+    file = open("test1.txt", 'w')
+    file.write("I'm test1.txt" * 10000)
+    file.close()
+
+    # lock the file in three volumes
+    call(["python", "../main/cryptical.py", "--lock", "test1.txt", "--keys",
+          "priv_key.pem", "pub_key.pem", "--output", "archive",
+          "--chunk-size", "4096", "--volumes", "3"])
+
+    os.remove("test1.txt")
+
+    volumes = all(os.path.isfile("archive.%03d.lkd" % i) for i in [1, 2, 3])
+    manifest = main.locker.list_archive("archive.002.lkd", "priv_key.pem",
+                                        "pub_key.pem") or []
+    listed = [(entry['name'], entry['sha256']) for entry in manifest] == \
+        [("test1.txt", hashlib.sha256("I'm test1.txt" * 10000).hexdigest())]
+
+    call(["python", "../main/cryptical.py", "--unlock", "archive.002.lkd",
+          "--keys", "priv_key.pem", "pub_key.pem"])
+
+    if volumes and listed and os.path.isfile("test1.txt") and \
+            open("test1.txt").read() == "I'm test1.txt" * 10000:
+        print("[result] Volumes case successful...")
+        return True
+    else:
+        print("[result] Volumes case unsuccessful...")
+        return False
+
+
+def progress_case():
+    """Test API with progress events.
+
+    This function test the API in a case where a file is locked then
+    unlocked, in a chunked then in a tar container, with the progress
+    reported as JSON lines on stderr.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API with progress events...")
+
+    finished = []
+    restored = True
+    for options in [["--chunked"], []]:
+        # create test files
+        file = open("test1.txt", 'w')
+        file.write("I'm test1.txt" * 10000)
+        file.close()
+
+        events = []
+        for arguments in [["--lock", "test1.txt", "--output", "archive"] +
+                          options, ["--unlock", "archive.lkd"]]:
+            with open("events.jsonl", 'w') as stderr:
+                call(["python", "../main/cryptical.py"] + arguments +
+                     ["--keys", "priv_key.pem", "pub_key.pem", "--progress",
+                      "json"], stderr=stderr)
+            if arguments[0] == "--lock":
+                os.remove("test1.txt")
+            with open("events.jsonl") as stderr:
+                events.extend(json.loads(line) for line in stderr
+                              if line.startswith('{'))
+        os.remove("events.jsonl")
+
+        finished.append([event['stage'] for event in events
+                         if event['done'] == event['total']])
+        restored = restored and os.path.isfile("test1.txt") and \
+            open("test1.txt").read() == "I'm test1.txt" * 10000
+
+    if finished == [['tar', 'encrypt', 'decrypt', 'extract']] * 2 and \
+            restored:
+        print("[result] Progress case successful...")
+        return True
+    else:
+        print("[result] Progress case unsuccessful...")
+        return False
+
+
+def throttled_case():
+    """Test API with resource limits.
+
+    This function test the API in a case where a 3 MB file is locked with
+    its I/O limited to 1 MB/s and a single worker, then unlocked, and where
+    a 1 MB file is locked then unlocked in a tar container with its I/O
+    limited to 1 MB/s.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API with resource limits...")
+
+    # create test files
+    file = open("test1.txt", 'w')
+    file.write(os.urandom(3 * 1024 * 1024).encode('hex')[:3 * 1024 * 1024])
+    file.close()
+    content = open("test1.txt").read()
+
+    # the tar and the encrypt stages take at least 2 s each, the first MB
+    # being a burst
+    start = time.time()
+    call(["python", "../main/cryptical.py", "--lock", "test1.txt", "--keys",
+          "priv_key.pem", "pub_key.pem", "--output", "archive", "--merkle",
+          "--max-io-rate", "1", "--max-cpu-workers", "1", "--low-priority"])
+    elapsed = time.time() - start
+
+    os.remove("test1.txt")
+
+    call(["python", "../main/cryptical.py", "--unlock", "archive.lkd",
+          "--keys", "priv_key.pem", "pub_key.pem", "--max-cpu-workers", "1"])
+
+    # the tar container reads and writes its temporary files more than
+    # twice, the first MB being a burst
+    file = open("test2.txt", 'w')
+    file.write(content[:1024 * 1024])
+    file.close()
+    tar_elapsed = []
+    for command in [["--lock", "test2.txt", "--output", "archive"],
+                    ["--unlock", "archive.lkd"]]:
+        start = time.time()
+        call(["python", "../main/cryptical.py"] + command +
+             ["--keys", "priv_key.pem", "pub_key.pem", "--max-io-rate", "1"])
+        tar_elapsed.append(time.time() - start)
+        if command[0] == "--lock":
+            os.remove("test2.txt")
+
+    if elapsed >= 4 and min(tar_elapsed) >= 2 and \
+            os.path.isfile("test1.txt") and \
+            open("test1.txt").read() == content and \
+            open("test2.txt").read() == content[:1024 * 1024]:
+        print("[result] Throttled case successful...")
+        return True
+    else:
+        print("[result] Throttled case unsuccessful...")
+        return False
+
+
+def cache_case():
+    """Test API with the verified signature cache.
+
+    This function test the API in a case where a chunked container is
+    verified twice with a cache, the second time from the cache, then
+    altered and verified again, and where a tar container is altered in
+    the middle of its payload with its mtime restored.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API with the verification cache...")
+
+    # create test files
+    file = open("test1.txt", 'w')
+    file.write("I'm test1.txt" * 100000)
+    file.close()
+
+    call(["python", "../main/cryptical.py", "--lock", "test1.txt", "--keys",
+          "priv_key.pem", "pub_key.pem", "--output", "archive", "--chunked",
+          "--chunk-size", "4096"])
+
+    if os.path.isfile("verified.json"):
+        os.remove("verified.json")
+    reports = []
+    for step in range(3):
+        if step == 2:
+            # flip one byte in the middle of the payload
+            file = open("archive.lkd", 'r+b')
+            file.seek(os.path.getsize("archive.lkd") // 2)
+            byte = file.read(1)
+            file.seek(-1, os.SEEK_CUR)
+            file.write(chr(ord(byte) ^ 1))
+            file.close()
+            os.utime("archive.lkd", (time.time() + 1, time.time() + 1))
+        call(["python", "../main/cryptical.py", "--verify", "archive.lkd",
+              "--pubkey", "pub_key.pem", "--cache", "verified.json",
+              "--report", "report.json"])
+        reports.append(json.load(open("report.json")))
+
+    # the payload of a tar container is out of the digest of the edges
+    call(["python", "../main/cryptical.py", "--lock", "test1.txt", "--keys",
+          "priv_key.pem", "pub_key.pem", "--output", "archive"])
+    for step in range(2):
+        if step == 1:
+            # flip one byte in the middle and set the mtime back, with
+            # touch as os.utime drops the nanoseconds
+            call(["touch", "-r", "archive.lkd", "mtime.ref"])
+            file = open("archive.lkd", 'r+b')
+            file.seek(os.path.getsize("archive.lkd") // 2)
+            byte = file.read(1)
+            file.seek(-1, os.SEEK_CUR)
+            file.write(chr(ord(byte) ^ 1))
+            file.close()
+            call(["touch", "-r", "mtime.ref", "archive.lkd"])
+            os.remove("mtime.ref")
+        call(["python", "../main/cryptical.py", "--verify", "archive.lkd",
+              "--pubkey", "pub_key.pem", "--cache", "verified.json",
+              "--report", "report.json"])
+        reports.append(json.load(open("report.json")))
+    os.remove("verified.json")
+
+    if [(report['valid'], report['cached']) for report in reports] == \
+            [(1, 0), (1, 1), (0, 0), (1, 0), (0, 0)]:
+        print("[result] Cache case successful...")
+        return True
+    else:
+        print("[result] Cache case unsuccessful...")
+        return False
+
+
+def startup_case():
+    """Test API startup time.
+
+    This function test that --help prints no header and imports none of the
+    crypto and tar modules, and that its median startup time stays within
+    `STARTUP_BUDGET` seconds of the startup of the interpreter.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API startup time...")
+
+    script = ("import runpy, sys\n"
+              "sys.argv = ['cryptical.py', '--help']\n"
+              "sys.path.insert(0, '../main')\n"
+              "try:\n"
+              "    runpy.run_path('../main/cryptical.py', "
+              "run_name='__main__')\n"
+              "except SystemExit:\n"
+              "    pass\n"
+              "print('loaded :' + ' '.join(name for name in %r "
+              "if name in sys.modules))" % HEAVY_MODULES)
+    output = check_output(["python", "-c", script])
+    loaded = output.rsplit('loaded :', 1)[-1].split()
+
+    timings = {'help': [], 'interpreter': []}
+    for run in range(7):
+        for name, command in [('help', ["../main/cryptical.py", "--help"]),
+                              ('interpreter', ["-c", "pass"])]:
+            start = time.time()
+            check_output(["python"] + command)
+            timings[name].append(time.time() - start)
+    overhead = sorted(timings['help'])[3] - sorted(timings['interpreter'])[3]
+    print("[info] --help starts in %.1f ms above the interpreter"
+          % (overhead * 1000))
+
+    if not loaded and "_____" not in output and overhead < STARTUP_BUDGET:
+        print("[result] Startup case successful...")
+        return True
+    else:
+        print("[result] Startup case unsuccessful...")
+        return False
+
+
+def digest_case():
+    """Test API with the SHA-512 and BLAKE2b digests.
+
+    This function test the API in a case where chunked containers are locked
+    with the SHA-512 and BLAKE2b digests of their chunks, recorded in their
+    header, then verified intact and altered.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API with the digests...")
+
+    # create test files
+    file = open("test1.txt", 'w')
+    file.write("I'm test1.txt" * 10000)
+    file.close()
+
+    valid = {}
+    for digest in ["sha512", "blake2b"]:
+        for output in [digest, digest + "_altered"]:
+            call(["python", "../main/cryptical.py", "--lock", "test1.txt",
+                  "--keys", "priv_key.pem", "pub_key.pem", "--output",
+                  output, "--chunk-size", "4096", "--digest", digest])
+
+        # flip one byte of the second archive
+        file = open(digest + "_altered.lkd", 'r+b')
+        file.seek(-1000, os.SEEK_END)
+        byte = file.read(1)
+        file.seek(-1, os.SEEK_CUR)
+        file.write(chr(ord(byte) ^ 1))
+        file.close()
+
+        with open(digest + ".lkd", 'rb') as f:
+            valid[digest] = main.container.read_header(f)[0]['integrity']
+
+        call(["python", "../main/cryptical.py", "--verify", digest + ".lkd",
+              digest + "_altered.lkd", "--pubkey", "pub_key.pem",
+              "--report", "report.json"])
+        for result in json.load(open("report.json"))['archives']:
+            valid[result['archive']] = result['valid']
+
+    if valid == {"sha512": "sha512", "sha512.lkd": True,
+                 "sha512_altered.lkd": False, "blake2b": "blake2b",
+                 "blake2b.lkd": True, "blake2b_altered.lkd": False}:
+        print("[result] Digest case successful...")
+        return True
+    else:
+        print("[result] Digest case unsuccessful...")
+        return False
+
+
+def profile_case():
+    """Test API with the profiling of the lock and the unlock.
+
+    This function test the API in a case where a chunked container is locked
+    then unlocked with --profile, and check that the pstats hold the
+    encryption and the decryption of the chunks, done by the pipeline
+    threads, and that the collapsed stacks are tagged with their stages.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API with profiling...")
+
+    # create test files
+    file = open("test1.txt", 'w')
+    file.write("I'm test1.txt" * 100000)
+    file.close()
+
+    call(["python", "../main/cryptical.py", "--lock", "test1.txt", "--keys",
+          "priv_key.pem", "pub_key.pem", "--output", "archive", "--chunked",
+          "--chunk-size", "4096", "--profile", "lock.prof"])
+    os.remove("test1.txt")
+    call(["python", "../main/cryptical.py", "--unlock", "archive.lkd",
+          "--keys", "priv_key.pem", "pub_key.pem", "--profile",
+          "unlock.prof"])
+
+    functions = set()
+    stages = set()
+    for name in ["lock", "unlock"]:
+        if not os.path.isfile(name + ".prof") or \
+                not os.path.isfile(name + ".folded"):
+            print("[result] Profile case unsuccessful, no profile...")
+            return False
+        functions.update(function for _, _, function in
+                         pstats.Stats(name + ".prof").stats)
+        for line in open(name + ".folded"):
+            stack, count = line.rsplit(' ', 1)
+            stages.add(stack.split(';')[0] + ' ' + str(int(count) > 0))
+        os.remove(name + ".prof")
+        os.remove(name + ".folded")
+
+    if {"seal_chunk", "open_chunk"} <= functions and \
+            stages == {"lock True", "unlock True"} and \
+            open("test1.txt").read() == "I'm test1.txt" * 100000:
+        print("[result] Profile case successful...")
+        return True
+    else:
+        print("[result] Profile case unsuccessful...")
+        return False
+
+
+def sparse_case():
+    """Test API with a sparse file.
+
+    This function test the API in a case where a 64 MB file holding 8 KB of
+    data is locked in a chunked container, and check that only its data is
+    stored and that its holes are recreated when it is unlocked.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API with a sparse file...")
+
+    # create a 64 MB file with data in its first and last blocks
+    size = 64 * 1024 * 1024
+    file = open("sparse.bin", 'wb')
+    file.write(b"I'm sparse.bin" * 256)
+    file.seek(size - 4096)
+    file.write(b"I'm sparse.bin" * 256)
+    file.truncate(size)
+    file.close()
+    content = open("sparse.bin", 'rb').read()
+    if main.tools.data_extents("sparse.bin") is None:
+        print("[result] Sparse case skipped, no hole on this filesystem...")
+        os.remove("sparse.bin")
+        return True
+
+    call(["python", "../main/cryptical.py", "--lock", "sparse.bin", "--keys",
+          "priv_key.pem", "pub_key.pem", "--output", "archive", "--chunked"])
+    archive_size = os.path.getsize("archive.lkd")
+    os.remove("sparse.bin")
+    call(["python", "../main/cryptical.py", "--unlock", "archive.lkd",
+          "--keys", "priv_key.pem", "pub_key.pem"])
+
+    if archive_size < 1024 * 1024 and \
+            open("sparse.bin", 'rb').read() == content and \
+            os.stat("sparse.bin").st_blocks * 512 < size:
+        print("[result] Sparse case successful...")
+        os.remove("sparse.bin")
+        return True
+    else:
+        print("[result] Sparse case unsuccessful...")
+        return False
+
+
+def rekey_case():
+    """Test API with the rekey of archives.
+
+    This function test the API in a case where a chunked and a tar container
+    are rekeyed for a new RSA key pair, and check that the chunks are left
+    untouched, that the archives are no longer signed by the old keys and
+    that they are unlocked with the new ones.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API with rekey...")
+
+    # generate the new keys apart from the current ones
+    if not os.path.isdir("rekey"):
+        os.mkdir("rekey")
+    call(["python", "../../main/cryptical.py", "--gen", "3072"],
+         cwd="rekey")
+
+    # create test files
+    file = open("test1.txt", 'w')
+    file.write("I'm test1.txt" * 100000)
+    file.close()
+
+    call(["python", "../main/cryptical.py", "--lock", "test1.txt", "--keys",
+          "priv_key.pem", "pub_key.pem", "--output", "rekey/chunked",
+          "--chunked"])
+    call(["python", "../main/cryptical.py", "--lock", "test1.txt", "--keys",
+          "priv_key.pem", "pub_key.pem", "--output", "rekey/tar"])
+    os.remove("test1.txt")
+
+    with open("rekey/chunked.lkd", 'rb') as f:
+        header, _, _, data_offset = main.container.read_header(f)
+        f.seek(data_offset)
+        chunks = f.read(main.container.payload_end(header, data_offset) -
+                        data_offset)
+
+    call(["python", "../../main/cryptical.py", "--rekey", "chunked.lkd",
+          "tar.lkd", "--keys", "../priv_key.pem", "../pub_key.pem",
+          "--new-keys", "priv_key.pem", "pub_key.pem", "--report",
+          "report.json"], cwd="rekey")
+    report = json.load(open("rekey/report.json"))
+
+    with open("rekey/chunked.lkd", 'rb') as f:
+        f.seek(data_offset)
+        untouched = f.read(len(chunks)) == chunks
+
+    old = main.locker.verify_many(["rekey/chunked.lkd", "rekey/tar.lkd"],
+                                  "pub_key.pem")
+    restored = True
+    for name in ["chunked.lkd", "tar.lkd"]:
+        call(["python", "../../main/cryptical.py", "--unlock", name,
+              "--keys", "priv_key.pem", "pub_key.pem"], cwd="rekey")
+        restored = restored and os.path.isfile("rekey/test1.txt") and \
+            open("rekey/test1.txt").read() == "I'm test1.txt" * 100000
+        if os.path.isfile("rekey/test1.txt"):
+            os.remove("rekey/test1.txt")
+
+    if report['rekeyed'] == 2 and untouched and old['valid'] == 0 and \
+            restored:
+        print("[result] Rekey case successful...")
+        return True
+    else:
+        print("[result] Rekey case unsuccessful...")
+        return False
+
+
+def rekey_boundary_case():
+    """Test API with the rekey of archives whose header ends near a 4096
+    bytes boundary.
+
+    This function test the API in a case where chunked containers of 1 to
+    40 files are locked with an RSA-2048 key pair, so that their header
+    ends on both sides of a multiple of 4096 bytes, then rekeyed for a
+    larger RSA-4096 key pair.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API with rekey near the header boundary...")
+
+    current = main.backend.get_backend()
+    old_key = current.rsa_generate(2048)
+    new_key = current.rsa_generate(4096)
+    keys = (old_key, main.keypair.public_key(old_key), new_key,
+            main.keypair.public_key(new_key))
+
+    names = []
+    failed = []
+    for count in range(1, 41):
+        # create test files
+        names.append("test%d.txt" % count)
+        file = open(names[-1], 'w')
+        file.write("I'm %s" % names[-1])
+        file.close()
+
+        main.locker.lock_files(names, keys[0], keys[1], "boundary",
+                               chunked=True)
+        result = main.locker._rekey_archive(("boundary.lkd",) + keys)
+        if not result['rekeyed'] or \
+                not main.locker._verify_archive(("boundary.lkd",
+                                                 keys[3]))['valid']:
+            failed.append(count)
+        os.remove("boundary.lkd")
+
+    for name in names:
+        os.remove(name)
+
+    if not failed:
+        print("[result] Rekey boundary case successful...")
+        return True
+    else:
+        print("[result] Rekey boundary case unsuccessful with %s files..."
+              % failed)
+        return False
+
+
+def random_access_case():
+    """Test API with random reads in a locked archive.
+
+    This function test the API in a case where a file is read at several
+    offsets through a LockedArchive, without unlocking the archive, and
+    check that only the chunks covering the reads are decrypted.
+
+    :return: A boolean, True if the test passed and False if the test failed.
+    """
+
+    print("[testing] Testing API with random access...")
+
+    # create test files
+    content = os.urandom(1024 * 1024)
+    file = open("test1.bin", 'wb')
+    file.write(content)
+    file.close()
+
+    call(["python", "../main/cryptical.py", "--lock", "test1.bin", "--keys",
+          "priv_key.pem", "pub_key.pem", "--output", "archive", "--chunked",
+          "--chunk-size", "4096"])
+    os.remove("test1.bin")
+
+    # count the chunks decrypted
+    decrypted = []
+    open_chunk = main.container.open_chunk
+
+    def counted(header, keys, seq, record, offset):
+        decrypted.append(seq)
+        return open_chunk(header, keys, seq, record, offset)
+
+    main.container.open_chunk = counted
+    try:
+        archive = main.locker.LockedArchive("archive.lkd", "priv_key.pem",
+                                            "pub_key.pem")
+        member = archive.open("test1.bin")
+        valid = archive.names() == ["test1.bin"]
+        for offset in [0, 500000, 4095, len(content) - 100]:
+            member.seek(offset)
+            valid = valid and \
+                member.read(100) == content[offset:offset + 100]
+        member.seek(-10, os.SEEK_END)
+        valid = valid and member.read() == content[-10:]
+        archive.close()
+    finally:
+        main.container.open_chunk = open_chunk
+    os.remove("archive.lkd")
+
+    # the tar header, the three ranges and the end of the file
+    if valid and len(decrypted) <= 6:
+        print("[result] Random access case successful...")
+        return True
+    else:
+        print("[result] Random access case unsuccessful...")
+        return False
+
+
 if __name__ == "__main__":
 
     results = []
@@ -255,6 +1396,90 @@ if __name__ == "__main__":
         results.append("OK")
     else:
         results.append("NOK")
+    if chunked_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if unlock_corrupted_chunk():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if list_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if verify_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if ecc_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if merkle_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if memory_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if packed_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if volumes_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if progress_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if throttled_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if cache_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if startup_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if digest_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if profile_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if sparse_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if rekey_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if rekey_boundary_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if random_access_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if list_tree_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
+    if resume_case():
+        results.append("OK")
+    else:
+        results.append("NOK")
 
     print("\nResults summary --------------------------")
     print("-> Test Case 1 : Key generation  \t| %s |" % results[0])
@@ -262,6 +1487,27 @@ if __name__ == "__main__":
     print("-> Test Case 3 : Wrong key  \t\t| %s |" % results[2])
     print("-> Test Case 4 : Big file  \t\t\t| %s |" % results[3])
     print("-> Test Case 5 : Altered archive \t| %s |" % results[4])
+    print("-> Test Case 6 : Chunked case  \t\t| %s |" % results[5])
+    print("-> Test Case 7 : Corrupted chunk \t| %s |" % results[6])
+    print("-> Test Case 8 : List case  \t\t| %s |" % results[7])
+    print("-> Test Case 9 : Verify case  \t\t| %s |" % results[8])
+    print("-> Test Case 10 : ECC case  \t\t| %s |" % results[9])
+    print("-> Test Case 11 : Merkle case  \t\t| %s |" % results[10])
+    print("-> Test Case 12 : Memory case  \t\t| %s |" % results[11])
+    print("-> Test Case 13 : Packed case  \t\t| %s |" % results[12])
+    print("-> Test Case 14 : Volumes case  \t\t| %s |" % results[13])
+    print("-> Test Case 15 : Progress case  \t\t| %s |" % results[14])
+    print("-> Test Case 16 : Throttled case  \t\t| %s |" % results[15])
+    print("-> Test Case 17 : Cache case  \t\t| %s |" % results[16])
+    print("-> Test Case 18 : Startup case  \t\t| %s |" % results[17])
+    print("-> Test Case 19 : Digest case  \t\t| %s |" % results[18])
+    print("-> Test Case 20 : Profile case  \t\t| %s |" % results[19])
+    print("-> Test Case 21 : Sparse case  \t\t| %s |" % results[20])
+    print("-> Test Case 22 : Rekey case  \t\t| %s |" % results[21])
+    print("-> Test Case 23 : Rekey boundary case  \t| %s |" % results[22])
+    print("-> Test Case 24 : Random access case  \t| %s |" % results[23])
+    print("-> Test Case 25 : List tree case  \t\t| %s |" % results[24])
+    print("-> Test Case 26 : Resume case  \t\t| %s |" % results[25])
     print("------------------------------------------")
 
 
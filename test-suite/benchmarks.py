@@ -0,0 +1,712 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2016 Hakan Kuesne && Mathieu Devaud
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" This module provides API benchmarking methods.
+
+Run all the benchmarks or only the ones given as arguments :
+
+    python benchmarks.py [backends ...]
+"""
+
+import ctypes
+import ctypes.util
+import hashlib
+import mmap
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'main'))
+
+import aes
+import backend
+import container
+import keypair
+import locker
+import merkle
+import pagecache
+import rsa
+import tools
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                    'main')
+MB = 1024 * 1024
+
+
+def _rate(size, elapsed):
+    """Return a throughput in MB/s."""
+
+    return size / float(MB) / max(elapsed, 1e-9)
+
+
+def backends(size=64 * MB, signatures=20):
+    """Benchmark the cryptographic backends.
+
+    This function measure the AES-CTR and AES-CBC throughput and the
+    RSA-PSS signature and verification rate of every installed backend, and
+    check that they produce the same ciphertext.
+
+    :parameter:
+     size : int
+        The size in bytes of the data to encrypt.
+     signatures : int
+        The number of signatures to perform.
+
+    :return: A dict, the measures of each backend.
+    """
+
+    print("[benchmark] Crypto backends with %d MB..." % (size // MB))
+
+    key = aes.gen_aes_key(32)
+    nonce = aes.gen_iv(8)
+    iv = aes.gen_iv(16)
+    data = os.urandom(size)
+    pem = None
+    results = {}
+    ciphertexts = set()
+
+    for name, _ in backend.BACKENDS:
+        try:
+            current = backend.select_backend(name)
+        except ImportError:
+            print("[result] %s backend not installed, skipped" % name)
+            continue
+
+        if pem is None:
+            pem = current.rsa_export(current.rsa_generate(3072))
+        priv_key = current.rsa_import(pem)
+        pub_key = current.rsa_public(priv_key)
+
+        start = time.time()
+        ciphertexts.add(current.aes_ctr(key, nonce, 0, data))
+        ctr = _rate(size, time.time() - start)
+
+        start = time.time()
+        current.aes_cbc_encrypt(key, iv, data)
+        cbc = _rate(size, time.time() - start)
+
+        start = time.time()
+        for _ in range(signatures):
+            signature = rsa.rsa_sign(priv_key, data[:1024])
+        sign = signatures / (time.time() - start)
+
+        start = time.time()
+        for _ in range(signatures):
+            rsa.rsa_verify_sign(pub_key, signature, data[:1024])
+        verify = signatures / (time.time() - start)
+
+        results[name] = {'aes_ctr_mb_per_s': ctr, 'aes_cbc_mb_per_s': cbc,
+                         'rsa_sign_per_s': sign, 'rsa_verify_per_s': verify}
+        print("[result] %-8s AES-CTR %8.1f MB/s | AES-CBC %8.1f MB/s | "
+              "RSA-PSS sign %6.1f/s verify %7.1f/s"
+              % (name, ctr, cbc, sign, verify))
+
+    print("[result] Identical ciphertext across backends : %s"
+          % (len(ciphertexts) == 1))
+
+    return results
+
+
+def key_types(archives=100):
+    """Benchmark the per archive cost of RSA and ECC keys.
+
+    This function measure the key generation time, then the time and the
+    bytes spent to encrypt a session key and sign a header for `archives`
+    archives with RSA 4096 and with Ed25519 and X25519.
+
+    :parameter:
+     archives : int
+        The number of archives to simulate.
+
+    :return: A dict, the measures of each key type.
+    """
+
+    print("[benchmark] Key types with %d archives..." % archives)
+
+    current = backend.get_backend()
+    session_keys = aes.gen_aes_key(32) * 2
+    header = os.urandom(512)
+    results = {}
+
+    for name in ['RSA 4096', 'ECC 25519']:
+        start = time.time()
+        if name == 'RSA 4096':
+            priv_key = current.rsa_generate(4096)
+        else:
+            priv_key = {'sign': current.ec_generate('ed25519'),
+                        'kem': current.ec_generate('x25519')}
+        keygen = time.time() - start
+        pub_key = keypair.public_key(priv_key)
+
+        start = time.time()
+        for _ in range(archives):
+            wrapped = keypair.encrypt_key(pub_key, session_keys)
+            signature = keypair.sign(priv_key, header)
+        lock = (time.time() - start) / archives
+
+        start = time.time()
+        for _ in range(archives):
+            keypair.decrypt_key(priv_key, keypair.kem_algorithm(priv_key),
+                                wrapped)
+            keypair.verify_sign(pub_key, keypair.sign_algorithm(priv_key),
+                                signature, header)
+        unlock = (time.time() - start) / archives
+
+        results[name] = {'keygen_s': keygen, 'lock_ms': lock * 1000,
+                         'unlock_ms': unlock * 1000,
+                         'bytes': len(wrapped) + len(signature)}
+        print("[result] %-9s keygen %7.3f s | wrap+sign %7.2f ms | "
+              "unwrap+verify %7.2f ms | %4d bytes per archive"
+              % (name, keygen, lock * 1000, unlock * 1000,
+                 len(wrapped) + len(signature)))
+
+    return results
+
+
+def merkle_tree(size=512 * MB, leaf_size=MB):
+    """Benchmark the verification of the chunks with a Merkle tree.
+
+    This function hash a file of `size` bytes once with a single SHA256, as
+    a SHA256 container is verified, then as the leaves of a Merkle tree on
+    every core, as a Merkle container is verified.
+
+    :parameter:
+     size : int
+        The size in bytes of the file to hash.
+     leaf_size : int
+        The size in bytes of the leaves.
+
+    :return: A dict, the throughput of each mode.
+    """
+
+    print("[benchmark] Merkle tree with %d MB..." % (size // MB))
+
+    handle, path = tempfile.mkstemp()
+    with os.fdopen(handle, 'wb') as f:
+        for _ in range(size // MB):
+            f.write(os.urandom(MB))
+
+    try:
+        start = time.time()
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for data in iter(lambda: f.read(MB), b''):
+                digest.update(data)
+        linear = _rate(size, time.time() - start)
+
+        start = time.time()
+        merkle.root(merkle.hash_leaves(
+            path, [(offset, leaf_size)
+                   for offset in range(0, size, leaf_size)]))
+        tree = _rate(size, time.time() - start)
+    finally:
+        os.remove(path)
+
+    print("[result] SHA256 %8.1f MB/s | Merkle tree %8.1f MB/s on %d cores"
+          % (linear, tree, multiprocessing.cpu_count()))
+
+    return {'sha256_mb_per_s': linear, 'merkle_mb_per_s': tree}
+
+
+def digests(size=256 * MB, buffer_size=4 * MB):
+    """Benchmark the digests signed in the trailer of a chunked container.
+
+    This function measure the throughput of each digest of
+    `container.DIGESTS` alone, then lock a file of `size` bytes with it and
+    verify the signature of the container, which hashes all its chunks.
+
+    :parameter:
+     size : int
+        The size in bytes of the file to lock.
+     buffer_size : int
+        The size in bytes of the buffers hashed.
+
+    :return: A dict, the throughput of each digest.
+    """
+
+    print("[benchmark] Digests with %d MB..." % (size // MB))
+
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        data = os.urandom(buffer_size)
+        with open('bench.bin', 'wb') as f:
+            for _ in range(size // buffer_size):
+                f.write(data)
+
+        priv_key = backend.get_backend().rsa_generate(3072)
+        pub_key = keypair.public_key(priv_key)
+        results = {}
+        for name in container.DIGESTS:
+            try:
+                digest = container.new_digest(name)
+            except AttributeError as e:
+                print("[result] %-7s not available, %s" % (name, e))
+                continue
+
+            start = time.time()
+            for _ in range(size // buffer_size):
+                digest.update(data)
+            digest.hexdigest()
+            alone = _rate(size, time.time() - start)
+
+            start = time.time()
+            locker.lock_files(['bench.bin'], priv_key, pub_key, 'bench',
+                              chunked=True, digest=name)
+            lock = _rate(size, time.time() - start)
+
+            start = time.time()
+            valid = locker._verify_archive(('bench.lkd', pub_key))['valid']
+            verify = _rate(size, time.time() - start)
+            os.remove('bench.lkd')
+
+            results[name] = {'hash_mb_per_s': alone, 'lock_mb_per_s': lock,
+                             'verify_mb_per_s': verify, 'valid': valid}
+            print("[result] %-7s hash %8.1f MB/s | lock %8.1f MB/s | "
+                  "verify %8.1f MB/s%s" % (name, alone, lock, verify,
+                                           '' if valid else ' (invalid)'))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    return results
+
+
+def pipeline(size=256 * MB, depths=(0, 2, 4, 8)):
+    """Benchmark the pipelined lock and unlock of a chunked container.
+
+    This function measure the read throughput of the disk and the
+    throughput of the chunk encryption alone, then lock and unlock a file of
+    `size` bytes with each queue depth, 0 running the stages serially.
+
+    :parameter:
+     size : int
+        The size in bytes of the file to lock.
+     depths : tuple
+        The queue depths to measure.
+
+    :return: A dict, the throughput of the disk, the cipher and each depth.
+    """
+
+    print("[benchmark] Pipeline with %d MB..." % (size // MB))
+
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with open('bench.bin', 'wb') as f:
+            for _ in range(size // MB):
+                f.write(os.urandom(MB))
+
+        start = time.time()
+        with open('bench.bin', 'rb') as f:
+            while f.read(4 * MB):
+                pass
+        disk = _rate(size, time.time() - start)
+
+        keys = (aes.gen_aes_key(32), aes.gen_aes_key(32))
+        header = container.new_header('', aes.gen_iv(8), 64 * MB)
+        data = os.urandom(container.CHUNK_SIZE)
+        start = time.time()
+        for seq in range(64):
+            container.seal_chunk(header, keys, seq, data)
+        cipher = _rate(64 * MB, time.time() - start)
+
+        priv_key = backend.get_backend().rsa_generate(3072)
+        pub_key = keypair.public_key(priv_key)
+        results = {'disk_mb_per_s': disk, 'cipher_mb_per_s': cipher}
+        for depth in depths:
+            start = time.time()
+            locker.lock_files(['bench.bin'], priv_key, pub_key, 'bench',
+                              chunked=True, queue_depth=depth)
+            lock = _rate(size, time.time() - start)
+
+            start = time.time()
+            locker.unlock_file('bench.lkd', priv_key, pub_key,
+                               queue_depth=depth)
+            unlock = _rate(size, time.time() - start)
+            results[depth] = {'lock_mb_per_s': lock,
+                              'unlock_mb_per_s': unlock}
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    print("[result] Disk read %8.1f MB/s | Chunk encryption %8.1f MB/s"
+          % (disk, cipher))
+    for depth in depths:
+        print("[result] Queue depth %d : lock %8.1f MB/s | unlock %8.1f MB/s"
+              % (depth, results[depth]['lock_mb_per_s'],
+                 results[depth]['unlock_mb_per_s']))
+
+    return results
+
+
+def packing(files=10000, size=1024):
+    """Benchmark the packed payload against the tar for small files.
+
+    This function put `files` files of `size` bytes in a tar and in a
+    packed payload, then extract both, and compare the time and the size of
+    the payloads.
+
+    :parameter:
+     files : int
+        The number of files.
+     size : int
+        The size in bytes of each file.
+
+    :return: A dict, the measures of each format.
+    """
+
+    print("[benchmark] Packing %d files of %d bytes..." % (files, size))
+
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        os.mkdir('files')
+        for i in range(files):
+            with open(os.path.join('files', '%07d.json' % i), 'wb') as f:
+                f.write(os.urandom(size))
+        names = [os.path.join('files', name)
+                 for name in sorted(os.listdir('files'))]
+        results = {}
+
+        for name in ['tar', 'packed']:
+            start = time.time()
+            if name == 'tar':
+                tools.tarfiles(names, 'payload')
+            else:
+                tools.packfiles(names, 'payload')
+            build = time.time() - start
+            payload_size = os.path.getsize('payload')
+
+            os.mkdir(name)
+            start = time.time()
+            if name == 'tar':
+                tar = tarfile.open('payload')
+                tar.extractall(name)
+                tar.close()
+            else:
+                tools.unpackfiles('payload', name)
+            extract = time.time() - start
+            os.remove('payload')
+
+            results[name] = {'build_s': build, 'extract_s': extract,
+                             'bytes': payload_size}
+            print("[result] %-6s build %7.3f s | extract %7.3f s | "
+                  "%10d bytes, %5.1f %% overhead"
+                  % (name, build, extract, payload_size,
+                     100.0 * (payload_size - files * size) / (files * size)))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    return results
+
+
+def _cached_mb():
+    """Return the size of the page cache in MB, from /proc/meminfo."""
+
+    with open('/proc/meminfo') as meminfo:
+        for line in meminfo:
+            if line.startswith('Cached:'):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+def _residency(path):
+    """Return the percentage of the pages of a file in the page cache."""
+
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    size = os.path.getsize(path)
+    pages = -(-size // mmap.PAGESIZE)
+    with open(path, 'rb') as f:
+        # A private map is writable, so that its address can be taken
+        mapped = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_COPY)
+    try:
+        array = (ctypes.c_char * size).from_buffer(mapped)
+        vector = (ctypes.c_ubyte * pages)()
+        libc.mincore(ctypes.c_void_p(ctypes.addressof(array)),
+                     ctypes.c_size_t(size), vector)
+        del array
+    finally:
+        mapped.close()
+
+    return 100.0 * sum(page & 1 for page in vector) / pages
+
+
+def _evict(path):
+    """Flush a file and drop it from the page cache."""
+
+    with open(path, 'rb') as f:
+        os.fdatasync(f.fileno())
+        pagecache.fadvise(f, 0, 0, pagecache.POSIX_FADV_DONTNEED)
+
+
+def page_cache(size=256 * MB, hot_size=64 * MB):
+    """Benchmark the I/O modes of a chunked container.
+
+    This function read a hot file standing for a co-located workload, then
+    lock and unlock a cold file of `size` bytes in each I/O mode, and
+    measure the throughput and the growth of the page cache of each step,
+    the part of the payload and of the container left in the cache by the
+    lock, and the part of the hot file still cached at the end. Linux only.
+
+    :parameter:
+     size : int
+        The size in bytes of the file to lock.
+     hot_size : int
+        The size in bytes of the hot file.
+
+    :return: A dict, the measures of each mode.
+    """
+
+    print("[benchmark] Page cache with %d MB..." % (size // MB))
+
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with open('hot.bin', 'wb') as f:
+            for _ in range(hot_size // MB):
+                f.write(os.urandom(MB))
+
+        priv_key = backend.get_backend().rsa_generate(3072)
+        pub_key = keypair.public_key(priv_key)
+        results = {}
+        for mode in pagecache.MODES:
+            with open('bench.bin', 'wb') as f:
+                for _ in range(size // MB):
+                    f.write(os.urandom(MB))
+            _evict('bench.bin')
+            with open('hot.bin', 'rb') as f:
+                while f.read(4 * MB):
+                    pass
+            cached = _cached_mb()
+
+            start = time.time()
+            locker.lock_files(['bench.bin'], priv_key, pub_key, 'bench',
+                              chunked=True, io_mode=mode)
+            lock = _rate(size, time.time() - start)
+            lock_growth = _cached_mb() - cached
+            payload = _residency('bench.bin')
+            archive = _residency('bench.lkd')
+            os.remove('bench.bin')
+
+            cached = _cached_mb()
+            start = time.time()
+            locker.unlock_file('bench.lkd', priv_key, pub_key,
+                               io_mode=mode)
+            unlock = _rate(size, time.time() - start)
+            unlock_growth = _cached_mb() - cached
+            os.remove('bench.bin')
+
+            results[mode] = {'lock_mb_per_s': lock,
+                             'unlock_mb_per_s': unlock,
+                             'lock_cache_growth_mb': lock_growth,
+                             'unlock_cache_growth_mb': unlock_growth,
+                             'payload_cached_pct': payload,
+                             'archive_cached_pct': archive,
+                             'hot_cached_pct': _residency('hot.bin')}
+            print("[result] %-7s lock %6.1f MB/s, cache %+7.1f MB | unlock "
+                  "%6.1f MB/s, cache %+7.1f MB | left cached : payload "
+                  "%5.1f %%, container %5.1f %%, hot file %5.1f %%"
+                  % (mode, lock, lock_growth, unlock, unlock_growth,
+                     payload, archive, results[mode]['hot_cached_pct']))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    return results
+
+
+def random_access(size=256 * MB, reads=1000, read_size=4096,
+                  chunk_sizes=(64 * 1024, MB)):
+    """Benchmark the random reads of a file in a locked archive.
+
+    This function lock a file of `size` bytes in a chunked container for
+    each chunk size, then read `reads` ranges of `read_size` bytes at
+    random offsets through a `locker.LockedArchive`, and compare with the
+    time to unlock the whole container.
+
+    :parameter:
+     size : int
+        The size in bytes of the file to lock.
+     reads : int
+        The number of random reads.
+     read_size : int
+        The size in bytes of a read.
+     chunk_sizes : tuple
+        The chunk sizes of the containers.
+
+    :return: A dict, the times of each chunk size.
+    """
+
+    print("[benchmark] Random access with %d MB..." % (size // MB))
+
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        data = os.urandom(MB)
+        with open('bench.bin', 'wb') as f:
+            for _ in range(size // MB):
+                f.write(data)
+
+        priv_key = backend.get_backend().rsa_generate(3072)
+        pub_key = keypair.public_key(priv_key)
+        offsets = [random.randrange(size - read_size) for _ in range(reads)]
+        results = {}
+        for chunk_size in chunk_sizes:
+            locker.lock_files(['bench.bin'], priv_key, pub_key, 'bench',
+                              chunked=True, chunk_size=chunk_size)
+
+            start = time.time()
+            archive = locker.LockedArchive('bench.lkd', priv_key, pub_key)
+            member = archive.open('bench.bin')
+            opened = time.time() - start
+
+            start = time.time()
+            for offset in offsets:
+                member.seek(offset)
+                member.read(read_size)
+            per_read = (time.time() - start) / reads
+            archive.close()
+
+            os.rename('bench.bin', 'bench.bin.orig')
+            start = time.time()
+            locker.unlock_file('bench.lkd', priv_key, pub_key)
+            unlock = time.time() - start
+            os.rename('bench.bin.orig', 'bench.bin')
+
+            results[chunk_size] = {'open_s': opened, 'read_s': per_read,
+                                   'unlock_s': unlock}
+            print("[result] %7d B chunks | open %7.3f s | %d B read "
+                  "%8.3f ms | unlock %7.3f s" % (chunk_size, opened,
+                                                 read_size, per_read * 1000,
+                                                 unlock))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    return results
+
+
+def _median_run(command, runs):
+    """Return the median wall time in seconds of a command."""
+
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.call(command, cwd=MAIN, stdout=devnull,
+                            stderr=devnull)
+            times.append(time.time() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def _import_time(module, runs):
+    """Return the cumulative import time in seconds of a module.
+
+    The time is read from `-X importtime` where the interpreter supports it,
+    else measured around the import in a fresh interpreter.
+    """
+
+    times = []
+    for _ in range(runs):
+        if sys.version_info >= (3, 7):
+            output = subprocess.Popen(
+                [sys.executable, '-X', 'importtime', '-c',
+                 'import %s' % module], cwd=MAIN,
+                stderr=subprocess.PIPE).communicate()[1]
+            for line in output.decode().splitlines():
+                fields = [field.strip() for field in line.split('|')]
+                if len(fields) == 3 and fields[2] == module:
+                    times.append(int(fields[1]) / 1e6)
+        else:
+            output = subprocess.check_output(
+                [sys.executable, '-c', 'import time\nstart = time.time()\n'
+                 'import %s\nprint(time.time() - start)' % module], cwd=MAIN)
+            times.append(float(output))
+    return sorted(times)[len(times) // 2] if times else 0.0
+
+
+def startup(runs=15, modules=('argparse', 'backend', 'progress', 'rsa',
+                              'ecc', 'tarfile', 'multiprocessing',
+                              'locker')):
+    """Benchmark the startup time of the CLI.
+
+    This function measure the median wall time of `cryptical.py --help`
+    against the startup of the interpreter, and the import time of the
+    modules loaded by the commands.
+
+    :parameter:
+     runs : int
+        The number of runs of each measure.
+     modules : list
+        The names of the modules to import.
+
+    :return: A dict, the times in seconds.
+    """
+
+    print("[benchmark] Startup time over %d runs..." % runs)
+
+    results = {'interpreter_s': _median_run([sys.executable, '-c', 'pass'],
+                                            runs),
+               'help_s': _median_run([sys.executable, 'cryptical.py',
+                                      '--help'], runs),
+               'imports_s': {}}
+    print("[result] interpreter %7.1f ms | --help %7.1f ms"
+          % (results['interpreter_s'] * 1000, results['help_s'] * 1000))
+
+    for module in modules:
+        elapsed = _import_time(module, runs)
+        results['imports_s'][module] = elapsed
+        print("[result] import %-16s %7.1f ms" % (module, elapsed * 1000))
+
+    return results
+
+
+BENCHMARKS = [('backends', backends), ('key_types', key_types),
+              ('merkle_tree', merkle_tree), ('digests', digests),
+              ('pipeline', pipeline), ('packing', packing),
+              ('page_cache', page_cache), ('random_access', random_access),
+              ('startup', startup)]
+
+
+if __name__ == "__main__":
+
+    selected = sys.argv[1:] or [name for name, _ in BENCHMARKS]
+
+    for name, benchmark in BENCHMARKS:
+        if name in selected:
+            benchmark()
+
+
+__author__ = 'Hakan Kuesne and Mathieu Devaud'
+__since__ = '2016-05-01'
+__date__ = '2016-05-16'
+__version__ = '1.0'
+__email__ = 'hakan@kusne.ch;mathieu.devaud@hefr.ch'
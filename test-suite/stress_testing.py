@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2016 Hakan Kuesne && Mathieu Devaud
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" This module provides API stress testing methods.
+
+Every case generates a synthetic payload, locks and unlocks it in-process
+with `locker.lock_files` and `locker.unlock_file`, then compares the hashes
+of the unlocked files with the original ones. Each case runs in its own
+child process, so that its peak RSS is measured alone. Run the cases of a
+size tier, all of them or only the ones given as arguments :
+
+    python stress_testing.py [small|medium|large] [sparse random ...]
+
+The payloads are written in a temporary directory, which needs about three
+times the size of the payload : the files, the container and the temporary
+tar.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'main'))
+
+import backend
+import keypair
+import locker
+
+MB = 1024 * 1024
+GB = 1024 * MB
+
+# Payload sizes of each tier
+TIERS = {'small': {'sparse': 256 * MB, 'random': 64 * MB, 'tree': 1000},
+         'medium': {'sparse': 2 * GB, 'random': 512 * MB, 'tree': 10000},
+         'large': {'sparse': 8 * GB, 'random': 4 * GB, 'tree': 100000}}
+
+
+def _hash_file(path):
+    """Return the SHA256 of a file, read by blocks."""
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(MB), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def _hash_tree(path):
+    """Return the SHA256 of the relative names and contents of a tree."""
+
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            filename = os.path.join(root, name)
+            digest.update(os.path.relpath(filename, path) + b'\0')
+            digest.update(_hash_file(filename))
+    return digest.hexdigest()
+
+
+def _round_trip(files, keys, **options):
+    """Lock then unlock files, return the lock and unlock times."""
+
+    start = time.time()
+    locker.lock_files(files, keys[0], keys[1], 'stress', chunked=True,
+                      **options)
+    lock = time.time() - start
+
+    for name in files:
+        if os.path.isdir(name):
+            shutil.rmtree(name)
+        else:
+            os.remove(name)
+
+    start = time.time()
+    locker.unlock_file('stress.lkd', keys[0], keys[1])
+    unlock = time.time() - start
+
+    return lock, unlock
+
+
+def sparse_case(size, keys):
+    """Test a sparse file of `size` bytes with a few random blocks.
+
+    :return: A dict with the payload size, the lock and unlock times and a
+    boolean, True if the unlocked file has the same hash.
+    """
+
+    with open('sparse.bin', 'wb') as f:
+        f.truncate(size)
+        for offset in range(0, size, max(MB, size // 16)):
+            f.seek(offset)
+            f.write(os.urandom(4096))
+    expected = _hash_file('sparse.bin')
+
+    lock, unlock = _round_trip(['sparse.bin'], keys)
+
+    return {'bytes': size, 'lock_s': lock, 'unlock_s': unlock,
+            'valid': os.path.isfile('sparse.bin') and
+            _hash_file('sparse.bin') == expected}
+
+
+def random_case(size, keys):
+    """Test an incompressible file of `size` random bytes.
+
+    :return: A dict with the payload size, the lock and unlock times and a
+    boolean, True if the unlocked file has the same hash.
+    """
+
+    with open('random.bin', 'wb') as f:
+        for _ in range(size // MB):
+            f.write(os.urandom(MB))
+    expected = _hash_file('random.bin')
+
+    lock, unlock = _round_trip(['random.bin'], keys, merkle=True)
+
+    return {'bytes': size, 'lock_s': lock, 'unlock_s': unlock,
+            'valid': os.path.isfile('random.bin') and
+            _hash_file('random.bin') == expected}
+
+
+def _make_tree(count):
+    """Create a tree of `count` small files, 1000 per directory."""
+
+    size = 0
+    for i in range(count):
+        directory = os.path.join('tree', '%04d' % (i // 1000))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(os.path.join(directory, '%07d.json' % i), 'wb') as f:
+            data = json.dumps({'id': i, 'data': os.urandom(i % 1024)
+                               .encode('hex')})
+            f.write(data)
+            size += len(data)
+    return size
+
+
+def tree_case(count, keys):
+    """Test a tree of `count` small files in a tar.
+
+    :return: A dict with the payload size, the lock and unlock times and a
+    boolean, True if the unlocked tree has the same hash.
+    """
+
+    size = _make_tree(count)
+    expected = _hash_tree('tree')
+
+    lock, unlock = _round_trip(['tree'], keys)
+
+    return {'bytes': size, 'lock_s': lock, 'unlock_s': unlock,
+            'valid': os.path.isdir('tree') and _hash_tree('tree') == expected}
+
+
+def packed_tree_case(count, keys):
+    """Test a tree of `count` small files in a packed payload.
+
+    :return: A dict with the payload size, the lock and unlock times and a
+    boolean, True if the unlocked tree has the same hash.
+    """
+
+    size = _make_tree(count)
+    expected = _hash_tree('tree')
+
+    lock, unlock = _round_trip(['tree'], keys, packed=True)
+
+    return {'bytes': size, 'lock_s': lock, 'unlock_s': unlock,
+            'valid': os.path.isdir('tree') and _hash_tree('tree') == expected}
+
+
+CASES = [('sparse', sparse_case, 'sparse'),
+         ('random', random_case, 'random'),
+         ('tree', tree_case, 'tree'),
+         ('packed_tree', packed_tree_case, 'tree')]
+
+
+def run_case(case, size, keys):
+    """Run a case in a child process in a temporary directory.
+
+    :return: A dict, the result of the case with its peak RSS in MB, or
+    with an error if the case raised an exception.
+    """
+
+    workdir = tempfile.mkdtemp()
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        try:
+            os.chdir(workdir)
+            result = case(size, keys)
+        except BaseException:
+            result = {'valid': False, 'error': traceback.format_exc()}
+        with os.fdopen(write_end, 'w') as pipe:
+            json.dump(result, pipe)
+        os._exit(0)
+
+    os.close(write_end)
+    with os.fdopen(read_end) as pipe:
+        output = pipe.read()
+    _, _, rusage = os.wait4(pid, 0)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    result = json.loads(output) if output else \
+        {'valid': False, 'error': 'The case process died.'}
+    # ru_maxrss is in KB on Linux
+    result['peak_rss_mb'] = rusage.ru_maxrss / 1024.0
+
+    return result
+
+
+if __name__ == "__main__":
+
+    arguments = sys.argv[1:]
+    tier = arguments.pop(0) if arguments and arguments[0] in TIERS \
+        else 'small'
+    selected = arguments or [name for name, _, _ in CASES]
+
+    print("[info] Generating the RSA key pair...")
+    current = backend.get_backend()
+    private_key = current.rsa_generate(3072)
+    keys = (private_key, keypair.public_key(private_key))
+
+    results = []
+    for name, case, parameter in CASES:
+        if name not in selected:
+            continue
+        print("[testing] Testing %s case, %s tier..." % (name, tier))
+        result = run_case(case, TIERS[tier][parameter], keys)
+        results.append((name, result))
+        if 'error' in result:
+            print(result['error'])
+
+    print("\nResults summary, %s tier -------------------------------------"
+          "-----" % tier)
+    for name, result in results:
+        if 'error' in result:
+            print("-> %-12s | NOK | %s" % (name, result['error']
+                                           .strip().splitlines()[-1]))
+            continue
+        print("-> %-12s | %s | %8.1f MB | lock %7.1f MB/s | unlock %7.1f "
+              "MB/s | peak RSS %7.1f MB"
+              % (name, "OK " if result['valid'] else "NOK",
+                 result['bytes'] / float(MB),
+                 result['bytes'] / float(MB) / max(result['lock_s'], 1e-9),
+                 result['bytes'] / float(MB) / max(result['unlock_s'], 1e-9),
+                 result['peak_rss_mb']))
+    print("----------------------------------------------------------------"
+          "-----")
+
+
+__author__ = 'Hakan Kuesne and Mathieu Devaud'
+__since__ = '2016-05-01'
+__date__ = '2016-05-16'
+__version__ = '1.0'
+__email__ = 'hakan@kusne.ch;mathieu.devaud@hefr.ch'